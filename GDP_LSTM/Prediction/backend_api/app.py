@@ -1,7 +1,7 @@
 # app.py - Flask 应用主文件和路由定义
 
 import warnings
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 import json
 import numpy as np
@@ -10,7 +10,7 @@ import os
 import sys
 
 # 导入配置和工具
-from config import MYSQL_URI
+from config import MYSQL_URI, PRELOAD_IN_BACKGROUND
 from db_utils import db, reflect_tables, list_tables_route, list_data_route, one_data_route
 from coupling_analysis import analyzer
 import spatial_analysis
@@ -24,11 +24,11 @@ if prediction_dir not in sys.path:
     sys.path.insert(0, prediction_dir)
 
 try:
-    from data_setup import create_dataset
+    from data_setup import load_panel
 except ImportError as e:
     print(f"无法导入模块: {e}。请确保 backend_api 的父目录中有 data_setup.py。")
     # 在app.py中，我们不希望因此而退出，所以只打印警告
-    create_dataset = None
+    load_panel = None
 # -----------------------------------------
 
 warnings.filterwarnings('ignore')
@@ -129,8 +129,8 @@ def get_regions_list():
     
 @app.route('/api/all_trend', methods=['GET'])
 def get_all_trend_data():
-    """获取所有年份的趋势数据"""
-    trend_data = analyzer.get_all_trend_data()
+    """获取所有年份的趋势数据，refresh=1 时忽略缓存重新计算"""
+    trend_data = analyzer.get_all_trend_data(refresh=request.args.get('refresh') == '1')
 
     if trend_data:
         return jsonify({
@@ -174,9 +174,10 @@ def get_spatial_year_stats_api(year):
 
 @app.route('/api/spatial/refresh', methods=['POST'])
 def refresh_spatial_data():
-    """手动刷新空间分析数据"""
+    """手动刷新空间分析数据，请求体可用 {"years": ["2025年"]} 只刷新指定年份"""
     try:
-        success = spatial_analysis.perform_real_spatial_analysis()
+        years = (request.get_json(silent=True) or {}).get('years')
+        success = spatial_analysis.perform_real_spatial_analysis(years=years)
         return jsonify({
             "status": "success" if success else "error",
             "message": "空间分析数据刷新完成" if success else "数据刷新失败",
@@ -210,42 +211,29 @@ def get_gdp_historical_data(province):
     if 'PROVINCES' not in globals() or province not in PROVINCES:
         return jsonify({"success": False, "message": f"省份名称 '{province}' 无效或PROVINCES列表未加载"}), 400
 
-    if not create_dataset:
+    if not load_panel:
         return jsonify({"success": False, "message": "服务器数据加载模块 'data_setup' 未成功导入"}), 500
         
     try:
         project_root = os.path.dirname(prediction_dir)
         data_dir = os.path.join(project_root, "data")
         
-        origin_data, _ = create_dataset(data_dir, province)
+        # 面板数据在进程内缓存，CSV 修改后自动重新读取
+        panel = load_panel(data_dir)
+        province_index = panel['provinces'].index(province)
+        gdp_index = panel['features'].index('GDP')
+        gdp_values = panel['values'][:, province_index, gdp_index]
+
+        # 年份正序（2005->2024），列名匹配前端期望
+        historical_data = [
+            {'year': year, 'gdp': float(gdp)}
+            for year, gdp in zip(panel['years'], gdp_values)
+        ]
 
-        # 在后端打印实际的列名，用于验证
-        print(f"DEBUG: Columns for {province} are: {origin_data.columns.tolist()}")
-
-        # origin_data 索引是0-19，需要映射到实际年份2005-2024（正序）
-        # 将索引转换为实际年份
-        data_length = len(origin_data)
-        
-        # 创建年份列表（从2005正序到2024）
-        years = list(range(2005, 2005 + data_length))  # [2005, 2006, ..., 2024]
-        
-        # 使用 reset_index() 并添加年份列
-        historical_data = origin_data.reset_index(drop=True)
-        historical_data['year'] = years
-        
-        # 提取年份和GDP列
-        historical_data = historical_data[['year', 'GDP']]
-        
-        # 重命名列以匹配前端期望
-        historical_data.rename(columns={'GDP': 'gdp'}, inplace=True)
-        
-        # 按年份正序排序（2005->2024）
-        historical_data = historical_data.sort_values('year').reset_index(drop=True)
-        
         return jsonify({
             "success": True,
             "province": province,
-            "data": historical_data.to_dict('records')
+            "data": historical_data
         })
 
     except FileNotFoundError:
@@ -263,10 +251,18 @@ def get_gdp_historical_data(province):
 
 
 try:
-    from .gdp_onnx_service import get_predictor_service, PROVINCES, preload_all_models
+    from .gdp_onnx_service import (get_predictor_service, PROVINCES, preload_all_models, predict_all_provinces,
+                                   get_cache_stats, get_default_prediction, read_upload_column, read_upload_table,
+                                   predict_custom_all, run_scenarios, DEFAULT_SCENARIO_SAMPLES,
+                                   predict_with_intervals, DEFAULT_BOOTSTRAP, DEFAULT_INTERVAL_LEVEL,
+                                   invalidate_result_versions)
 except ImportError:
     # 如果作为主脚本运行，可能需要调整导入方式
-    from gdp_onnx_service import get_predictor_service, PROVINCES, preload_all_models
+    from gdp_onnx_service import (get_predictor_service, PROVINCES, preload_all_models, predict_all_provinces,
+                                  get_cache_stats, get_default_prediction, read_upload_column, read_upload_table,
+                                  predict_custom_all, run_scenarios, DEFAULT_SCENARIO_SAMPLES,
+                                  predict_with_intervals, DEFAULT_BOOTSTRAP, DEFAULT_INTERVAL_LEVEL,
+                                  invalidate_result_versions)
     print("警告: 使用本地导入 gdp_onnx_service。在大型项目中推荐使用包管理。")
 
 
@@ -299,22 +295,18 @@ def get_gdp_prediction(province):
         return jsonify({"success": False, "message": f"省份名称 '{province}' 无效"}), 400
 
     try:
-        # 通过缓存机制获取预测器实例
-        predictor = get_predictor_service(province)
-
-        # 执行预测
-        prediction_result = predictor.predict_gdp()
+        # 模型文件和数据都未变化时直接返回缓存的预测结果
+        prediction_result, etag = get_default_prediction(province)
 
-        if prediction_result:
-            # 保存预测结果到数据库
-            
-            return jsonify({
-                "success": True,
-                "province": province,
-                "data": prediction_result['predictions']
-            })
-        else:
-            return jsonify({"success": False, "message": f"未能获取 {province} 的预测结果"}), 500
+        response = jsonify({
+            "success": True,
+            "province": province,
+            "data": prediction_result['predictions']
+        })
+        # 强 ETag：客户端带 If-None-Match 轮询时，结果未变化返回 304
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
 
     except FileNotFoundError as e:
         return jsonify({"success": False, "message": str(e)}), 404
@@ -322,6 +314,104 @@ def get_gdp_prediction(province):
         print(f"预测失败: {e}")
         return jsonify({"success": False, "message": f"预测过程中发生错误: {str(e)}"}), 500
 
+@app.route('/api/gdp/predict_all', methods=['GET'])
+def get_gdp_prediction_all():
+    """一次返回全部省份未来几年的GDP预测值 (全国预测地图只需一次请求)"""
+    provinces = request.args.get('provinces')
+    provinces = [p for p in provinces.split(',') if p] if provinces else None
+    if provinces:
+        invalid = [p for p in provinces if p not in PROVINCES]
+        if invalid:
+            return jsonify({"success": False, "message": f"省份名称 {invalid} 无效"}), 400
+
+    try:
+        result = predict_all_provinces(provinces)
+        return jsonify({
+            "success": True,
+            "years": result['years'],
+            "data": result['predictions'],
+            "errors": result['errors']
+        })
+    except Exception as e:
+        print(f"批量预测失败: {e}")
+        return jsonify({"success": False, "message": f"批量预测过程中发生错误: {str(e)}"}), 500
+
+@app.route('/api/gdp/predict_interval', methods=['GET'])
+def get_gdp_prediction_interval():
+    """
+    预测均值和预测区间 (种子集成 × 输入窗口自助抽样，一次批量推理)
+    可选参数: provinces=北京市,上海市  level=0.9  bootstrap=50  seed=0
+    """
+    provinces = request.args.get('provinces')
+    provinces = [p for p in provinces.split(',') if p] if provinces else None
+    if provinces:
+        invalid = [p for p in provinces if p not in PROVINCES]
+        if invalid:
+            return jsonify({"success": False, "message": f"省份名称 {invalid} 无效"}), 400
+
+    try:
+        result = predict_with_intervals(
+            provinces,
+            level=request.args.get('level', DEFAULT_INTERVAL_LEVEL, type=float),
+            bootstrap=request.args.get('bootstrap', DEFAULT_BOOTSTRAP, type=int),
+            seed=request.args.get('seed', 0, type=int),
+        )
+        return jsonify({
+            "success": True,
+            "years": result['years'],
+            "level": result['level'],
+            "samples": result['samples'],
+            "data": result['predictions'],
+            "errors": result['errors']
+        })
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        print(f"区间预测失败: {e}")
+        return jsonify({"success": False, "message": f"区间预测过程中发生错误: {str(e)}"}), 500
+
+@app.route('/api/gdp/scenarios', methods=['POST'])
+def get_gdp_scenarios():
+    """
+    情景分析：按请求中的情景调整人口、消费、财政支出，返回每个情景的预测分布
+    请求体: {"scenarios": [{"name": "消费+5%", "changes": {"consumption": 0.05}}, ...],
+            "provinces": [...] (可选), "samples": 200 (可选), "seed": 0 (可选)}
+    """
+    body = request.get_json(silent=True) or {}
+    scenarios = body.get('scenarios')
+    if not isinstance(scenarios, list) or not scenarios:
+        return jsonify({"success": False, "message": "scenarios 应为非空列表"}), 400
+    provinces = body.get('provinces') or None
+    if provinces:
+        invalid = [p for p in provinces if p not in PROVINCES]
+        if invalid:
+            return jsonify({"success": False, "message": f"省份名称 {invalid} 无效"}), 400
+
+    try:
+        result = run_scenarios(
+            scenarios,
+            provinces,
+            samples=int(body.get('samples', DEFAULT_SCENARIO_SAMPLES)),
+            seed=int(body.get('seed', 0)),
+        )
+        return jsonify({"success": True, **result})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        print(f"情景分析失败: {e}")
+        return jsonify({"success": False, "message": f"情景分析过程中发生错误: {str(e)}"}), 500
+
+@app.route('/api/gdp/cache_stats', methods=['GET'])
+def get_gdp_cache_stats():
+    """预测器缓存的大小、命中/未命中/淘汰计数以及预加载进度"""
+    return jsonify({"success": True, "data": get_cache_stats()})
+
+@app.route('/api/gdp/refresh', methods=['POST'])
+def refresh_gdp_results():
+    """ingest/update/train 修改数据或模型之后调用，下次预测请求立即重新检查文件 (不必等 RESULT_VERSION_TTL)"""
+    invalidate_result_versions()
+    return jsonify({"success": True, "message": "已丢弃缓存的模型校验值和数据版本"})
+
 @app.route('/api/gdp/predict_custom', methods=['POST'])
 def predict_gdp_custom_data():
     if request.method != 'POST':
@@ -336,36 +426,86 @@ def predict_gdp_custom_data():
     if province is None:
         return jsonify({"success": False, "message": "缺少省份参数"}), 400
     
+    if province not in PROVINCES:
+        return jsonify({"success": False, "message": f"省份名称 '{province}' 无效"}), 400
+
     try:
-        # 2. 读取每个上传的CSV文件
-        dfs = []
+        # 2. 每个上传的CSV文件只解析目标省份一列
+        columns = []
         for file_key in required_files:
-            csv_file = request.files[file_key]
-            df = pd.read_csv(csv_file.stream)
-            
-            # 检查是否有目标省份列
-            if province not in df.columns:
-                return jsonify({"success": False, "message": f"CSV文件 {file_key} 缺少省份列: {province}"}), 400
-            dfs.append(df)
-        
-        # 3. 获取预测器并加载自定义数据
+            try:
+                columns.append(read_upload_column(request.files[file_key].stream, province))
+            except ValueError as e:
+                return jsonify({"success": False, "message": f"CSV文件 {file_key} 无法读取: {str(e)}"}), 400
+
+        # 3. 在请求内完成归一化和推理，不修改缓存的预测器
         predictor = get_predictor_service(province)
-        predictor.load_custom_data(*dfs)
-        
-        # 4. 执行预测
-        prediction_result = predictor.predict_gdp()
-        
+        prediction_result = predictor.predict_custom(columns)
+
         return jsonify({
             "success": True,
             "province": province,
             "data": prediction_result['predictions']
         })
-        
+
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"success": False, "message": f"预测失败: {str(e)}"}), 500
-    
+
+@app.route('/api/gdp/predict_custom_all', methods=['POST'])
+def predict_gdp_custom_data_all():
+    """
+    用同一组上传的四个CSV文件预测其中的全部省份 (一次归一化、一次批量推理)
+    可选表单字段 provinces=北京市,上海市 只预测部分省份；
+    format=ndjson (或 Accept: application/x-ndjson) 时逐行输出每个省份的结果
+    """
+    required_files = ['population', 'consumption', 'gdp', 'financial']
+    if any(file not in request.files for file in required_files):
+        return jsonify({"success": False, "message": "必须提供四个CSV文件：population, consumption, gdp, financial"}), 400
+
+    provinces = request.form.get('provinces')
+    provinces = [p for p in provinces.split(',') if p] if provinces else None
+    if provinces:
+        invalid = [p for p in provinces if p not in PROVINCES]
+        if invalid:
+            return jsonify({"success": False, "message": f"省份名称 {invalid} 无效"}), 400
+
+    try:
+        tables = []
+        for file_key in required_files:
+            try:
+                tables.append(read_upload_table(request.files[file_key].stream, provinces))
+            except ValueError as e:
+                return jsonify({"success": False, "message": f"CSV文件 {file_key} 无法读取: {str(e)}"}), 400
+        result = predict_custom_all(tables, provinces)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"批量预测失败: {str(e)}"}), 500
+
+    ndjson = (request.values.get('format') == 'ndjson'
+              or request.accept_mimetypes.best == 'application/x-ndjson')
+    if ndjson:
+        def generate():
+            for prediction in result['predictions']:
+                yield json.dumps({"province": prediction['province'], "data": prediction['predictions']},
+                                 ensure_ascii=False) + '\n'
+            for province, message in result['errors'].items():
+                yield json.dumps({"province": province, "error": message}, ensure_ascii=False) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    return jsonify({
+        "success": True,
+        "years": result['years'],
+        "data": result['predictions'],
+        "errors": result['errors']
+    })
+
 # ==================== 主程序入口 ====================
 
 if __name__ == '__main__':
@@ -380,9 +520,14 @@ if __name__ == '__main__':
         print("数据库连接初始化失败")
 
     # 3. 预加载所有 GDP 预测 ONNX 模型 (可选)
-    print("开始预加载 GDP 预测模型...")
-    preload_all_models()
-    print("GDP 预测模型预加载完成。")
+    if PRELOAD_IN_BACKGROUND:
+        # 后台加载，服务立即开始接收请求，进度见 /api/gdp/cache_stats
+        preload_all_models(background=True)
+        print("GDP 预测模型正在后台预加载...")
+    else:
+        print("开始预加载 GDP 预测模型...")
+        preload_all_models()
+        print("GDP 预测模型预加载完成。")
 
     print("=" * 60)
     # ... (其余打印信息)
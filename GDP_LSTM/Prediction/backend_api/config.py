@@ -50,6 +50,22 @@ UNIT_MAP = {
     'training_epoch_details': '',
 }
 
+# GDP 预测器缓存 (gdp_onnx_service)
+PREDICTOR_CACHE_SIZE = 31  # 最多缓存的省份预测器数量，超出时淘汰最久未使用的
+PRELOAD_IN_BACKGROUND = True  # 启动时在后台线程预加载模型，服务不必等全部模型加载完成就能接收请求
+RESULT_VERSION_TTL = 10  # 预测结果缓存的模型校验值和数据版本在这段时间 (秒) 内不重新检查文件，0 表示每次查询都检查
+
+# ONNX Runtime session (gdp_onnx_service.create_session)
+ORT_INTRA_OP_THREADS = 1  # 单个算子内部的并行线程数，0 表示使用全部物理核心
+ORT_INTER_OP_THREADS = 1  # 算子之间的并行线程数
+ORT_GLOBAL_THREAD_POOL = True  # 所有 session 共享一个线程池，而不是每个 session 各建一组
+ORT_GRAPH_OPTIMIZATION = 'all'  # 图优化级别: disable / basic / extended / all
+ORT_OPTIMIZED_CACHE = True  # 优化后的模型缓存在 models/ort_cache/，再次启动时跳过图优化
+
+# 省份模型变体 (quantize.py 生成): fp32 / int8 / fp16 / auto (误差在容许范围内的变体中文件最小的)
+ONNX_MODEL_VARIANT = 'fp32'
+QUANTIZATION_TOLERANCE = 0.5  # 变体相对 float32 .pth 的最大 GDP 相对误差 (%)，超出时使用 fp32 模型
+
 # 文本列（无需单位）
 TEXT_COLS = ['地区', '省份', '城市', '名称', '描述', '指标名称', 'province', 'model_version', 'hyperparams_json', 'training_session_id']
 
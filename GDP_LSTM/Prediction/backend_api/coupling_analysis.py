@@ -5,9 +5,27 @@ import geopandas as gpd
 import numpy as np
 from sklearn.preprocessing import MinMaxScaler
 import os
+import json
+import hashlib
 from db_utils import init_db_engine
 from config import CFG
 
+# 各年份的趋势数据缓存: {年份: {'stamp': 计算时数据库中该年份数据的标记, 'records': [各地区记录]}}，
+# 新增或修订某一年时只重新计算该年；数据库中该年份的数据变化后标记不同，读取时自动重新计算
+TREND_CACHE = os.path.join(CFG['out_dir'], 'coupling_trend.json')
+
+
+def year_stamp(population_df, gdp_df, year):
+    """某一年源数据的标记：两个表中地区和该年份列的哈希，修改数值或增删地区后改变；任一表没有该年份时返回 None"""
+    columns = []
+    for df in (population_df, gdp_df):
+        year_cols = [col for col in df.columns if str(year) in str(col)]
+        if not year_cols:
+            return None
+        columns.append(df[['地区', year_cols[0]]].astype(str).values.tolist())
+    return hashlib.sha256(json.dumps(columns, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
 class CouplingCoordinationAnalysis:
     def __init__(self):
         self.engine = init_db_engine()
@@ -20,21 +38,38 @@ class CouplingCoordinationAnalysis:
         return self.engine is not None
 
     def get_available_years(self):
-        """获取可用的年份列表"""
-        return [str(year) for year in range(2005, 2025)]
+        """获取可用的年份列表 (数据库中的 2005-2024 年，以及增量更新写入缓存的年份)"""
+        years = {str(year) for year in range(2005, 2025)}
+        years.update(self.load_trend_cache())
+        return sorted(years)
 
-    def load_and_process_data(self, target_year='2024'):
-        """加载并处理指定年份的数据"""
-        connection = None
+    def load_source_tables(self):
+        """读取数据库中的 `人口数据`、`年度数据`，数据库不可用时返回 (None, None)"""
         if not self.init_engine():
+            return None, None
+        try:
+            with self.engine.connect() as connection:
+                return (pd.read_sql("SELECT * FROM `人口数据`", connection),
+                        pd.read_sql("SELECT * FROM `年度数据`", connection))
+        except Exception as e:
+            print(f"读取人口/GDP数据失败: {e}")
+            return None, None
+
+    def load_and_process_data(self, target_year='2024', population_df=None, gdp_df=None):
+        """
+        加载并处理指定年份的数据
+        :param population_df/gdp_df: 地区 + 年份列的数据表，默认从数据库读取 `人口数据`、`年度数据`
+        """
+        connection = None
+        if (population_df is None or gdp_df is None) and not self.init_engine():
             return False
 
         try:
-            connection = self.engine.connect()
-
             # 1. 加载数据
-            population_df = pd.read_sql("SELECT * FROM `人口数据`", connection)
-            gdp_df = pd.read_sql("SELECT * FROM `年度数据`", connection)
+            if population_df is None or gdp_df is None:
+                connection = self.engine.connect()
+                population_df = pd.read_sql("SELECT * FROM `人口数据`", connection)
+                gdp_df = pd.read_sql("SELECT * FROM `年度数据`", connection)
 
             # 2. 检查年份并提取数据
             pop_cols = [col for col in population_df.columns if str(target_year) in str(col)]
@@ -146,27 +181,88 @@ class CouplingCoordinationAnalysis:
         
         return data
 
-    def get_all_trend_data(self):
-        """获取2005-2024年所有年份的趋势数据"""
-        trend_data = []
-        years = self.get_available_years()
+    def year_trend_data(self, year, population_df=None, gdp_df=None):
+        """计算一个年份各地区的趋势记录，处理失败时返回 None"""
+        if not self.load_and_process_data(year, population_df, gdp_df):
+            return None
+        # 提取关键数据
+        return [
+            {
+                'year': int(year),
+                'region': row['region'],
+                'coordination_degree': float(row['coordination_degree']),
+                'coordination_level': row['coordination_level'],
+                'development_type': row['development_type'],
+                'population': int(row['population']),
+                'gdp': float(row['gdp'])
+            }
+            for idx, row in self.result_gdf.iterrows()
+        ]
+
+    def load_trend_cache(self):
+        if not os.path.exists(TREND_CACHE):
+            return {}
+        with open(TREND_CACHE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        # 旧格式的缓存只有记录，没有标记，数据库中有该年份时会被重新计算
+        return {year: entry if isinstance(entry, dict) else {'stamp': None, 'records': entry}
+                for year, entry in cache.items()}
 
-        for i, year in enumerate(years):
-            if self.load_and_process_data(year):
-                # 提取关键数据
-                for idx, row in self.result_gdf.iterrows():
-                    trend_data.append({
-                        'year': int(year),
-                        'region': row['region'],
-                        'coordination_degree': float(row['coordination_degree']),
-                        'coordination_level': row['coordination_level'],
-                        'development_type': row['development_type'],
-                        'population': int(row['population']),
-                        'gdp': float(row['gdp'])
-                    })
-            else:
+    def save_trend_cache(self, cache):
+        tmp_path = TREND_CACHE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, TREND_CACHE)
+
+    def refresh_trend_years(self, years, population_df=None, gdp_df=None):
+        """
+        重新计算指定年份的趋势数据并写入缓存，其他年份保持不变；返回成功的年份
+        :param population_df/gdp_df: 用于计算的数据 (如 update.py 的增量数据)，默认使用数据库中的表；
+                                     缓存的标记总是取自数据库，数据库中该年份的数据变化后才会重新计算
+        """
+        db_population, db_gdp = self.load_source_tables()
+        if population_df is None or gdp_df is None:
+            population_df, gdp_df = db_population, db_gdp
+            if population_df is None:
+                return []
+        cache = self.load_trend_cache()
+        refreshed = []
+        for year in years:
+            records = self.year_trend_data(str(year), population_df, gdp_df)
+            if records is None:
                 print(f"跳过 {year} 年数据（处理失败）")
+                continue
+            stamp = year_stamp(db_population, db_gdp, year) if db_population is not None else None
+            cache[str(year)] = {'stamp': stamp, 'records': records}
+            refreshed.append(str(year))
+        if refreshed:
+            self.save_trend_cache(cache)
+        return refreshed
+
+    def get_all_trend_data(self, refresh=False):
+        """
+        获取所有年份的趋势数据，已缓存且数据库中该年份的数据未变化的年份直接读取缓存
+        :param refresh: 忽略缓存，重新计算全部年份
+        """
+        years = self.get_available_years()
+        cache = {} if refresh else self.load_trend_cache()
+        population_df, gdp_df = self.load_source_tables()
+        stale = []
+        for year in years:
+            if year not in cache:
+                stale.append(year)
+            elif population_df is not None:
+                # 数据库中没有的年份 (增量更新写入的) 标记为 None，保留缓存
+                stamp = year_stamp(population_df, gdp_df, year)
+                if stamp is not None and stamp != cache[year]['stamp']:
+                    stale.append(year)
+        if stale:
+            self.refresh_trend_years(stale, population_df, gdp_df)
+            cache = self.load_trend_cache()
 
+        trend_data = []
+        for year in years:
+            trend_data.extend(cache[year]['records'] if year in cache else [])
         return trend_data
 
 # 创建耦合分析实例
@@ -1,10 +1,17 @@
 import onnxruntime
 import numpy as np
 import os
+import json
+import hashlib
 import torch
-from sklearn.preprocessing import MinMaxScaler
 import pandas as pd
 import sys
+import shutil
+import platform
+import tempfile
+import threading
+import time
+from collections import OrderedDict, Counter
 
 # -----------------------------------------------------
 # 1. 修正跨目录导入和路径问题
@@ -30,10 +37,14 @@ if prediction_dir not in sys.path:
 # 1.3. 导入必要的模块
 try:
     import data_setup
+    import registry
 except ImportError:
-    print(f"致命错误: 无法导入 data_setup.py。请检查文件是否位于 {prediction_dir}")
+    print(f"致命错误: 无法导入 data_setup.py / registry.py。请检查文件是否位于 {prediction_dir}")
     sys.exit(1)
 
+from config import (PREDICTOR_CACHE_SIZE, RESULT_VERSION_TTL, ORT_INTRA_OP_THREADS, ORT_INTER_OP_THREADS, ORT_GLOBAL_THREAD_POOL,
+                    ORT_GRAPH_OPTIMIZATION, ORT_OPTIMIZED_CACHE, ONNX_MODEL_VARIANT, QUANTIZATION_TOLERANCE)
+
 
 # -----------------------------------------------------
 # 2. 路径配置 (使用上面定义的变量)
@@ -45,14 +56,27 @@ DATA_DIR = os.path.join(project_root, "data")
 # models 位于 Prediction 目录
 MODEL_DIR = os.path.join(prediction_dir, "models")
 
+# 图优化后的模型缓存 (每个模型一个子目录，按源文件校验值和 ONNX Runtime 版本区分)
+ORT_CACHE_DIR = os.path.join(MODEL_DIR, "ort_cache")
+
 
 # -----------------------------------------------------
-# 3. 超参数定义 (必须与 train.py 保持一致)
+# 3. 数据布局定义 (窗口大小、预测步数等超参数从 models/manifest.json 读取)
 # -----------------------------------------------------
 INPUT_FEATURE_SIZE = 4
-WINDOW_SIZE = 6
 GDP_COL_INDEX = 2
-PREDICT_STEPS = 2
+
+# 情景分析: 可以调整的特征 (API 中的名称 -> 特征列下标)
+SCENARIO_FEATURES = {'population': 0, 'consumption': 1, 'financial': 3}
+# 变化为区间时每个情景的默认抽样数；每次请求全部情景的抽样总数上限
+DEFAULT_SCENARIO_SAMPLES = 200
+MAX_SCENARIO_SAMPLES = 5000
+SCENARIO_PERCENTILES = (5, 50, 95)
+
+# 预测区间: 输入窗口的默认自助抽样次数及上限、默认置信水平
+DEFAULT_BOOTSTRAP = 50
+MAX_BOOTSTRAP = 1000
+DEFAULT_INTERVAL_LEVEL = 0.9
 PROVINCES = [
     "北京市", "天津市", "上海市", "重庆市", "内蒙古自治区", "广西壮族自治区",
     "西藏自治区", "宁夏回族自治区", "新疆维吾尔自治区", "河北省", "山西省",
@@ -62,6 +86,355 @@ PROVINCES = [
 ]
 
 
+# 文件校验值缓存: {路径: ((修改时间, 大小), sha256)}，文件未变化时不重新计算
+_file_checksums = {}
+
+
+def _cached_checksum(path: str) -> str:
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _file_checksums.get(path)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, registry.file_checksum(path))
+        _file_checksums[path] = cached
+    return cached[1]
+
+
+# -----------------------------------------------------
+# 4. ONNX Runtime session (所有 session 都由 create_session 创建)
+# -----------------------------------------------------
+OPTIMIZATION_LEVELS = {
+    'disable': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+OPTIMIZED_MODEL_NAME = "model.onnx"
+
+_session_lock = threading.Lock()
+# None: 尚未创建任何 session; True/False: 是否使用全局线程池
+_global_thread_pool = None
+
+
+def _use_global_thread_pool() -> bool:
+    """全局线程池只能在第一个 session 创建之前设置"""
+    global _global_thread_pool
+    with _session_lock:
+        if _global_thread_pool is None:
+            _global_thread_pool = False
+            if ORT_GLOBAL_THREAD_POOL:
+                try:
+                    onnxruntime.capi._pybind_state.set_global_thread_pool_sizes(
+                        ORT_INTRA_OP_THREADS, ORT_INTER_OP_THREADS)
+                    _global_thread_pool = True
+                except Exception as e:
+                    print(f"警告: 无法创建全局线程池，各 session 使用自己的线程池: {e}")
+    return _global_thread_pool
+
+
+def _session_options(level) -> onnxruntime.SessionOptions:
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = level
+    if _use_global_thread_pool():
+        options.use_per_session_threads = False
+    else:
+        options.intra_op_num_threads = ORT_INTRA_OP_THREADS
+        options.inter_op_num_threads = ORT_INTER_OP_THREADS
+    return options
+
+
+def _optimized_cache_dir(model_path: str) -> str:
+    """
+    缓存目录名包含源模型 (及 .onnx.data) 的校验值、ONNX Runtime 版本、优化级别和本机信息：
+    'all' 级别的优化结果与硬件有关，只在生成它的机器上使用
+    """
+    sources = [_cached_checksum(path) for path in (model_path, model_path + '.data') if os.path.exists(path)]
+    payload = json.dumps([sources, onnxruntime.__version__, ORT_GRAPH_OPTIMIZATION,
+                          platform.machine(), platform.node()])
+    key = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(ORT_CACHE_DIR, f"{stem}-{key}")
+
+
+def _optimize_and_cache(model_path: str, cache_dir: str, level) -> onnxruntime.InferenceSession:
+    """创建 session 的同时把优化后的模型写入临时目录，完成后整体改名为缓存目录"""
+    options = _session_options(level)
+    try:
+        os.makedirs(ORT_CACHE_DIR, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=ORT_CACHE_DIR)
+    except OSError as e:
+        print(f"警告: 无法写入优化模型缓存 {ORT_CACHE_DIR}: {e}")
+        return onnxruntime.InferenceSession(model_path, options)
+
+    options.optimized_model_filepath = os.path.join(tmp_dir, OPTIMIZED_MODEL_NAME)
+    # 权重写入缓存目录自己的 .data 文件，而不是引用源模型旁边的 .onnx.data
+    options.add_session_config_entry('session.optimized_model_external_initializers_file_name',
+                                     f"{OPTIMIZED_MODEL_NAME}.data")
+    options.add_session_config_entry('session.optimized_model_external_initializers_min_size_in_bytes', '1024')
+    # 'all' 级别保存时会提示结果与硬件有关，缓存目录名已包含本机信息
+    options.log_severity_level = 3
+    try:
+        session = onnxruntime.InferenceSession(model_path, options)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    stem = os.path.basename(cache_dir).rsplit('-', 1)[0]
+    try:
+        os.rename(tmp_dir, cache_dir)
+    except OSError:
+        # 其他进程已写入同一缓存
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return session
+    # 删除该模型过期的缓存
+    for name in os.listdir(ORT_CACHE_DIR):
+        if name.startswith(f"{stem}-") and name != os.path.basename(cache_dir):
+            shutil.rmtree(os.path.join(ORT_CACHE_DIR, name), ignore_errors=True)
+    return session
+
+
+def create_session(model_path: str) -> onnxruntime.InferenceSession:
+    """
+    按 config.py 中的线程数、线程池和图优化级别创建 session。
+    开启 ORT_OPTIMIZED_CACHE 时优先加载缓存的优化模型 (不再做图优化)，没有缓存时优化一次并写入缓存。
+    """
+    level = OPTIMIZATION_LEVELS[ORT_GRAPH_OPTIMIZATION]
+    if not ORT_OPTIMIZED_CACHE:
+        return onnxruntime.InferenceSession(model_path, _session_options(level))
+
+    cache_dir = _optimized_cache_dir(model_path)
+    cached_path = os.path.join(cache_dir, OPTIMIZED_MODEL_NAME)
+    if os.path.exists(cached_path):
+        try:
+            return onnxruntime.InferenceSession(cached_path, _session_options(OPTIMIZATION_LEVELS['disable']))
+        except Exception as e:
+            print(f"警告: 优化模型缓存损坏，重新生成: {e}")
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    return _optimize_and_cache(model_path, cache_dir, level)
+
+
+def load_model_scaler(province: str, panel: dict) -> dict:
+    """训练时保存的归一化参数 {'min', 'scale'}；旧模型没有保存时按训练时的方式从面板计算"""
+    scaler_path = os.path.join(MODEL_DIR, f"{province}{data_setup.SCALER_SUFFIX}")
+    if os.path.exists(scaler_path):
+        # 直接使用训练时的参数，保证与模型一致
+        return data_setup.load_scaler(scaler_path)
+    return data_setup.province_scaler(panel, province)
+
+
+class CombinedModel:
+    """
+    包含全部省份参数的单个 ONNX 模型 (train.py --export-combined 导出)，所有省份共享一个 session。
+    输入 input (K, B, W, F) 与 province_index (K,)，输出 (K, B, predict_steps, 1)。
+    """
+
+    def __init__(self):
+        self.model_path = os.path.join(MODEL_DIR, f"{registry.COMBINED_MODEL_NAME}.onnx")
+        meta_path = os.path.join(MODEL_DIR, f"{registry.COMBINED_MODEL_NAME}.json")
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.provinces = meta['provinces']
+        self.window_size = meta['hyperparams']['window_size']
+        self.predict_steps = meta['hyperparams']['predict_steps']
+        # 导出时各省份 .pth 的校验值
+        self.sources = meta['sources']
+        self.session = create_session(self.model_path)
+
+    def is_current(self) -> bool:
+        """导出合并模型之后，任一省份重新训练过 (.pth 改变) 就视为过期"""
+        for province, checksum in self.sources.items():
+            pth_path = os.path.join(MODEL_DIR, f"{province}_seq2seq_gdp_model.pth")
+            if not os.path.exists(pth_path) or registry.file_checksum(pth_path) != checksum:
+                return False
+        return True
+
+    def run(self, windows: np.ndarray, provinces) -> np.ndarray:
+        """windows 形状 (K, B, W, F)，第 k 组使用 provinces[k] 的参数；返回 (K, B, predict_steps, 1)"""
+        index = np.asarray([self.provinces.index(province) for province in provinces], dtype=np.int64)
+        return self.session.run(['output'], {'input': windows.astype(np.float32), 'province_index': index})[0]
+
+
+# None: 尚未尝试加载; False: 合并模型不存在或已过期
+_combined_model = None
+
+
+def get_combined_model():
+    """
+    返回合并模型；不存在、已过期或加载失败时返回 None，此时各省份使用自己的 ONNX 模型。
+    合并模型文件或任一省份的 .pth 变化后 (重新导出或重新训练) 重新加载，与省份模型一样最多 RESULT_VERSION_TTL 秒后生效
+    """
+    global _combined_model
+    base_path = os.path.join(MODEL_DIR, registry.COMBINED_MODEL_NAME)
+    paths = [f"{base_path}.onnx", f"{base_path}.onnx.data", f"{base_path}.json"]
+    paths += [os.path.join(MODEL_DIR, f"{province}_seq2seq_gdp_model.pth") for province in PROVINCES]
+    if _shared_model_checksum('combined', _combined_model, paths) is not None:
+        _combined_model = False
+        if os.path.exists(f"{base_path}.onnx"):
+            try:
+                model = CombinedModel()
+                if model.is_current():
+                    _combined_model = model
+                else:
+                    print("警告: 合并 ONNX 模型与各省份的 .pth 不一致，请重新运行 train.py --export-combined，暂时使用各省份的模型")
+            except Exception as e:
+                print(f"警告: 合并 ONNX 模型加载失败，使用各省份的模型: {e}")
+    return _combined_model or None
+
+
+def province_combined_model(province: str, variant: str):
+    """省份使用的合并模型；合并模型只有 fp32，使用其他变体或省份不在合并模型中时返回 None"""
+    combined = get_combined_model() if variant == 'fp32' else None
+    if combined is not None and province not in combined.provinces:
+        return None
+    return combined
+
+
+def model_checksum(predictor) -> str:
+    """
+    预测器所用模型文件的校验值：ONNX 模型及其外部权重文件 (.onnx.data)、归一化参数；
+    使用合并模型时还包括该省份的 .pth (重新训练后合并模型即过期)
+    """
+    province = predictor.province
+    if predictor.combined is not None:
+        base = os.path.join(MODEL_DIR, registry.COMBINED_MODEL_NAME)
+        paths = [base + '.onnx', base + '.onnx.data', base + '.json',
+                 os.path.join(MODEL_DIR, f"{province}_seq2seq_gdp_model.pth")]
+    else:
+        paths = [predictor.model_path, predictor.model_path + '.data']
+    paths.append(os.path.join(MODEL_DIR, f"{province}{data_setup.SCALER_SUFFIX}"))
+    if ONNX_MODEL_VARIANT != 'fp32':
+        # 变体的选择取决于报告，报告更新后需要重新选择
+        paths.append(os.path.join(MODEL_DIR, registry.QUANTIZATION_REPORT_NAME))
+    return _files_checksum(paths)
+
+
+def _files_checksum(paths) -> str:
+    """一组文件的整体校验值，不存在的文件跳过"""
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.exists(path):
+            digest.update(os.path.basename(path).encode('utf-8'))
+            digest.update(_cached_checksum(path).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _shared_model_checksum(name: str, loaded, paths):
+    """
+    合并模型/集成模型的重新检查。loaded 为缓存的加载结果 (None: 尚未尝试加载)；
+    需要重新加载时返回相关文件当前的校验值，缓存的结果仍然有效时返回 None。
+    距上次检查不超过 RESULT_VERSION_TTL 时不重新计算校验值
+    """
+    now = time.monotonic()
+    with _result_lock:
+        checksum, checked_at = _shared_model_versions.get(name, (None, 0.0))
+        if loaded is not None and checksum is not None and now - checked_at < RESULT_VERSION_TTL:
+            return None
+    current = _files_checksum(paths)
+    with _result_lock:
+        _shared_model_versions[name] = (current, now)
+    if loaded is not None and current == checksum:
+        return None
+    return current
+
+
+class EnsembleModel:
+    """
+    种子集成 (train.py --ensemble K 导出)：全部省份 × K 个副本的参数在一个 ONNX 模型中，
+    第 i 组参数为省份 i // K 的第 i % K 个副本，输入输出格式与合并模型相同。
+    """
+
+    def __init__(self):
+        base_path = os.path.join(MODEL_DIR, registry.ENSEMBLE_MODEL_NAME)
+        with open(f"{base_path}.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.provinces = meta['provinces']
+        self.replicas = meta['replicas']
+        self.window_size = meta['hyperparams']['window_size']
+        self.predict_steps = meta['hyperparams']['predict_steps']
+        # 训练集成时各省份的数据哈希
+        self.data_hashes = meta['data_hashes']
+        self.session = create_session(f"{base_path}.onnx")
+
+    def is_current(self) -> bool:
+        """各省份的主模型用新数据重新训练过 (清单中的数据哈希不同) 时视为过期"""
+        entries = registry.load_manifest(MODEL_DIR)['provinces']
+        return all(entries.get(province, {}).get('data_hash') == data_hash
+                   for province, data_hash in self.data_hashes.items())
+
+    def run(self, windows: np.ndarray, provinces) -> np.ndarray:
+        """windows 形状 (省份, B, W, F)，已归一化；一次 session.run 算出全部副本，返回 (省份, K, B, predict_steps)"""
+        K = self.replicas
+        first = np.asarray([self.provinces.index(province) for province in provinces], dtype=np.int64) * K
+        index = (first[:, np.newaxis] + np.arange(K)).reshape(-1)
+        # 每个省份的窗口复制 K 份，与参数的排列顺序相同
+        inputs = np.repeat(windows.astype(np.float32), K, axis=0)
+        outputs = self.session.run(['output'], {'input': inputs, 'province_index': index})[0]
+        return outputs.reshape(len(provinces), K, windows.shape[1], -1)
+
+
+# None: 尚未尝试加载; False: 集成模型不存在或已过期
+_ensemble_model = None
+
+
+def get_ensemble_model():
+    """
+    返回种子集成模型；不存在、已过期或加载失败时返回 None，此时预测区间只来自输入窗口的自助抽样。
+    集成模型文件或模型清单变化后 (重新运行 --ensemble 或重新训练) 重新加载，
+    与省份模型一样最多 RESULT_VERSION_TTL 秒后生效
+    """
+    global _ensemble_model
+    base_path = os.path.join(MODEL_DIR, registry.ENSEMBLE_MODEL_NAME)
+    paths = [f"{base_path}.onnx", f"{base_path}.onnx.data", f"{base_path}.json",
+             os.path.join(MODEL_DIR, registry.MANIFEST_NAME)]
+    if _shared_model_checksum('ensemble', _ensemble_model, paths) is not None:
+        _ensemble_model = False
+        if os.path.exists(f"{base_path}.onnx"):
+            try:
+                model = EnsembleModel()
+                if model.is_current():
+                    _ensemble_model = model
+                else:
+                    print("警告: 种子集成模型的训练数据与当前模型不一致，请重新运行 train.py --ensemble K")
+            except Exception as e:
+                print(f"警告: 种子集成模型加载失败: {e}")
+    return _ensemble_model or None
+
+
+def select_model_variant(province: str) -> tuple[str, str]:
+    """
+    按 ONNX_MODEL_VARIANT 选择省份模型的变体，返回 (变体, 模型路径)。
+    报告中记录的 .pth 和变体文件与当前一致、且最大 GDP 相对误差不超过 QUANTIZATION_TOLERANCE 时才使用，
+    否则 (如重新训练后尚未运行 quantize.py) 回退到 fp32 模型
+    """
+    fp32_path = registry.variant_model_path(MODEL_DIR, province)
+    if ONNX_MODEL_VARIANT == 'fp32':
+        return 'fp32', fp32_path
+
+    entry = registry.load_quantization_report(MODEL_DIR)['provinces'].get(province)
+    pth_path = os.path.join(MODEL_DIR, f"{province}_seq2seq_gdp_model.pth")
+    if entry is None or not os.path.exists(pth_path) or entry['pth_sha256'] != _cached_checksum(pth_path):
+        entry = {'variants': {}}
+
+    auto = ONNX_MODEL_VARIANT == 'auto'
+    candidates = []
+    for variant in (registry.MODEL_VARIANTS if auto else [ONNX_MODEL_VARIANT]):
+        info = entry['variants'].get(variant)
+        path = registry.variant_model_path(MODEL_DIR, province, variant)
+        if (info is not None and info['max_rel_error'] <= QUANTIZATION_TOLERANCE
+                and os.path.exists(path) and _cached_checksum(path) == info['sha256']):
+            candidates.append((info['size_bytes'], variant, path))
+    if auto and 'fp32' in entry['variants']:
+        candidates.append((entry['variants']['fp32']['size_bytes'], 'fp32', fp32_path))
+
+    if not candidates:
+        if not auto:
+            print(f"警告: {province} 没有可用的 {ONNX_MODEL_VARIANT} 模型 (未生成、已过期或误差超过 "
+                  f"{QUANTIZATION_TOLERANCE}%)，使用 fp32 模型")
+        return 'fp32', fp32_path
+    _, variant, path = min(candidates)
+    return variant, path
+
+
 class GDPPredictorService:
     """
     使用 ONNX Runtime 预测指定省份 GDP 的服务类。
@@ -72,148 +445,747 @@ class GDPPredictorService:
             raise ValueError(f"无效的省份名称: {province}")
 
         self.province = province
-        self.model_path = os.path.join(MODEL_DIR, f"{province}_seq2seq_gdp_model.onnx")
+        # 模型变体 (fp32 / int8 / fp16)，由 ONNX_MODEL_VARIANT 和 quantize.py 的报告决定
+        self.variant, self.model_path = select_model_variant(province)
         self.session = None # onnx的计算器
-        self.scaler = MinMaxScaler()
+        self.scaler = None
+        # 训练时的归一化参数
+        self.model_scaler = None
         self.origin_data = None
         self.last_sequence = None
 
-        if not os.path.exists(self.model_path):
-            raise FileNotFoundError(f"ONNX 模型未找到: {self.model_path}. 请先运行 train.py 生成模型。")
+        # 有合并模型时共享它的 session，不再为每个省份单独创建；合并模型只有 fp32，使用其他变体时不共享
+        self.combined = province_combined_model(province, self.variant)
 
-        # 1. 初始化 ONNX Runtime Session
-        try:
-            self.session = onnxruntime.InferenceSession(self.model_path)
-        except Exception as e:
-            raise RuntimeError(f"ONNX 模型加载失败: {e}")
+        if self.combined is not None:
+            self.window_size = self.combined.window_size
+            self.predict_steps = self.combined.predict_steps
+        else:
+            if not os.path.exists(self.model_path):
+                raise FileNotFoundError(f"ONNX 模型未找到: {self.model_path}. 请先运行 train.py 生成模型。")
+
+            # 超参数与训练时保持一致，来源于模型清单
+            hyperparams = registry.get_hyperparams(MODEL_DIR, province)
+            self.window_size = hyperparams['window_size']
+            self.predict_steps = hyperparams['predict_steps']
+
+            # 1. 初始化 ONNX Runtime Session
+            try:
+                self.session = create_session(self.model_path)
+            except Exception as e:
+                raise RuntimeError(f"ONNX 模型加载失败: {e}")
 
         # 2. 预加载数据和 Scaler
         self._load_data_and_scaler()
+        # 加载时模型文件的校验值，用于发现模型文件已被重新训练或导出覆盖
+        self.model_checksum = model_checksum(self)
 
     def _load_data_and_scaler(self):
-        """加载原始数据并拟合 MinMaxScaler，准备预测输入序列。"""
-        # origin_data是原始csv文件的数据 (已翻转时间顺序)
-        self.origin_data, data_scaled = data_setup.create_dataset(DATA_DIR, self.province)
-
-        # 重新拟合 scaler (使用原始的未归一化数据)
-        self.scaler.fit(self.origin_data.values)
-
-        if len(data_scaled) < WINDOW_SIZE:
-            raise ValueError(f"{self.province} 数据长度不足 ({len(data_scaled)})，无法形成历史窗口 ({WINDOW_SIZE})。")
-        
-        # data_scaled是20个长度的数据05到24年的数据，最后一个窗口就是14（19年到24年的数据）
-        last_start_index = len(data_scaled) - WINDOW_SIZE
-        self.last_sequence = data_scaled[last_start_index: last_start_index + WINDOW_SIZE]
-
-    def load_custom_data(self, population_df, consumption_df, gdp_df, financial_df):
-        """加载来自于api上传的自定义数据，并更新 scaler 和最后的输入序列"""
-        try:
-            print(f"[DEBUG] 正在加载自定义数据，省份: {self.province}")
-            # 确保数据列名一致
-            province = self.province
-            # 检查数据类型
-            print(f"[DEBUG] 数据类型检查: 人口({type(population_df)}), 消费({type(consumption_df)}), GDP({type(gdp_df)}), 财政({type(financial_df)})")
-            population = population_df[province]  # 单位是万
-            consumption = consumption_df[province]  # 单位是亿
-            gdp = gdp_df[province]  # 单位是亿
-            financial = financial_df[province]  # 单位是亿
-
-            # 拼接表格
-            origin_data = pd.concat(
-                [population, consumption, gdp, financial],
-                axis=1
-            )
-            origin_data.columns = ['population', 'consumption', 'GDP', 'financial']
-
-            # 翻转时间顺序
-            origin_data_reversed = origin_data.iloc[::-1].reset_index(drop=True)
-
-            # 转换为numpy数组并进行归一化
-            data_for_scaling = origin_data_reversed.values
-            self.scaler = MinMaxScaler()
-            data_scaled = self.scaler.fit_transform(data_for_scaling)
-
-            # 更新原始数据
-            self.origin_data = origin_data_reversed
-
-            # 也使用data_for_scaling和data_scaled
-            # 更新实例变量
-            self.scaler.fit(self.origin_data.values)
-
-            # 获取最后WINDOW_SIZE长度的数据作为预测输入
-            if len(data_scaled) < WINDOW_SIZE:
-                raise ValueError(f"自定义数据长度不足 ({len(data_scaled)})，无法形成历史窗口 ({WINDOW_SIZE})。")
-            
-            last_start_index = len(data_scaled) - WINDOW_SIZE
-            self.last_sequence = data_scaled[last_start_index: last_start_index + WINDOW_SIZE]
+        """加载原始数据和训练时保存的归一化参数，准备预测输入序列。"""
+        # origin_data是原始csv文件的数据 (已翻转时间顺序)，来自进程内缓存的面板
+        self.origin_data, _ = data_setup.create_dataset(DATA_DIR, self.province)
+        self.model_scaler = load_model_scaler(self.province, data_setup.load_panel(DATA_DIR))
+        self.scaler = self.model_scaler
 
-        except Exception as e:
-            raise RuntimeError(f"加载自定义数据失败: {str(e)}")
-        
+        if len(self.origin_data) < self.window_size:
+            raise ValueError(f"{self.province} 数据长度不足 ({len(self.origin_data)})，无法形成历史窗口 ({self.window_size})。")
+
+        # 05到24年共20年的数据，最后一个窗口就是19年到24年的数据
+        self.last_sequence = data_setup.scale_transform(self.origin_data.values[-self.window_size:], self.scaler)
+
+    def _run(self, input_data: np.ndarray) -> np.ndarray:
+        """input_data 形状 (B, window_size, INPUT_FEATURE_SIZE)，返回 (B, predict_steps, 1)"""
+        if self.combined is not None:
+            return self.combined.run(input_data[np.newaxis], [self.province])[0]
+        input_name = self.session.get_inputs()[0].name
+        output_name = self.session.get_outputs()[0].name
+        return self.session.run([output_name], {input_name: input_data})[0]
 
     def predict_gdp(self) -> dict:
         """执行 ONNX 模型推理并返回反归一化的预测结果。"""
-        if self.session is None or self.last_sequence is None:
+        if (self.session is None and self.combined is None) or self.last_sequence is None:
             raise RuntimeError("预测服务未正确初始化。")
 
-        # 1. 准备输入数据 (形状: (1, WINDOW_SIZE, INPUT_FEATURE_SIZE))
+        # 1. 准备输入数据 (形状: (1, window_size, INPUT_FEATURE_SIZE))
         # ONNX 模型期望 float32
         input_data = self.last_sequence.astype(np.float32)[np.newaxis, :, :]
 
-        # 2. 执行推理
-        input_name = self.session.get_inputs()[0].name
-        output_name = self.session.get_outputs()[0].name
-
-        # predictions_np 形状: (1, PREDICT_STEPS, 1)
-        predictions_np = self.session.run([output_name], {input_name: input_data})[0]
+        # 2. 执行推理，predictions_np 形状: (1, predict_steps, 1)
+        predictions_np = self._run(input_data)
 
         # 3. 后处理和反归一化
-        pre_np = predictions_np.squeeze()  
-
-        # 确保是二维数组 (PREDICT_STEPS, 1)
-        pre_2d = pre_np.reshape(-1, 1)
+        pre_np = predictions_np.reshape(-1).astype(np.float64)
 
-        # 创建一个临时数组，将预测的 GDP 填入正确的位置 (用于反归一化)
-        temp_inverse_input = np.zeros((PREDICT_STEPS, INPUT_FEATURE_SIZE))
-        temp_inverse_input[:, GDP_COL_INDEX] = pre_2d.flatten()
+        # 只对 GDP 列做反变换: x = (scaled - min) / scale
+        final_gdp_values = (pre_np - self.scaler['min'][GDP_COL_INDEX]) / self.scaler['scale'][GDP_COL_INDEX]
 
-        # 反归一化并提取 GDP 列
-        final_data_unscaled = self.scaler.inverse_transform(temp_inverse_input)
-        final_gdp_values = final_data_unscaled[:, GDP_COL_INDEX]
-
-        # 4. 构建结果字典
-        # 预测结果的年份应该是 2025, 2026
-        # 由于原始计算可能是 25, 26，所以加上 2000
-        start_year = self.origin_data.index[-1] + 6
-        years = range(start_year, start_year + PREDICT_STEPS)
+        # 4. 构建结果字典，预测年份从面板最后一年的下一年开始 (与批量预测相同)
+        start_year = data_setup.load_panel(DATA_DIR)['years'][-1] + 1
 
         result = {
             "province": self.province,
             "predictions": [
-                {"year": int(y) + 2000, "gdp": round(float(gdp), 2)}  # year + 2000 转换为实际年份
-                for y, gdp in zip(years, final_gdp_values)
+                {"year": int(start_year + step), "gdp": round(float(gdp), 2)}
+                for step, gdp in enumerate(final_gdp_values)
             ]
         }
         return result
 
 
+    def predict_custom(self, columns) -> dict:
+        """
+        用上传的数据预测。只使用局部变量和共享的 session，不修改预测器的状态，多个请求可以并发调用。
+        :param columns: 四个特征的一维数组 (顺序同 data_setup.FEATURE_COLUMNS)，与上传的 CSV 一样最新的年份在前
+        :return: 与 predict_gdp 相同格式的结果
+        """
+        lengths = {len(column) for column in columns}
+        if len(lengths) != 1:
+            raise ValueError(f"四个文件的年份数不一致: {[len(column) for column in columns]}")
+        # (年份, 特征)，翻转为从远到近
+        values = np.column_stack(columns)[::-1]
+        if np.isnan(values).any():
+            raise ValueError("自定义数据包含缺失值")
+        if len(values) < self.window_size:
+            raise ValueError(f"自定义数据长度不足 ({len(values)})，无法形成历史窗口 ({self.window_size})。")
+
+        # 与原有行为一致：按上传数据自身的范围归一化
+        scaler = data_setup.fit_minmax(values)
+        window = data_setup.scale_transform(values[-self.window_size:], scaler)
+        outputs = self._run(window.astype(np.float32)[np.newaxis]).reshape(-1).astype(np.float64)
+        gdp = (outputs - scaler['min'][GDP_COL_INDEX]) / scaler['scale'][GDP_COL_INDEX]
+
+        # 上传数据与默认数据一样从 2005 年开始
+        start_year = data_setup.FIRST_YEAR + len(values)
+        return {
+            "province": self.province,
+            "predictions": [
+                {"year": start_year + step, "gdp": round(float(value), 2)}
+                for step, value in enumerate(gdp)
+            ]
+        }
+
+
+def read_upload_column(stream, province: str) -> np.ndarray:
+    """只解析上传 CSV 中指定省份的一列，多省份的大文件不会整体读入"""
+    frame = pd.read_csv(stream, usecols=lambda column: column == province, dtype=np.float64)
+    if province not in frame.columns:
+        raise ValueError(f"缺少省份列: {province}")
+    return frame[province].to_numpy()
+
+
+class PredictorCache:
+    """
+    有上限的预测器缓存，线程安全。
+    超过 max_size 时淘汰最久未使用的省份 (LRU)；同一省份的并发首次请求只构建一次，其余请求等待构建结果。
+    构建失败时等待中的请求收到同一个异常，失败不缓存，之后的请求重新构建。
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        # 正在构建的省份 -> {'lock': 该省份的构建锁, 'error': 构建失败时的异常}
+        self._building = {}
+        self.hits = 0
+        # 实际构建预测器的次数；等待其他线程构建完成的请求计入 waits
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+        self.load_errors = 0
+
+    def get(self, province: str, factory) -> GDPPredictorService:
+        with self._lock:
+            if province in self._items:
+                self._items.move_to_end(province)
+                self.hits += 1
+                return self._items[province]
+            build = self._building.setdefault(province, {'lock': threading.Lock(), 'error': None})
+
+        with build['lock']:
+            # 等待期间可能已由其他线程构建完成或构建失败
+            with self._lock:
+                if province in self._items:
+                    self._items.move_to_end(province)
+                    self.waits += 1
+                    return self._items[province]
+                if build['error'] is not None:
+                    self.waits += 1
+                    raise build['error']
+                self.misses += 1
+            try:
+                predictor = factory(province)
+            except Exception as e:
+                with self._lock:
+                    self.load_errors += 1
+                    build['error'] = e
+                    self._building.pop(province, None)
+                raise
+            with self._lock:
+                self._items[province] = predictor
+                while len(self._items) > self.max_size:
+                    self._items.popitem(last=False)
+                    self.evictions += 1
+                self._building.pop(province, None)
+            return predictor
+
+    def discard(self, province: str):
+        with self._lock:
+            self._items.pop(province, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "evictions": self.evictions,
+                "load_errors": self.load_errors,
+                # 各模型变体的预测器数量
+                "variants": dict(Counter(predictor.variant for predictor in self._items.values())),
+                # 从最久未使用到最近使用
+                "provinces": list(self._items),
+            }
+
+
 # 缓存预测器实例，避免重复加载 ONNX 模型和数据
-_predictors_cache = {}
+_predictors_cache = PredictorCache(PREDICTOR_CACHE_SIZE)
+# 预加载状态: idle / running / done
+_preload_state = {"status": "idle", "loaded": 0, "failed": 0}
+# 默认数据集的预测结果: {省份: ((模型校验值, 数据版本), 结果, ETag)}
+_result_cache = {}
+_result_lock = threading.Lock()
+_result_stats = {"hits": 0, "misses": 0}
+# 最近一次检查的数据版本和各省份模型文件的检查时间，RESULT_VERSION_TTL 内缓存命中时不再读文件
+_data_version = {"value": None, "checked_at": 0.0}
+_model_checked_at = {}
+# 合并模型/集成模型加载时相关文件的校验值及检查时间: {名称: (校验值, 检查时间)}
+_shared_model_versions = {}
 
 
 def get_predictor_service(province: str) -> GDPPredictorService:
     """获取指定省份的预测服务实例 (使用缓存)。"""
-    if province not in _predictors_cache:
-        _predictors_cache[province] = GDPPredictorService(province)
-    return _predictors_cache[province]
+    return _predictors_cache.get(province, GDPPredictorService)
+
+
+def get_cache_stats() -> dict:
+    """预测器缓存的命中/未命中/淘汰计数以及预加载进度"""
+    stats = _predictors_cache.stats()
+    stats["preload"] = dict(_preload_state)
+    with _result_lock:
+        stats["results"] = {"size": len(_result_cache), **_result_stats}
+    return stats
+
 
+def _run_group(group, windows: np.ndarray) -> np.ndarray:
+    """
+    windows 形状 (省份, B, 窗口, 特征)，已归一化，第 k 组使用 group[k] 的模型；返回 (省份, B, predict_steps)
+    有合并模型时一次 session.run 算出全部省份，否则每个省份的模型调用一次
+    """
+    combined = get_combined_model()
+    if combined is not None and all(predictor.combined is combined for predictor in group):
+        outputs = combined.run(windows, [predictor.province for predictor in group])
+    else:
+        # 每个省份的参数不同，只能逐个模型推理；单次输出形状 (B, predict_steps, 1)
+        outputs = np.stack([predictor._run(windows[i]) for i, predictor in enumerate(group)])
+    return outputs.reshape(len(group), windows.shape[1], -1).astype(np.float64)
 
-# 启动时预加载所有模型 (可选，加速首次请求)
-def preload_all_models():
-    for p in PROVINCES:
+
+def _predict_batch(values: np.ndarray, provinces, scalers=None, errors=None) -> dict:
+    """
+    批量预测：窗口一次切出并归一化，有合并模型时一次 session.run 算出全部省份，
+    否则每个省份的模型调用一次，全部预测结果一次反归一化
+    :param values: (年份, 省份, 特征) 原始数据，年份从远到近，省份顺序与 provinces 相同
+    :param scalers: 各省份的归一化参数 {'min', 'scale'}，形状 (省份, 特征)；None 时使用训练时的参数
+    :param errors: 已知无法预测的省份 {省份: 错误信息}，结果中一并返回
+    预测器与单省份查询一样通过 _current_predictor 取得，模型文件被覆盖后不会继续使用旧的 session
+    :return: {'years': 预测年份, 'predictions': [与 predict_gdp 相同格式的结果], 'errors': {省份: 错误信息}}
+    """
+    errors = dict(errors or {})
+    predictors = []
+    for i, province in enumerate(provinces):
         try:
-            get_predictor_service(p)
-            # print(f"预加载成功: {p}")
+            predictors.append((i, _current_predictor(province)))
+        except Exception as e:
+            errors[province] = str(e)
+
+    # 窗口大小和预测步数相同的省份一起处理
+    groups = {}
+    for i, predictor in predictors:
+        groups.setdefault((predictor.window_size, predictor.predict_steps), []).append((i, predictor))
+
+    start_year = data_setup.FIRST_YEAR + len(values)
+    predictions = {}
+    for (window_size, predict_steps), members in groups.items():
+        index = [i for i, _ in members]
+        group = [predictor for _, predictor in members]
+        if len(values) < window_size:
+            for predictor in group:
+                errors[predictor.province] = f"数据长度不足 ({len(values)})，无法形成历史窗口 ({window_size})。"
+            continue
+        # 各省份的归一化参数，形状 (省份, 特征)
+        if scalers is None:
+            scaler = {
+                key: np.stack([predictor.model_scaler[key] for predictor in group])
+                for key in ('min', 'scale')
+            }
+        else:
+            scaler = {key: scalers[key][index] for key in ('min', 'scale')}
+        # (窗口, 省份, 特征) -> (省份, 窗口, 特征)，一次完成全部省份的归一化
+        windows = values[-window_size:, index, :].transpose(1, 0, 2)
+        windows = (windows * scaler['scale'][:, np.newaxis] + scaler['min'][:, np.newaxis]).astype(np.float32)
+
+        outputs = _run_group(group, windows[:, np.newaxis])[:, 0]
+
+        # 只对 GDP 列做反变换，形状 (省份, 预测步数)
+        gdp = ((outputs - scaler['min'][:, GDP_COL_INDEX, np.newaxis])
+               / scaler['scale'][:, GDP_COL_INDEX, np.newaxis])
+        for predictor, row in zip(group, gdp):
+            predictions[predictor.province] = {
+                "province": predictor.province,
+                "predictions": [
+                    {"year": start_year + step, "gdp": round(float(value), 2)}
+                    for step, value in enumerate(row)
+                ]
+            }
+
+    return {
+        "years": sorted({item["year"] for result in predictions.values() for item in result["predictions"]}),
+        # 按请求的省份顺序输出
+        "predictions": [predictions[province] for province in provinces if province in predictions],
+        "errors": errors,
+    }
+
+
+def predict_all_provinces(provinces=None) -> dict:
+    """
+    一次预测多个省份 (默认数据集)，使用训练时的归一化参数
+    :return: {'years': 预测年份, 'predictions': [与 predict_gdp 相同格式的结果], 'errors': {省份: 错误信息}}
+    """
+    provinces = provinces or PROVINCES
+    panel = data_setup.load_panel(DATA_DIR)
+    errors = {province: "数据中没有该省份" for province in provinces if province not in panel['provinces']}
+    provinces = [province for province in provinces if province not in errors]
+    index = [panel['provinces'].index(province) for province in provinces]
+    return _predict_batch(panel['values'][:, index, :], provinces, errors=errors)
+
+
+def read_upload_table(stream, provinces=None) -> pd.DataFrame:
+    """只解析上传 CSV 中属于 provinces (默认全部省份) 的列，其余列 (如 "全国") 不读入"""
+    wanted = set(provinces or PROVINCES)
+    return pd.read_csv(stream, usecols=lambda column: column in wanted, dtype=np.float64)
+
+
+def predict_custom_all(tables, provinces=None) -> dict:
+    """
+    用一次上传的四个表格预测其中的全部省份：所有省份的数据一次归一化 (与 predict_custom 一样按上传数据自身的范围)，
+    一次批量推理。只在部分文件中出现或含缺失值的省份放在 errors 中。
+    :param tables: 四个特征的 DataFrame (顺序同 data_setup.FEATURE_COLUMNS)，列为省份，最新的年份在第一行
+    :param provinces: 只预测这些省份，默认为上传文件中出现的全部省份
+    :return: 与 predict_all_provinces 相同格式
+    """
+    lengths = [len(table) for table in tables]
+    if len(set(lengths)) != 1:
+        raise ValueError(f"四个文件的年份数不一致: {lengths}")
+
+    columns = [set(table.columns) for table in tables]
+    present = set.union(*columns)
+    if provinces:
+        wanted = list(provinces)
+    else:
+        wanted = [province for province in PROVINCES if province in present]
+    errors = {}
+    for province in wanted:
+        missing = [feature for feature, cols in zip(data_setup.FEATURE_COLUMNS, columns) if province not in cols]
+        if missing:
+            errors[province] = f"上传文件缺少该省份: {missing}"
+    available = [province for province in wanted if province not in errors]
+    if not available:
+        raise ValueError("上传文件中没有可预测的省份")
+
+    # (年份, 省份, 特征)，翻转为从远到近
+    values = np.stack([table[available].to_numpy(dtype=np.float64) for table in tables], axis=-1)[::-1]
+    incomplete = np.isnan(values).any(axis=(0, 2))
+    for province, bad in zip(available, incomplete):
+        if bad:
+            errors[province] = "自定义数据包含缺失值"
+    if incomplete.any():
+        available = [province for province, bad in zip(available, incomplete) if not bad]
+        values = values[:, ~incomplete, :]
+
+    # 沿年份轴一次算出所有省份的归一化参数，形状 (省份, 特征)
+    scalers = data_setup.fit_minmax(values, axis=0)
+    return _predict_batch(values, available, scalers, errors)
+
+
+def _scenario_factors(scenarios, window_size: int, samples: int, seed: int):
+    """
+    把情景定义展开为逐样本的乘数
+    每个情景: {'name': 名称, 'changes': {特征: 相对变化}, 'last_years': 变化作用于窗口中最近的几年 (默认 1)}，
+    相对变化为数字 (如 0.05 表示 +5%) 或 [下限, 上限] (在区间内均匀抽取 samples 个样本)
+    :return: (情景名称, 各情景的样本数, 乘数 (样本总数, 窗口, 特征))
+    """
+    rng = np.random.default_rng(seed)
+    names, counts, blocks = [], [], []
+    for i, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict):
+            raise ValueError(f"第 {i + 1} 个情景格式错误，应为对象")
+        name = str(scenario.get('name') or f"情景{i + 1}")
+        changes = scenario.get('changes') or {}
+        unknown = sorted(set(changes) - set(SCENARIO_FEATURES))
+        if unknown:
+            raise ValueError(f"{name}: 不支持的特征 {unknown}，可选 {list(SCENARIO_FEATURES)}")
+        try:
+            last_years = int(scenario.get('last_years', 1))
+        except (TypeError, ValueError):
+            raise ValueError(f"{name}: last_years 应为整数")
+        if not 1 <= last_years <= window_size:
+            raise ValueError(f"{name}: last_years 应在 1 到 {window_size} 之间")
+
+        ranged = any(isinstance(change, (list, tuple)) for change in changes.values())
+        count = samples if ranged else 1
+        factors = np.ones((count, window_size, INPUT_FEATURE_SIZE))
+        for feature, change in changes.items():
+            try:
+                if isinstance(change, (list, tuple)):
+                    low, high = (float(value) for value in change)
+                    values = rng.uniform(min(low, high), max(low, high), size=count)
+                else:
+                    values = np.full(count, float(change))
+            except (TypeError, ValueError):
+                raise ValueError(f"{name}: {feature} 的变化应为数字或 [下限, 上限]")
+            if (values <= -1).any():
+                raise ValueError(f"{name}: {feature} 的变化必须大于 -100%")
+            factors[:, -last_years:, SCENARIO_FEATURES[feature]] = 1 + values[:, np.newaxis]
+        names.append(name)
+        counts.append(count)
+        blocks.append(factors)
+    return names, counts, np.concatenate(blocks)
+
+
+def _distribution(rows: np.ndarray) -> dict:
+    """rows 形状 (样本, 预测步数)，返回各预测年份的均值和分位数"""
+    summary = {"mean": [round(float(value), 2) for value in rows.mean(axis=0)]}
+    for q, values in zip(SCENARIO_PERCENTILES, np.percentile(rows, SCENARIO_PERCENTILES, axis=0)):
+        summary[f"p{q}"] = [round(float(value), 2) for value in values]
+    return summary
+
+
+def run_scenarios(scenarios, provinces=None, samples=DEFAULT_SCENARIO_SAMPLES, seed=0) -> dict:
+    """
+    情景分析：按情景调整默认数据集最后一个窗口的人口、消费、财政支出，
+    全部情景 × 样本 × 省份的输入窗口拼成一个张量，有合并模型时一次 session.run 完成推理。
+    同一个样本下所有省份使用相同的调整幅度，因此可以汇总出全国合计的分布。
+    :return: {'years', 'baseline': {省份: 不调整时的预测}, 'scenarios': [每个情景的分布], 'errors'}
+    """
+    if not scenarios:
+        raise ValueError("至少需要一个情景")
+    if not 1 <= samples <= MAX_SCENARIO_SAMPLES:
+        raise ValueError(f"samples 应在 1 到 {MAX_SCENARIO_SAMPLES} 之间")
+    provinces = provinces or PROVINCES
+    panel = data_setup.load_panel(DATA_DIR)
+    predictors, errors = [], {}
+    for province in provinces:
+        try:
+            predictors.append(_current_predictor(province))
         except Exception as e:
-            # print(f"预加载 {p} 失败: {e}")
+            errors[province] = str(e)
+
+    groups = {}
+    for predictor in predictors:
+        groups.setdefault((predictor.window_size, predictor.predict_steps), []).append(predictor)
+
+    names, counts = None, None
+    baseline, sampled = {}, {}
+    for (window_size, predict_steps), group in groups.items():
+        names, counts, factors = _scenario_factors(scenarios, window_size, samples, seed)
+        if len(factors) > MAX_SCENARIO_SAMPLES:
+            raise ValueError(f"全部情景的抽样总数 {len(factors)} 超过上限 {MAX_SCENARIO_SAMPLES}")
+        # 第 0 个样本不做调整，作为基准
+        factors = np.concatenate([np.ones((1,) + factors.shape[1:]), factors])
+
+        index = [panel['provinces'].index(predictor.province) for predictor in group]
+        scaler = {
+            key: np.stack([predictor.model_scaler[key] for predictor in group])
+            for key in ('min', 'scale')
+        }
+        # (省份, 窗口, 特征) × (样本, 窗口, 特征) -> (省份, 样本, 窗口, 特征)，一次完成调整和归一化
+        raw = panel['values'][-window_size:, index, :].transpose(1, 0, 2)
+        windows = raw[:, np.newaxis] * factors[np.newaxis]
+        windows = windows * scaler['scale'][:, np.newaxis, np.newaxis] + scaler['min'][:, np.newaxis, np.newaxis]
+        outputs = _run_group(group, windows.astype(np.float32))
+
+        # 只对 GDP 列做反变换，形状 (省份, 样本, 预测步数)
+        gdp = ((outputs - scaler['min'][:, np.newaxis, GDP_COL_INDEX, np.newaxis])
+               / scaler['scale'][:, np.newaxis, GDP_COL_INDEX, np.newaxis])
+        for predictor, rows in zip(group, gdp):
+            baseline[predictor.province] = [round(float(value), 2) for value in rows[0]]
+            sampled[predictor.province] = rows[1:]
+
+    predicted = [province for province in provinces if province in sampled]
+    results = []
+    if predicted:
+        # 全国合计: 同一样本下各省份预测值之和，形状 (样本总数, 预测步数)
+        total = np.sum([sampled[province] for province in predicted], axis=0)
+        offsets = np.cumsum([0] + counts)
+        for name, count, start, end in zip(names, counts, offsets[:-1], offsets[1:]):
+            results.append({
+                "name": name,
+                "samples": count,
+                "total": _distribution(total[start:end]),
+                "provinces": [
+                    {"province": province, **_distribution(sampled[province][start:end])}
+                    for province in predicted
+                ],
+            })
+
+    start_year = panel['years'][-1] + 1
+    steps = len(next(iter(baseline.values()))) if baseline else 0
+    return {
+        "years": list(range(start_year, start_year + steps)),
+        "baseline": {province: baseline[province] for province in predicted},
+        "scenarios": results,
+        "errors": errors,
+    }
+
+
+def _bootstrap_windows(values: np.ndarray, window_size: int, samples: int, rng) -> np.ndarray:
+    """
+    自助法扰动输入窗口：从该省份历年增长率的离差 (减去平均增长率) 中有放回地抽取，作为窗口中每一年的观测误差。
+    同一年的四个特征使用同一历史年份的离差，保留特征之间的相关性。
+    :param values: (年份, 省份, 特征) 原始数据
+    :return: (省份, 1 + samples, 窗口, 特征)，第 0 个为未扰动的窗口
+    """
+    positive = np.where(values > 0, values, np.nan)
+    growth = np.diff(np.log(positive), axis=0)
+    # 非正数无法计算增长率，对应的特征不扰动
+    residuals = np.nan_to_num(growth - np.nanmean(growth, axis=0))
+    window = values[-window_size:].transpose(1, 0, 2)
+    num_provinces = window.shape[0]
+    # 每个省份、样本、窗口年份各抽取一个历史年份，形状 (省份, 样本, 窗口)
+    draws = rng.integers(0, len(residuals), size=(num_provinces, samples, window_size))
+    noise = residuals[draws, np.arange(num_provinces)[:, np.newaxis, np.newaxis]]
+    return np.concatenate([window[:, np.newaxis], window[:, np.newaxis] * np.exp(noise)], axis=1)
+
+
+def predict_with_intervals(provinces=None, level=DEFAULT_INTERVAL_LEVEL, bootstrap=DEFAULT_BOOTSTRAP, seed=0) -> dict:
+    """
+    预测均值和预测区间：种子集成的全部副本 × 自助抽样的输入窗口拼成一个张量，一次 session.run 完成，
+    耗时不随副本数成倍增加。没有 (或已过期) 集成模型时只使用主模型，区间只反映输入扰动。
+    :param level: 预测区间的置信水平，如 0.9 表示 5%-95% 分位数
+    :param bootstrap: 每个省份自助抽样的输入窗口数 (另加一个未扰动的窗口)
+    :return: {'years', 'samples', 'level', 'predictions': [{'province', 'replicas', 'predictions': [{'year', 'gdp', 'lower', 'upper'}]}], 'errors'}
+             replicas 为该省份使用的集成副本数，只用主模型的省份为 1
+    """
+    if not 0 < level < 1:
+        raise ValueError("level 应在 0 到 1 之间")
+    if not 0 <= bootstrap <= MAX_BOOTSTRAP:
+        raise ValueError(f"bootstrap 应在 0 到 {MAX_BOOTSTRAP} 之间")
+    provinces = provinces or PROVINCES
+    panel = data_setup.load_panel(DATA_DIR)
+    predictors, errors = [], {}
+    for province in provinces:
+        try:
+            predictors.append(_current_predictor(province))
+        except Exception as e:
+            errors[province] = str(e)
+
+    groups = {}
+    for predictor in predictors:
+        groups.setdefault((predictor.window_size, predictor.predict_steps), []).append(predictor)
+
+    ensemble = get_ensemble_model()
+    rng = np.random.default_rng(seed)
+    quantiles = (100 * (1 - level) / 2, 100 * (1 + level) / 2)
+    start_year = panel['years'][-1] + 1
+    predictions = {}
+    for (window_size, predict_steps), group in groups.items():
+        index = [panel['provinces'].index(predictor.province) for predictor in group]
+        scaler = {
+            key: np.stack([predictor.model_scaler[key] for predictor in group])
+            for key in ('min', 'scale')
+        }
+        # (省份, 样本, 窗口, 特征)
+        windows = _bootstrap_windows(panel['values'][:, index, :], window_size, bootstrap, rng)
+        # ONNX 模型的输入为 float32，各省份模型的回退路径直接把窗口传给 session.run
+        windows = (windows * scaler['scale'][:, np.newaxis, np.newaxis]
+                   + scaler['min'][:, np.newaxis, np.newaxis]).astype(np.float32)
+
+        names = [predictor.province for predictor in group]
+        if (ensemble is not None and all(name in ensemble.provinces for name in names)
+                and (ensemble.window_size, ensemble.predict_steps) == (window_size, predict_steps)):
+            outputs = ensemble.run(windows, names).astype(np.float64)
+        else:
+            outputs = _run_group(group, windows)[:, np.newaxis]
+        replicas = outputs.shape[1]
+
+        # 只对 GDP 列做反变换，全部副本和样本合并为一个分布，形状 (省份, 副本 × 样本, 预测步数)
+        gdp = ((outputs - scaler['min'][:, np.newaxis, np.newaxis, GDP_COL_INDEX, np.newaxis])
+               / scaler['scale'][:, np.newaxis, np.newaxis, GDP_COL_INDEX, np.newaxis])
+        gdp = gdp.reshape(len(group), -1, predict_steps)
+        mean = gdp.mean(axis=1)
+        lower, upper = np.percentile(gdp, quantiles, axis=1)
+        for i, name in enumerate(names):
+            predictions[name] = {
+                "province": name,
+                "replicas": replicas,
+                "predictions": [
+                    {"year": start_year + step, "gdp": round(float(mean[i, step]), 2),
+                     "lower": round(float(lower[i, step]), 2), "upper": round(float(upper[i, step]), 2)}
+                    for step in range(predict_steps)
+                ]
+            }
+
+    return {
+        "years": sorted({item["year"] for result in predictions.values() for item in result["predictions"]}),
+        "samples": bootstrap + 1,
+        "level": level,
+        "predictions": [predictions[province] for province in provinces if province in predictions],
+        "errors": errors,
+    }
+
+
+def invalidate_result_versions():
+    """丢弃缓存的数据版本和模型 (含合并模型、集成模型) 的检查时间，下次查询时立即重新检查 (ingest/update/train 修改文件之后调用)"""
+    with _result_lock:
+        _data_version.update(value=None, checked_at=0.0)
+        _model_checked_at.clear()
+        _shared_model_versions.clear()
+
+
+def _current_data_version() -> str:
+    """数据版本，距上次检查不超过 RESULT_VERSION_TTL 时直接返回上次的结果"""
+    now = time.monotonic()
+    with _result_lock:
+        if _data_version["value"] is not None and now - _data_version["checked_at"] < RESULT_VERSION_TTL:
+            return _data_version["value"]
+    version = data_setup.data_version(DATA_DIR)
+    with _result_lock:
+        _data_version.update(value=version, checked_at=now)
+    return version
+
+
+def _current_predictor(province: str) -> GDPPredictorService:
+    """
+    返回缓存的预测器；模型文件在加载之后被覆盖，或合并模型在加载之后导出 (或过期) 时丢弃旧的 session 重新加载。
+    距上次检查不超过 RESULT_VERSION_TTL 时不重新计算模型校验值
+    """
+    global _combined_model
+    predictor = get_predictor_service(province)
+    now = time.monotonic()
+    with _result_lock:
+        checked_at = _model_checked_at.get(province)
+        if checked_at is not None and now - checked_at < RESULT_VERSION_TTL:
+            return predictor
+    reload = True
+    if model_checksum(predictor) != predictor.model_checksum:
+        print(f"🔄 {province} 的模型文件已更新，重新加载")
+        if predictor.combined is not None:
+            _combined_model = None
+    elif predictor.combined is not province_combined_model(province, predictor.variant):
+        print(f"🔄 {province} 的合并模型已导出或过期，重新加载")
+    else:
+        reload = False
+    if reload:
+        _predictors_cache.discard(province)
+        predictor = get_predictor_service(province)
+    with _result_lock:
+        _model_checked_at[province] = now
+    return predictor
+
+
+def _store_results(result: dict, keys: dict):
+    """
+    :param keys: {省份: (模型校验值, 数据版本)}，推理之前查询时取得的键；
+                 推理期间文件发生变化时缓存记录的是旧的键，下次查询会重新计算
+    """
+    entries = {}
+    for prediction in result['predictions']:
+        province = prediction['province']
+        key = keys.get(province)
+        if key is None:
+            continue
+        etag = hashlib.sha256(json.dumps([province, *key]).encode('utf-8')).hexdigest()[:32]
+        entries[province] = (key, prediction, etag)
+    with _result_lock:
+        _result_cache.update(entries)
+
+
+def get_default_prediction(province: str) -> tuple[dict, str]:
+    """
+    默认数据集的预测结果 (与 predict_gdp 格式相同) 及其 ETag。
+    结果只取决于模型文件和数据，二者都未变化时直接返回缓存，否则重新推理。
+    模型和数据的检查结果在 RESULT_VERSION_TTL 内复用，文件更新后最多这么久才会反映到结果中
+    (或调用 invalidate_result_versions 立即生效)
+    """
+    predictor = _current_predictor(province)
+    # 先取数据版本再读面板：期间数据被修改时缓存记录的是旧版本，下次查询会重新计算
+    key = (predictor.model_checksum, _current_data_version())
+    with _result_lock:
+        cached = _result_cache.get(province)
+        if cached is not None and cached[0] == key:
+            _result_stats["hits"] += 1
+            return cached[1], cached[2]
+        _result_stats["misses"] += 1
+
+    result = predict_all_provinces([province])
+    if province in result['errors']:
+        raise RuntimeError(result['errors'][province])
+    _store_results(result, {province: key})
+    with _result_lock:
+        _, prediction, etag = _result_cache[province]
+    return prediction, etag
+
+
+def warm_prediction_cache(provinces=None) -> int:
+    """一次批量推理填充默认数据集的预测结果缓存，返回缓存的省份数"""
+    provinces = provinces or PROVINCES
+    version = _current_data_version()
+    keys = {}
+    for province in provinces:
+        try:
+            keys[province] = (_current_predictor(province).model_checksum, version)
+        except Exception:
+            # 无法加载的省份由 predict_all_provinces 放在 errors 中
             pass
+    result = predict_all_provinces(provinces)
+    _store_results(result, keys)
+    return len(result['predictions'])
+
+
+def _preload(provinces):
+    _preload_state.update(status="running", loaded=0, failed=0)
+    for p in provinces:
+        try:
+            get_predictor_service(p)
+            _preload_state["loaded"] += 1
+        except Exception as e:
+            _preload_state["failed"] += 1
+            print(f"预加载 {p} 失败: {e}")
+    try:
+        count = warm_prediction_cache(provinces)
+        print(f"✅ 已缓存 {count} 个省份的预测结果")
+    except Exception as e:
+        print(f"❌ 预测结果缓存填充失败: {e}")
+    _preload_state["status"] = "done"
+
+
+# 启动时预加载模型 (可选，加速首次请求)
+def preload_all_models(background=False):
+    """
+    预加载省份模型，数量不超过缓存上限，避免预加载时就开始淘汰
+    :param background: 在后台线程中加载并立即返回线程，服务可以先开始接收请求；
+                       尚未加载的省份在首次请求时按需加载 (与预加载线程不会重复构建)
+    """
+    provinces = PROVINCES[:_predictors_cache.max_size]
+    if not background:
+        _preload(provinces)
+        return None
+    thread = threading.Thread(target=_preload, args=(provinces,), name="preload-models", daemon=True)
+    thread.start()
+    return thread
@@ -83,8 +83,81 @@ def save_analysis_result(gdf, year):
         return False
 
 
-def perform_real_spatial_analysis():
-    """核心分析函数：使用真实数据进行空间分析"""
+def analyze_year(gdf_base, df_db, year_col):
+    """对一个年份列做全局 Moran's I、LISA 和 Gi* 分析并保存结果"""
+    try:
+        # 合并数据
+        gdf_merged = gdf_base.merge(
+            df_db[[CFG["join_key_db"], year_col]],
+            left_on=CFG["join_key_shp"],
+            right_on=CFG["join_key_db"],
+            how='inner'
+        )
+
+        # 清理GDP数据
+        gdf_merged["gdp"] = pd.to_numeric(gdf_merged[year_col], errors="coerce")
+        gdf_merged = gdf_merged[gdf_merged["gdp"].notna()].copy()
+
+        if len(gdf_merged) < 5:
+            return False
+
+        # 转换为投影坐标系进行计算
+        gdf_projected = gdf_merged.to_crs(epsg=3857)
+
+        # 空间权重矩阵 - 固定 K=4 近邻
+        k = min(4, len(gdf_projected) - 1)
+        w = KNN.from_dataframe(gdf_projected, k=k)
+        w.transform = "r"
+
+        y = gdf_projected["gdp"].values
+
+        # 全局Moran's I
+        moran = Moran(y, w, permutations=CFG["perm"])
+
+        # LISA分析
+        lisa = Moran_Local(y, w, permutations=CFG["perm"])
+        gdf_projected["lisa_I"] = lisa.Is
+        gdf_projected["lisa_p"] = lisa.p_sim
+        gdf_projected["lisa_q"] = lisa.q
+
+        # Gi*热点分析
+        gi = G_Local(y, w, permutations=CFG["perm"])
+        gdf_projected["gi_z"] = gi.Zs
+        gdf_projected["gi_p"] = gi.p_sim
+
+        # 转回地理坐标系
+        gdf_result = gdf_projected.to_crs(epsg=4326)
+
+        # 添加分类标签
+        lisa_labels = {1: "高-高聚类", 2: "低-低聚类", 3: "高-低异常", 4: "低-高异常"}
+        gdf_result["lisa_type"] = gdf_result["lisa_q"].map(lisa_labels)
+
+        def classify_gi(row):
+            if pd.isna(row["gi_p"]) or row["gi_p"] >= 0.05:
+                return "不显著"
+            elif row["gi_z"] > 0:
+                return "热点"
+            else:
+                return "冷点"
+
+        gdf_result["gi_type"] = gdf_result.apply(classify_gi, axis=1)
+        gdf_result["analysis_year"] = year_col
+        gdf_result["moran_I"] = moran.I
+        gdf_result["moran_p"] = moran.p_sim
+
+        return save_analysis_result(gdf_result, year_col)
+
+    except Exception as e:
+        print(f"{year_col} 处理失败: {e}")
+        return False
+
+
+def perform_real_spatial_analysis(years=None, df_db=None):
+    """
+    核心分析函数：使用真实数据进行空间分析
+    :param years: 只分析这些年份列 (如 ['2025年'])，结果并入已有的年份列表；默认重新分析全部年份
+    :param df_db: 地区 + 年份列的数据表，默认从数据库读取
+    """
     print("开始真实数据空间分析（优化版）...")
 
     try:
@@ -97,89 +170,30 @@ def perform_real_spatial_analysis():
         gdf_base = gpd.read_file(shp_file)
 
         # 2. 读取数据库真实数据
-        df_db = get_database_data()
+        if df_db is None:
+            df_db = get_database_data()
         if df_db is None or len(df_db) == 0:
             print("无法获取数据库数据")
             return False
 
         # 3. 检测年份列
         year_columns = detect_year_columns(df_db)
+        if years is not None:
+            year_columns = [col for col in year_columns if col in years]
         if not year_columns:
             print("未找到有效的年份列")
             return False
 
-        successful_years = []
-
         # 4. 处理每个年份
-        for year_col in year_columns:
-            try:
-                # 合并数据
-                gdf_merged = gdf_base.merge(
-                    df_db[[CFG["join_key_db"], year_col]],
-                    left_on=CFG["join_key_shp"],
-                    right_on=CFG["join_key_db"],
-                    how='inner'
-                )
-
-                # 清理GDP数据
-                gdf_merged["gdp"] = pd.to_numeric(gdf_merged[year_col], errors="coerce")
-                gdf_merged = gdf_merged[gdf_merged["gdp"].notna()].copy()
-
-                if len(gdf_merged) < 5:
-                    continue
-
-                # 转换为投影坐标系进行计算
-                gdf_projected = gdf_merged.to_crs(epsg=3857)
-
-                # 空间权重矩阵 - 固定 K=4 近邻
-                k = min(4, len(gdf_projected) - 1)
-                w = KNN.from_dataframe(gdf_projected, k=k)
-                w.transform = "r"
-
-                y = gdf_projected["gdp"].values
-                
-                # 全局Moran's I
-                moran = Moran(y, w, permutations=CFG["perm"])
-                
-                # LISA分析
-                lisa = Moran_Local(y, w, permutations=CFG["perm"])
-                gdf_projected["lisa_I"] = lisa.Is
-                gdf_projected["lisa_p"] = lisa.p_sim
-                gdf_projected["lisa_q"] = lisa.q
-
-                # Gi*热点分析
-                gi = G_Local(y, w, permutations=CFG["perm"])
-                gdf_projected["gi_z"] = gi.Zs
-                gdf_projected["gi_p"] = gi.p_sim
-
-                # 转回地理坐标系
-                gdf_result = gdf_projected.to_crs(epsg=4326)
-
-                # 添加分类标签
-                lisa_labels = {1: "高-高聚类", 2: "低-低聚类", 3: "高-低异常", 4: "低-高异常"}
-                gdf_result["lisa_type"] = gdf_result["lisa_q"].map(lisa_labels)
-
-                def classify_gi(row):
-                    if pd.isna(row["gi_p"]) or row["gi_p"] >= 0.05:
-                        return "不显著"
-                    elif row["gi_z"] > 0:
-                        return "热点"
-                    else:
-                        return "冷点"
-
-                gdf_result["gi_type"] = gdf_result.apply(classify_gi, axis=1)
-                gdf_result["analysis_year"] = year_col
-                gdf_result["moran_I"] = moran.I
-                gdf_result["moran_p"] = moran.p_sim
-
-                if save_analysis_result(gdf_result, year_col):
-                    successful_years.append(year_col)
-
-            except Exception as e:
-                print(f"{year_col} 处理失败: {e}")
-                continue
-
-        # 5. 保存年份列表
+        successful_years = [year_col for year_col in year_columns if analyze_year(gdf_base, df_db, year_col)]
+
+        # 5. 保存年份列表；只刷新部分年份时保留其他年份已有的结果
+        years_path = f"{CFG['out_dir']}/available_years.json"
+        if years is not None and os.path.exists(years_path):
+            with open(years_path, 'r', encoding='utf-8') as f:
+                previous_years = json.load(f).get("available_years", [])
+            successful_years = sorted(set(previous_years) | set(successful_years), reverse=True)
+
         years_data = {
             "available_years": successful_years,
             "total_count": len(successful_years),
@@ -187,7 +201,7 @@ def perform_real_spatial_analysis():
             "message": f"成功处理 {len(successful_years)} 个年份"
         }
 
-        with open(f"{CFG['out_dir']}/available_years.json", 'w', encoding='utf-8') as f:
+        with open(years_path, 'w', encoding='utf-8') as f:
             json.dump(years_data, f, ensure_ascii=False, indent=2)
 
         return True
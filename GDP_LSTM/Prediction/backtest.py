@@ -0,0 +1,210 @@
+import os
+import json
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+import torch
+from torch import nn
+
+import data_setup
+import engine
+import model_builder
+import registry
+import train
+import utils
+
+# 每个预测起点至少要有多少个训练窗口
+MIN_TRAIN_WINDOWS = 3
+
+
+def forecast_origins(num_years, window_size, predict_steps, min_train_windows=MIN_TRAIN_WINDOWS):
+    """
+    所有可回测的预测起点 o (年份索引)：只用 o 之前的年份训练，预测 o 到 o + predict_steps - 1 年
+    起点 o 的训练窗口数为 o - window_size - predict_steps + 1，预测的年份必须都有真实值
+    """
+    first = window_size + predict_steps - 1 + min_train_windows
+    last = num_years - predict_steps
+    return list(range(first, last + 1))
+
+
+def _cumulative_scaling(panel):
+    """
+    每个起点只用之前年份拟合 MinMaxScaler，等价于按年份累计的最小/最大值
+    :param panel: (省份, 年份, 特征) 原始数据
+    :return: data_min, data_range，形状都是 (省份, 年份, 特征)，第 t 年的值只用到 [0, t] 年
+    """
+    data_min = np.minimum.accumulate(panel, axis=1)
+    data_range = np.maximum.accumulate(panel, axis=1) - data_min
+    # 与 MinMaxScaler 一致，常数列不缩放
+    data_range[data_range == 0] = 1.0
+    return data_min, data_range
+
+
+def build_backtest_batch(panel, origins, hyperparams):
+    """
+    把 (起点 × 省份) 个模型的训练数据打包成 StackedSeq2Seq 的输入
+    :return: data_x (M, N, W, F), data_y (M, N, P, 1), forecast_x (M, 1, W, F), data_min, data_range
+             M = len(origins) * 省份数，模型 m 对应起点 origins[m // 省份数]、省份 m % 省份数
+    """
+    window_size = hyperparams['window_size']
+    predict_steps = hyperparams['predict_steps']
+    num_provinces = panel.shape[0]
+    data_min, data_range = _cumulative_scaling(panel)
+
+    # 各起点的训练窗口数不同；每轮的步数取最多的窗口数，窗口较少的模型循环使用自己的窗口，
+    # 避免补零样本产生的零梯度仍然推动 Adam 更新参数
+    num_windows = max(origins) - window_size - predict_steps + 1
+    data_x, data_y, forecast_x = [], [], []
+    for origin in origins:
+        # 用第 origin - 1 年的累计最小/最大值归一化，即只用起点之前的年份
+        scaled = (panel - data_min[:, origin - 1:origin]) / data_range[:, origin - 1:origin]
+        X, Y, _, _ = utils.create_training_sequences(scaled, window_size, predict_steps, train.GDP_COL_INDEX)
+        index = np.arange(num_windows) % (origin - window_size - predict_steps + 1)
+        data_x.append(X[:, index])
+        data_y.append(Y[:, index])
+        # 起点前最近 window_size 年作为预测输入
+        forecast_x.append(X[:, origin - window_size][:, np.newaxis])
+
+    data_x = np.concatenate(data_x)
+    data_y = np.concatenate(data_y)
+    forecast_x = np.concatenate(forecast_x)
+    # 预测结果反归一化所需的参数，形状 (M, F)
+    scale_index = np.repeat(np.asarray(origins) - 1, num_provinces)
+    province_index = np.tile(np.arange(num_provinces), len(origins))
+    return (data_x, data_y, forecast_x,
+            data_min[province_index, scale_index], data_range[province_index, scale_index])
+
+
+def run_backtest(provinces, hyperparams=None, min_train_windows=MIN_TRAIN_WINDOWS):
+    """
+    对一组超参数相同的省份做滚动回测，所有 (起点, 省份) 模型在一个 StackedSeq2Seq 中同时训练
+    :return: {省份: 回测结果}
+    """
+    hyperparams = hyperparams or train.current_hyperparams()
+    window_size = hyperparams['window_size']
+    predict_steps = hyperparams['predict_steps']
+    gdp = train.GDP_COL_INDEX
+
+    panel = data_setup.select_provinces(data_setup.load_panel(train.data_dir), provinces)
+    num_provinces, num_years, _ = panel.shape
+    origins = forecast_origins(num_years, window_size, predict_steps, min_train_windows)
+    if not origins:
+        raise ValueError(f"数据只有 {num_years} 年，不足以在窗口 {window_size}、预测 {predict_steps} 年、"
+                         f"至少 {min_train_windows} 个训练窗口的设置下回测")
+
+    data_x, data_y, forecast_x, data_min, data_range = build_backtest_batch(panel, origins, hyperparams)
+    print(f"回测: {num_provinces} 个省份 × {len(origins)} 个起点 = {len(data_x)} 个模型")
+
+    # 每个 (起点, 省份) 模型的初始参数都与逐省训练相同
+    initial = train.seeded_state_dict(hyperparams, hyperparams['seed'])
+    model = model_builder.StackedSeq2Seq.from_state_dicts(
+        [initial] * len(data_x),
+        input_size=hyperparams['input_feature_size'],
+        hidden_size=hyperparams['hidden_size'],
+        num_layers=hyperparams['num_layers'],
+        output_size=hyperparams['output_feature_size'],
+        predict_steps=predict_steps
+    ).to(train.device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=hyperparams['learning_rate'])
+    engine.train_stacked(
+        model,
+        data_x,
+        data_y,
+        nn.MSELoss(reduction='none'),
+        optimizer,
+        hyperparams['num_epochs'],
+        train.device,
+        batch_size=hyperparams['batch_size'],
+        verbose=False)
+
+    model.eval()
+    with torch.no_grad():
+        # (M, 1, P, 1) -> (M, P)
+        predicted = model(engine.to_tensor(forecast_x, train.device))[:, 0, :, 0].cpu().numpy()
+    predicted = predicted * data_range[:, gdp:gdp + 1] + data_min[:, gdp:gdp + 1]
+    predicted = predicted.reshape(len(origins), num_provinces, predict_steps)
+    actual = np.stack([panel[:, origin:origin + predict_steps, gdp] for origin in origins])
+
+    # 误差形状 (起点, 省份, 预测步)
+    error = predicted - actual
+    backtests = {}
+    for p, PROVINCE in enumerate(provinces):
+        err = error[:, p]
+        pct = np.abs(err / actual[:, p]) * 100
+        backtests[PROVINCE] = {
+            'hyperparams': {key: hyperparams[key] for key in
+                            ('hidden_size', 'num_layers', 'window_size', 'predict_steps',
+                             'batch_size', 'num_epochs', 'learning_rate', 'seed')},
+            'min_train_windows': min_train_windows,
+            'origins': [
+                {
+                    'origin_year': data_setup.FIRST_YEAR + origin,
+                    'train_years': [data_setup.FIRST_YEAR, data_setup.FIRST_YEAR + origin - 1],
+                    'years': [data_setup.FIRST_YEAR + origin + step for step in range(predict_steps)],
+                    'actual': actual[o, p].tolist(),
+                    'predicted': predicted[o, p].tolist(),
+                }
+                for o, origin in enumerate(origins)
+            ],
+            # 按预测步 (第 1 年、第 2 年...) 汇总，单位与 GDP 相同 (亿)，mape 为百分比
+            'horizon_mae': np.abs(err).mean(axis=0).tolist(),
+            'horizon_rmse': np.sqrt((err ** 2).mean(axis=0)).tolist(),
+            'horizon_mape': pct.mean(axis=0).tolist(),
+            'mae': float(np.abs(err).mean()),
+            'rmse': float(np.sqrt((err ** 2).mean())),
+            'mape': float(pct.mean()),
+        }
+    return backtests
+
+
+def backtest_provinces(provinces, manifest, min_train_windows=MIN_TRAIN_WINDOWS):
+    """按超参数把省份分组，每组一次批量回测，并写入各省份的训练指标 JSON"""
+    groups = {}
+    for PROVINCE in provinces:
+        # 与正式模型使用相同的超参数
+        hyperparams = registry.recorded_hyperparams(manifest, PROVINCE, train.current_hyperparams())
+        key = registry.hash_hyperparams(hyperparams)
+        groups.setdefault(key, (hyperparams, []))[1].append(PROVINCE)
+
+    backtests = {}
+    for hyperparams, members in groups.values():
+        start = timer()
+        backtests.update(run_backtest(members, hyperparams, min_train_windows))
+        print(f"✅ {len(members)} 个省份回测完成，耗时 {timer() - start:.1f} 秒")
+
+    for PROVINCE in provinces:
+        save_backtest(manifest, PROVINCE, backtests[PROVINCE])
+    return backtests
+
+
+def save_backtest(manifest, PROVINCE, backtest):
+    """把回测结果写入 {省份}_training_metrics.json 的 backtest 字段"""
+    metrics_path = os.path.join(train.MODEL_PATH, f"{PROVINCE}_training_metrics.json")
+    if not os.path.exists(metrics_path):
+        print(f"❌ {PROVINCE} 没有训练指标文件，回测结果未保存，请先训练该省份")
+        return
+    with open(metrics_path, 'r', encoding='utf-8') as f:
+        metrics_payload = json.load(f)
+    metrics_payload['backtest'] = backtest
+    with open(metrics_path, 'w', encoding='utf-8') as f:
+        json.dump(metrics_payload, f, ensure_ascii=False, indent=2)
+    # 指标文件是清单记录的产物之一，更新校验值，避免该省份被判定为过期
+    if registry.refresh_artifact(manifest, PROVINCE, 'metrics', metrics_path):
+        registry.save_manifest(manifest, train.MODEL_PATH)
+    print(f"✅ {PROVINCE} 回测 MAE: {backtest['mae']:.2f} 亿, MAPE: {backtest['mape']:.2f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="滚动回测：每个起点只用之前的年份训练，评估之后几年的预测误差")
+    parser.add_argument('--provinces', nargs='*', default=None, help="只回测指定省份，默认全部省份")
+    parser.add_argument('--min-train-windows', type=int, default=MIN_TRAIN_WINDOWS,
+                        help="第一个预测起点至少需要的训练窗口数")
+    args = parser.parse_args()
+
+    manifest = registry.load_manifest(train.MODEL_PATH)
+    backtest_provinces(args.provinces or train.PROVINCES, manifest, args.min_train_windows)
+
+
+if __name__ == "__main__":
+    main()
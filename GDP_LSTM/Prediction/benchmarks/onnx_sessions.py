@@ -0,0 +1,113 @@
+"""
+ONNX Runtime session 基准测试：默认参数创建 session vs create_session (共享线程池 + 图优化缓存)
+
+每种配置在独立的子进程中运行 (全局线程池只能在进程内第一个 session 创建前设置)，
+记录创建全部省份 session 的耗时、进程线程数和单次推理延迟。
+
+运行: python benchmarks/onnx_sessions.py [--repeat 2000] [--combined]
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+from timeit import default_timer as timer
+
+import numpy as np
+
+prediction_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, prediction_dir)
+sys.path.insert(0, os.path.join(prediction_dir, "backend_api"))
+
+# (名称, 说明)
+VARIANTS = [
+    ('default', "默认 SessionOptions (修改前)"),
+    ('tuned-cold', "create_session，无优化缓存"),
+    ('tuned-warm', "create_session，读取优化缓存"),
+]
+
+
+def thread_count() -> int:
+    """进程的线程数 (包括 ONNX Runtime 的原生线程)，只在 Linux 上可用"""
+    try:
+        return len(os.listdir('/proc/self/task'))
+    except OSError:
+        return -1
+
+
+def run_variant(variant: str, cache_dir: str, repeat: int, combined: bool) -> dict:
+    import onnxruntime
+    import gdp_onnx_service as service
+    import registry
+
+    service.ORT_CACHE_DIR = cache_dir
+    if combined:
+        paths = [os.path.join(service.MODEL_DIR, f"{registry.COMBINED_MODEL_NAME}.onnx")]
+    else:
+        paths = [os.path.join(service.MODEL_DIR, f"{province}_seq2seq_gdp_model.onnx")
+                 for province in service.PROVINCES]
+
+    start = timer()
+    if variant == 'default':
+        sessions = [onnxruntime.InferenceSession(path) for path in paths]
+    else:
+        sessions = [service.create_session(path) for path in paths]
+    startup_ms = (timer() - start) * 1e3
+
+    rng = np.random.default_rng(0)
+    if combined:
+        feeds = [{'input': rng.random((1, 1, 6, 4), dtype=np.float32),
+                  'province_index': np.array([i], dtype=np.int64)} for i in range(len(service.PROVINCES))]
+        calls = [(sessions[0], feed) for feed in feeds]
+    else:
+        calls = [(session, {'input': rng.random((1, 6, 4), dtype=np.float32)}) for session in sessions]
+
+    # 预热
+    for session, feed in calls:
+        session.run(None, feed)
+    latencies = []
+    for i in range(repeat):
+        session, feed = calls[i % len(calls)]
+        start = timer()
+        session.run(None, feed)
+        latencies.append((timer() - start) * 1e6)
+    return {
+        'startup_ms': startup_ms,
+        'threads': thread_count(),
+        'p50_us': float(np.percentile(latencies, 50)),
+        'p95_us': float(np.percentile(latencies, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX Runtime session 基准测试")
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--combined', action='store_true', help="使用合并模型 (train.py --export-combined)")
+    parser.add_argument('--variant', help=argparse.SUPPRESS)
+    parser.add_argument('--cache-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.cache_dir, args.repeat, args.combined)))
+        return
+
+    cache_dir = tempfile.mkdtemp(prefix='ort_cache_')
+    try:
+        print(f"{'配置':<12} {'启动(ms)':>10} {'线程数':>8} {'p50(us)':>10} {'p95(us)':>10}  说明")
+        for variant, description in VARIANTS:
+            cmd = [sys.executable, os.path.abspath(__file__), '--variant', variant,
+                   '--cache-dir', cache_dir, '--repeat', str(args.repeat)]
+            if args.combined:
+                cmd.append('--combined')
+            output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{variant:<12} {result['startup_ms']:>10.1f} {result['threads']:>8} "
+                  f"{result['p50_us']:>10.1f} {result['p95_us']:>10.1f}  {description}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
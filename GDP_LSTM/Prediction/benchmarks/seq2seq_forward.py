@@ -0,0 +1,61 @@
+"""
+Seq2Seq 前向传播基准测试：融合解码器 vs 原始逐步调用 nn.LSTM 的解码器
+
+运行: python benchmarks/seq2seq_forward.py [--repeat 200] [--batch-sizes 1 4 16 64 256 1024]
+"""
+import os
+import sys
+import argparse
+from timeit import default_timer as timer
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import model_builder
+import train
+
+
+def time_forward(model, x, repeat):
+    with torch.inference_mode():
+        # 预热
+        for _ in range(5):
+            model(x)
+        start = timer()
+        for _ in range(repeat):
+            model(x)
+    return (timer() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seq2Seq 前向传播基准测试")
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--batch-sizes', type=int, nargs='*', default=[1, 4, 16, 64, 256, 1024])
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    torch.manual_seed(train.SEED)
+    model = model_builder.Seq2Seq(
+        input_size=train.INPUT_FEATURE_SIZE,
+        hidden_size=train.HIDDEN_SIZE,
+        num_layers=train.NUM_LAYERS,
+        output_size=train.OUTPUT_FEATURE_SIZE,
+        predict_steps=train.PREDICT_STEPS
+    ).eval()
+
+    print(f"{'batch':>6} {'原始(us)':>12} {'融合(us)':>12} {'加速比':>8} {'最大误差':>12}")
+    for batch_size in args.batch_sizes:
+        x = torch.rand(batch_size, train.WINDOW_SIZE, train.INPUT_FEATURE_SIZE)
+        model.fused_decoder = False
+        loop_us = time_forward(model, x, args.repeat)
+        with torch.inference_mode():
+            expected = model(x)
+        model.fused_decoder = True
+        fused_us = time_forward(model, x, args.repeat)
+        with torch.inference_mode():
+            max_err = (model(x) - expected).abs().max().item()
+        print(f"{batch_size:>6} {loop_us:>12.1f} {fused_us:>12.1f} {loop_us / fused_us:>7.2f}x {max_err:>12.2e}")
+
+
+if __name__ == "__main__":
+    main()
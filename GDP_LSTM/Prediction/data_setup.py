@@ -1,42 +1,299 @@
 import os
+import json
+import struct
+import hashlib
+import argparse
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
 
 NUM_WORKERS = os.cpu_count()
 
+# 四个特征及其来源文件，每个文件的列为省份、行为年份 (最新的年份在第一行)
+FEATURE_COLUMNS = ['polulation', 'consumption', 'GDP', 'financial']
+FEATURE_FILES = ["YearPeople.csv", "YearXiaofei.csv", "YearGDP.csv", "YearFinancial.csv"]
+FEATURE_UNITS = ['万人', '亿元', '亿元', '亿元']
+# 文件最后一行对应的年份
+FIRST_YEAR = 2005
+
+# 默认数据目录 GDP_LSTM/data (相对于本文件，与运行时的当前目录无关)
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+# 训练和导入的省份 (各数据文件的列)
+PROVINCES = [
+    "北京市",
+    "天津市",
+    "上海市",
+    "重庆市",
+    "内蒙古自治区",
+    "广西壮族自治区",
+    "西藏自治区",
+    "宁夏回族自治区",
+    "新疆维吾尔自治区",
+    "河北省",
+    "山西省",
+    "辽宁省",
+    "吉林省",
+    "黑龙江省",
+    "江苏省",
+    "浙江省",
+    "安徽省",
+    "福建省",
+    "江西省",
+    "山东省",
+    "河南省",
+    "湖北省",
+    "湖南省",
+    "广东省",
+    "海南省",
+    "四川省",
+    "贵州省",
+    "云南省",
+    "陕西省",
+    "甘肃省",
+    "青海省"
+]
+
+# 面板的二进制快照，放在数据目录下，由 CSV 自动生成
+SNAPSHOT_NAME = "panel_snapshot.bin"
+SNAPSHOT_MAGIC = b'GDPPANEL'
+SNAPSHOT_VERSION = 1
+# 文件头之后的数组按 64 字节对齐
+SNAPSHOT_ALIGN = 64
+
+# 每个模型的归一化参数文件，与 ONNX 模型放在一起
+SCALER_SUFFIX = "_scaler.json"
+
+# 每个进程缓存的面板数据: {数据目录: (各文件的修改时间和大小, 面板)}
+_PANEL_CACHE = {}
+
+
+def resolve_data_file(data_path: str, file_name: str) -> str:
+    """按文件名查找数据文件，忽略大小写 (如 Yearfinancial.csv / YearFinancial.csv)"""
+    path = os.path.join(data_path, file_name)
+    if os.path.exists(path):
+        return path
+    for name in os.listdir(data_path):
+        if name.lower() == file_name.lower():
+            return os.path.join(data_path, name)
+    raise FileNotFoundError(f"未找到数据文件: {path}")
+
+
+def _read_panel(paths) -> dict:
+    frames = [pd.read_csv(path) for path in paths]
+    provinces = frames[0].columns.tolist()
+    for path, frame in zip(paths, frames):
+        if sorted(frame.columns) != sorted(provinces) or len(frame) != len(frames[0]):
+            raise ValueError(f"{os.path.basename(path)} 的省份或年份数与 {os.path.basename(paths[0])} 不一致")
+    # 翻转行顺序，使年份从远到近；形状 (年份, 省份, 特征)
+    values = np.stack(
+        [frame[provinces].to_numpy(dtype=np.float64)[::-1] for frame in frames],
+        axis=-1
+    )
+    # 缓存的数组在多个调用方之间共享，设为只读防止被意外修改
+    values.flags.writeable = False
+    return {
+        'values': values,
+        'years': list(range(FIRST_YEAR, FIRST_YEAR + len(values))),
+        'provinces': provinces,
+        'features': list(FEATURE_COLUMNS),
+        'units': list(FEATURE_UNITS),
+    }
+
+
+def _source_stamps(paths) -> list:
+    """CSV 文件的修改时间和大小，用于判断缓存和快照是否过期"""
+    stamps = []
+    for path in paths:
+        stat = os.stat(path)
+        stamps.append({'file': os.path.basename(path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size})
+    return stamps
+
+
+def data_version(data_path: str) -> str:
+    """数据版本：由四个 CSV 的修改时间和大小计算，CSV 修改后改变 (与 load_panel 判断缓存过期的依据相同)"""
+    paths = [resolve_data_file(data_path, name) for name in FEATURE_FILES]
+    payload = json.dumps(_source_stamps(paths), sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def write_snapshot(panel: dict, snapshot_path: str, sources: list):
+    """
+    快照格式: 8 字节魔数 | uint32 版本 | uint32 文件头长度 | JSON 文件头 | 补齐到 64 字节 | float64 数组 (C 顺序)
+    文件头记录省份顺序、年份、特征、单位、数组形状以及生成快照时各 CSV 的修改时间和大小
+    """
+    values = np.ascontiguousarray(panel['values'], dtype='<f8')
+    header = json.dumps({
+        'provinces': panel['provinces'],
+        'years': panel['years'],
+        'features': panel['features'],
+        'units': panel['units'],
+        'shape': list(values.shape),
+        'dtype': '<f8',
+        'sources': sources,
+    }, ensure_ascii=False).encode('utf-8')
+    prefix = SNAPSHOT_MAGIC + struct.pack('<II', SNAPSHOT_VERSION, len(header))
+    padding = -(len(prefix) + len(header)) % SNAPSHOT_ALIGN
+
+    # 先写临时文件再替换，其他进程不会读到写了一半的快照
+    tmp_path = snapshot_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(prefix)
+        f.write(header)
+        f.write(b'\0' * padding)
+        f.write(values.tobytes())
+    os.replace(tmp_path, snapshot_path)
+
+
+def read_snapshot(snapshot_path: str):
+    """
+    以 mmap 方式打开快照，多个进程共享同一份页缓存
+    :return: (文件头, 面板)，文件不存在或格式不对时返回 (None, None)
+    """
+    if not os.path.exists(snapshot_path):
+        return None, None
+    with open(snapshot_path, 'rb') as f:
+        prefix = f.read(len(SNAPSHOT_MAGIC) + 8)
+        if len(prefix) < len(SNAPSHOT_MAGIC) + 8 or not prefix.startswith(SNAPSHOT_MAGIC):
+            return None, None
+        version, header_len = struct.unpack('<II', prefix[len(SNAPSHOT_MAGIC):])
+        if version != SNAPSHOT_VERSION:
+            return None, None
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    offset = len(prefix) + header_len
+    offset += -offset % SNAPSHOT_ALIGN
+    # mode='r' 得到只读数组
+    values = np.memmap(snapshot_path, dtype=header['dtype'], mode='r', offset=offset, shape=tuple(header['shape']))
+    panel = {
+        'values': values,
+        'years': header['years'],
+        'provinces': header['provinces'],
+        'features': header['features'],
+        'units': header['units'],
+    }
+    return header, panel
+
+
+def compile_snapshot(data_path: str) -> str:
+    """解析 CSV 并重新生成快照，返回快照路径"""
+    paths = [resolve_data_file(data_path, name) for name in FEATURE_FILES]
+    sources = _source_stamps(paths)
+    snapshot_path = os.path.join(data_path, SNAPSHOT_NAME)
+    write_snapshot(_read_panel(paths), snapshot_path, sources)
+    return snapshot_path
+
+
+def load_panel(data_path: str) -> dict:
+    """
+    读取全部省份、全部年份、全部特征的面板数据
+    优先 mmap 打开数据目录下的二进制快照；快照不存在或 CSV 已修改时解析 CSV 并重新生成快照。
+    结果在进程内缓存，CSV 修改后自动重新读取。
+    :return: {'values': (年份, 省份, 特征) 只读数组, 'years': 年份列表, 'provinces': 省份列表,
+              'features': 特征列名, 'units': 各特征单位, 'scalers': 各省份的归一化参数}
+    """
+    paths = [resolve_data_file(data_path, name) for name in FEATURE_FILES]
+    sources = _source_stamps(paths)
+    key = os.path.abspath(data_path)
+    cached = _PANEL_CACHE.get(key)
+    if cached is not None and cached[0] == sources:
+        return cached[1]
+
+    snapshot_path = os.path.join(data_path, SNAPSHOT_NAME)
+    header, panel = read_snapshot(snapshot_path)
+    if header is None or header['sources'] != sources:
+        panel = _read_panel(paths)
+        try:
+            write_snapshot(panel, snapshot_path, sources)
+        except OSError as e:
+            # 数据目录只读或快照正被其他进程占用 (Windows) 时，直接使用内存中的面板
+            print(f"警告: 写入面板快照失败，本次使用 CSV 解析结果: {e}")
+    # 沿年份轴一次算出所有省份的归一化参数，形状 (省份, 特征)
+    panel['scalers'] = fit_minmax(panel['values'], axis=0)
+    _PANEL_CACHE[key] = (sources, panel)
+    return panel
+
+
+def select_provinces(panel: dict, provinces) -> np.ndarray:
+    """从面板中取出指定省份，返回形状 (省份, 年份, 特征)"""
+    index = [panel['provinces'].index(province) for province in provinces]
+    return panel['values'][:, index, :].transpose(1, 0, 2)
+
+
+def fit_minmax(values, axis=0) -> dict:
+    """
+    计算与 MinMaxScaler(feature_range=(0, 1)) 相同的归一化参数: scaled = x * scale + min
+    对 (年份, 省份, 特征) 面板沿年份轴计算时，一次得到所有省份的参数，形状 (省份, 特征)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    data_min = values.min(axis=axis)
+    data_range = values.max(axis=axis) - data_min
+    # 与 sklearn 一致，近似常数的特征不缩放
+    data_range[data_range < 10 * np.finfo(data_range.dtype).eps] = 1.0
+    scale = 1.0 / data_range
+    return {'min': 0.0 - data_min * scale, 'scale': scale}
+
+
+def scale_transform(values, scaler: dict) -> np.ndarray:
+    """归一化，等价于 MinMaxScaler.transform"""
+    return np.asarray(values, dtype=np.float64) * scaler['scale'] + scaler['min']
+
+
+def scale_inverse(values, scaler: dict) -> np.ndarray:
+    """反归一化，等价于 MinMaxScaler.inverse_transform"""
+    return (np.asarray(values, dtype=np.float64) - scaler['min']) / scaler['scale']
+
+
+def province_scaler(panel: dict, province: str) -> dict:
+    """从面板中取出一个省份的归一化参数: {'min': (特征,), 'scale': (特征,)}"""
+    index = panel['provinces'].index(province)
+    return {'min': panel['scalers']['min'][index], 'scale': panel['scalers']['scale'][index]}
+
+
+def save_scaler(path: str, province: str, scaler: dict, features=FEATURE_COLUMNS):
+    payload = {
+        'province': province,
+        'features': list(features),
+        'min': np.asarray(scaler['min']).tolist(),
+        'scale': np.asarray(scaler['scale']).tolist(),
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+
+def load_scaler(path: str) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        payload = json.load(f)
+    return {'min': np.asarray(payload['min']), 'scale': np.asarray(payload['scale'])}
+
 
 def create_dataset(
         data_path:str,
         province:str,
 ):
-    # 定义数据集的来源
-    year_population_path = os.path.join(data_path, "YearPeople.csv")
-    year_consumption_path = os.path.join(data_path,"YearXiaofei.csv")
-    year_gdp_path = os.path.join(data_path,"YearGDP.csv")
-    year_financial = os.path.join(data_path,"YearFinancial.csv")
-
-    # 定义输入特征将他们重新拼接成一个新的csv表格
-    population = pd.read_csv(year_population_path)[province]  # 单位是万
-    comsumption = pd.read_csv(year_consumption_path)[province]  # 单位是亿
-    GDP = pd.read_csv(year_gdp_path)[province]  # 单位是亿
-    financial = pd.read_csv(year_financial)[province]  # 单位是亿
-
-    # 生成目标省份的人口、消费、GDP、财政支出的新表格
-    origin_data = pd.concat(
-        [population, comsumption, GDP, financial],
-        axis=1,
-    )
-
-    # 定义列表列名
-    origin_data.columns = ['polulation', 'consumption', 'GDP', 'financial']
+    # 从缓存的面板中取出目标省份的人口、消费、GDP、财政支出
+    panel = load_panel(data_path)
+    if province not in panel['provinces']:
+        raise KeyError(province)
+    province_index = panel['provinces'].index(province)
 
-    # 翻转列表,将时间顺序转换成较远时间变成较近时间，并更新索引
-    origin_data_reversed = origin_data.iloc[::-1].reset_index(drop=True)
+    # 索引为 0 开始的年份序号，时间顺序为较远时间到较近时间
+    origin_data_reversed = pd.DataFrame(
+        panel['values'][:, province_index, :].copy(),
+        columns=FEATURE_COLUMNS,
+    )
 
     # 转换为numpy数组
     data_for_scaling = origin_data_reversed.values
-    scaler = MinMaxScaler()
-    # 进行归一化后的数组
-    data_scaled = scaler.fit_transform(data_for_scaling)
+    # 进行归一化后的数组 (归一化参数在读取面板时已一次算好)
+    data_scaled = scale_transform(data_for_scaling, province_scaler(panel, province))
+
+    return origin_data_reversed,data_scaled
+
 
-    return origin_data_reversed,data_scaled
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把 Year*.csv 编译成二进制面板快照")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    args = parser.parse_args()
+    snapshot_path = compile_snapshot(args.data_dir)
+    panel = load_panel(args.data_dir)
+    print(f"✅ 面板快照已生成: {snapshot_path} "
+          f"({len(panel['years'])} 年 × {len(panel['provinces'])} 个省份 × {len(panel['features'])} 个特征)")
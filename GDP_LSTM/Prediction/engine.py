@@ -3,7 +3,6 @@ import numpy as np
 import torch
 from tqdm.auto import tqdm
 from timeit import default_timer as timer
-import matplotlib.pyplot as plt
 import os
 
 torch.manual_seed(42)
@@ -22,6 +21,25 @@ def mape_metric(predictions, targets):
     epsilon = 1e-8
     return torch.mean(torch.abs((targets - predictions) / (targets + epsilon))) * 10
 
+def to_tensor(data, device:str) -> torch.Tensor:
+    # 每次训练只做一次 numpy -> float32 Tensor 的转换，避免每个样本重复拷贝
+    if torch.is_tensor(data):
+        return data.to(device=device, dtype=torch.float32)
+    array = np.asarray(data)
+    if not array.flags.writeable:
+        # utils.create_training_sequences 返回的是只读的滑动窗口视图，在这里做唯一一次拷贝
+        return torch.tensor(array, dtype=torch.float32, device=device)
+    return torch.as_tensor(array, dtype=torch.float32, device=device)
+
+def _batch_metrics(loss, predictions, targets) -> torch.Tensor:
+    # 将 loss/mae/mse/mape 打包成一个张量，累加时不触发 .item() 同步
+    return torch.stack([
+        loss.detach(),
+        mae_metric(predictions, targets).detach(),
+        mse_metric(predictions, targets).detach(),
+        mape_metric(predictions, targets).detach(),
+    ])
+
 def train_step(
         model,
         data_x,
@@ -29,42 +47,33 @@ def train_step(
         loss_fn:torch.nn.Module,
         optimizer:torch.optim.Optimizer,
         device:str,
+        batch_size:int = 1,
 ) -> tuple[float, float, float, float] | None:
     model.train()
     N = len(data_x)
     if N == 0:
         print("警告: 训练样本数为 0，请检查数据长度和 WINDOW/PREDICT_STEPS 设置。")
         return
-    train_loss = 0.0
-    train_mae = 0.0
-    train_mse = 0.0
-    train_mape = 0.0
+    data_x = to_tensor(data_x, device)
+    data_y = to_tensor(data_y, device)
+    totals = torch.zeros(4, device=device)
 
-    for i in range(N):
-        # 转换为 Tensor 并增加批次维度 (Batch=1)
-        x_sample = torch.from_numpy(data_x[i]).float().unsqueeze(0).to(device)
-        y_sample = torch.from_numpy(data_y[i]).float().unsqueeze(0).to(device)
+    # 每个 mini-batch 只做一次前向/反向传播
+    for start in range(0, N, batch_size):
+        x_batch = data_x[start:start + batch_size]
+        y_batch = data_y[start:start + batch_size]
 
         optimizer.zero_grad()
-        predictions = model(x_sample)
-
-        loss = loss_fn(predictions, y_sample)
-        mae = mae_metric(predictions, y_sample)
-        mse = mse_metric(predictions, y_sample)
-        mape = mape_metric(predictions, y_sample)
+        predictions = model(x_batch)
 
+        loss = loss_fn(predictions, y_batch)
         loss.backward()
         optimizer.step()
 
-        train_loss += loss.item()
-        train_mae += mae.item()
-        train_mse += mse.item()
-        train_mape += mape.item()
+        # 按批次样本数加权，保证平均值仍然是“每个样本”的平均
+        totals += _batch_metrics(loss, predictions, y_batch) * len(x_batch)
 
-    avg_loss = train_loss / N
-    avg_mae = train_mae / N
-    avg_mse = train_mse/N
-    avg_mape = train_mape / N
+    avg_loss, avg_mae, avg_mse, avg_mape = (totals / N).tolist()
 
     return avg_loss, avg_mae, avg_mse, avg_mape
 
@@ -74,47 +83,84 @@ def test_step(
         data_y,
         loss_fn:torch.nn.Module,
         device:str,
+        batch_size:int = 1,
 ) -> tuple[float, float, float, float] | None:
     model.eval()
     N = len(data_x)
-    test_loss = 0.0
-    train_mae = 0.0
-    train_mse = 0.0
-    train_mape = 0.0
 
     if N == 0:
         print("警告: 训练样本数为 0，请检查数据长度和 WINDOW/PREDICT_STEPS 设置。")
         return
-    for i in range(N):
-
-        x_sample = torch.from_numpy(data_x[i]).float().unsqueeze(0).to(device)
-        y_sample = torch.from_numpy(data_y[i]).float().unsqueeze(0).to(device)
+    data_x = to_tensor(data_x, device)
+    data_y = to_tensor(data_y, device)
+    totals = torch.zeros(4, device=device)
 
-        predictions = model(x_sample)
-        loss = loss_fn(predictions, y_sample)
-        mae = mae_metric(predictions, y_sample)
-        mse = mse_metric(predictions, y_sample)
-        mape = mape_metric(predictions, y_sample)
+    with torch.no_grad():
+        for start in range(0, N, batch_size):
+            x_batch = data_x[start:start + batch_size]
+            y_batch = data_y[start:start + batch_size]
 
-        test_loss += loss.item()
-        train_mae += mae.item()
-        train_mse += mse.item()
-        train_mape += mape.item()
+            predictions = model(x_batch)
+            loss = loss_fn(predictions, y_batch)
+            totals += _batch_metrics(loss, predictions, y_batch) * len(x_batch)
 
-    avg_loss = test_loss / N
-    avg_mae = train_mae / N
-    avg_mse = train_mse / N
-    avg_mape = train_mape / N
+    avg_loss, avg_mae, avg_mse, avg_mape = (totals / N).tolist()
 
     return avg_loss, avg_mae, avg_mse, avg_mape
 
+def save_checkpoint(path:str, epoch:int, model, optimizer, results, early_stop_state, meta=None) -> None:
+    # 先写临时文件再替换，避免中断时留下损坏的检查点
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    torch.save({
+        'epoch': epoch,
+        'model_state': model.state_dict(),
+        'optimizer_state': optimizer.state_dict(),
+        'results': results,
+        'early_stop_state': early_stop_state,
+        'meta': meta,
+    }, tmp_path)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path:str, model, optimizer, device:str, meta=None) -> dict | None:
+    """
+    读取检查点并恢复模型和优化器状态
+    :param meta: 本次训练的设置 (超参数、数据哈希等)；与保存检查点时的不同时删除该检查点并返回 None
+    """
+    checkpoint = torch.load(path, map_location=device, weights_only=False)
+    if checkpoint.get('meta') != meta:
+        print(f"⚠️ 检查点与本次训练的超参数或数据不一致，已删除并从头训练: {path}")
+        os.remove(path)
+        return None
+    model.load_state_dict(checkpoint['model_state'])
+    optimizer.load_state_dict(checkpoint['optimizer_state'])
+    return checkpoint
+
 def train(model,
           data_x,
           data_y,
           loss_fn:torch.nn.Module,
           optimizer:torch.optim.Optimizer,
           num_epochs:int,
-          device:str) -> dict[str, list[Any]]:
+          device:str,
+          batch_size:int = 1,
+          val_x=None,
+          val_y=None,
+          patience:int = 0,
+          min_delta:float = 0.0,
+          checkpoint_path:str | None = None,
+          checkpoint_every:int = 10,
+          resume:bool = False,
+          checkpoint_meta:dict | None = None,
+          verbose:bool = True) -> dict[str, list[Any]]:
+    '''
+    :param val_x/val_y: 验证集，提供时每轮额外记录 val_* 指标
+    :param patience: 验证损失连续 patience 轮没有改善(超过 min_delta)时提前停止，0 表示不启用
+    :param checkpoint_path: 检查点文件路径，每 checkpoint_every 轮保存一次模型和优化器状态
+    :param resume: 检查点存在时从中断的轮次继续训练
+    :param checkpoint_meta: 随检查点保存的训练设置，恢复时与检查点中的不一致则忽略检查点
+    :param verbose: 是否显示进度条并打印每轮指标
+    '''
     results = {
         'train_loss':[],
         'train_mae':[],
@@ -125,30 +171,60 @@ def train(model,
         'test_mse':[],
         'test_mape':[],
     }
+    has_val = val_x is not None and len(val_x) > 0
+    if has_val:
+        results.update({'val_loss':[], 'val_mae':[], 'val_mse':[], 'val_mape':[]})
+    if patience > 0 and not has_val:
+        raise ValueError("启用早停 (patience > 0) 时必须提供验证集 val_x/val_y。")
+
     model.to(device)
-    for epoch in tqdm(range(num_epochs)):
+    # 整个训练过程只转换一次数据
+    data_x = to_tensor(data_x, device)
+    data_y = to_tensor(data_y, device)
+    if has_val:
+        val_x = to_tensor(val_x, device)
+        val_y = to_tensor(val_y, device)
+
+    # 早停状态：最优验证损失、对应的模型参数、连续未改善的轮数
+    early_stop_state = {'best_val_loss': float('inf'), 'best_epoch': 0, 'best_state': None, 'bad_epochs': 0}
+    start_epoch = 0
+    if resume and checkpoint_path and os.path.exists(checkpoint_path):
+        checkpoint = load_checkpoint(checkpoint_path, model, optimizer, device, checkpoint_meta)
+        if checkpoint is not None:
+            start_epoch = checkpoint['epoch']
+            results = checkpoint['results']
+            early_stop_state = checkpoint['early_stop_state']
+            print(f"从检查点恢复: {checkpoint_path} (已完成 {start_epoch} 轮)")
+
+    stopped = patience > 0 and early_stop_state['bad_epochs'] >= patience
+    for epoch in tqdm(range(start_epoch, num_epochs), disable=not verbose):
+        if stopped:
+            break
         train_loss,train_mae,train_mse,train_mape = train_step(model=model,
                                 data_x=data_x,
                                 data_y=data_y,
                                 loss_fn=loss_fn,
                                 optimizer=optimizer,
-                                device=device)
+                                device=device,
+                                batch_size=batch_size)
         test_loss,test_mae,test_mse,test_mape = test_step(model=model,
                               data_x=data_x,
                               data_y=data_y,
                               loss_fn=loss_fn,
-                              device=device)
-        print(
-            f"轮次: {epoch + 1} | "
-            f"train_loss: {train_loss:.4f} | "
-            f"train_mae: {train_mae:.4f} | "
-            f"train_mse: {train_mse:.4f} | "
-            f"train_mape: {train_mape:.4f} | "
-            f"test_loss: {test_loss:.4f} | "
-            f"test_mae: {test_mae:.4f} | "
-            f"test_mse: {test_mse:.4f} | "
-            f"test_mape: {test_mape:.4f} | "
-            )
+                              device=device,
+                              batch_size=batch_size)
+        if verbose:
+            print(
+                f"轮次: {epoch + 1} | "
+                f"train_loss: {train_loss:.4f} | "
+                f"train_mae: {train_mae:.4f} | "
+                f"train_mse: {train_mse:.4f} | "
+                f"train_mape: {train_mape:.4f} | "
+                f"test_loss: {test_loss:.4f} | "
+                f"test_mae: {test_mae:.4f} | "
+                f"test_mse: {test_mse:.4f} | "
+                f"test_mape: {test_mape:.4f} | "
+                )
         results['train_loss'].append(train_loss)
         results['train_mae'].append(train_mae)
         results['train_mse'].append(train_mse)
@@ -157,61 +233,132 @@ def train(model,
         results['test_mae'].append(test_mae)
         results['test_mse'].append(test_mse)
         results['test_mape'].append(test_mape)
-    # 创建保存图像的目录
-    os.makedirs('parm', exist_ok=True)
-    
-    # 绘制并保存训练指标图表
-    epochs = range(1, num_epochs + 1)
-    
-    # MAE趋势图
-    plt.figure(figsize=(10, 6))
-    plt.plot(epochs, results['train_mae'], 'b-', label='Training MAE')
-    plt.plot(epochs, results['test_mae'], 'r-', label='Testing MAE')
-    plt.title('MAE Trend')
-    plt.xlabel('Epochs')
-    plt.ylabel('MAE')
-    plt.legend()
-    plt.savefig(os.path.join('parm', 'mae_plot.png'))
-    plt.close()
-
-    # MSE趋势图
-    plt.figure(figsize=(10, 6))
-    plt.plot(epochs, results['train_mse'], 'b-', label='Training MSE')
-    plt.plot(epochs, results['test_mse'], 'r-', label='Testing MSE')
-    plt.title('MSE Trend')
-    plt.xlabel('Epochs')
-    plt.ylabel('MSE')
-    plt.legend()
-    plt.savefig(os.path.join('parm', 'mse_plot.png'))
-    plt.close()
-
-    # MAPE趋势图
-    plt.figure(figsize=(10, 6))
-    plt.plot(epochs, results['train_mape'], 'b-', label='Training MAPE')
-    plt.plot(epochs, results['test_mape'], 'r-', label='Testing MAPE')
-    plt.title('MAPE Trend (%)')
-    plt.xlabel('Epochs')
-    plt.ylabel('MAPE (%)')
-    plt.legend()
-    plt.savefig(os.path.join('parm', 'mape_plot.png'))
-    plt.close()
+
+        if has_val:
+            val_loss,val_mae,val_mse,val_mape = test_step(model=model,
+                                  data_x=val_x,
+                                  data_y=val_y,
+                                  loss_fn=loss_fn,
+                                  device=device,
+                                  batch_size=batch_size)
+            results['val_loss'].append(val_loss)
+            results['val_mae'].append(val_mae)
+            results['val_mse'].append(val_mse)
+            results['val_mape'].append(val_mape)
+
+            if val_loss < early_stop_state['best_val_loss'] - min_delta:
+                early_stop_state['best_val_loss'] = val_loss
+                early_stop_state['best_epoch'] = epoch + 1
+                early_stop_state['best_state'] = {k: v.detach().clone() for k, v in model.state_dict().items()}
+                early_stop_state['bad_epochs'] = 0
+            else:
+                early_stop_state['bad_epochs'] += 1
+            if patience > 0 and early_stop_state['bad_epochs'] >= patience:
+                print(f"验证损失连续 {patience} 轮未改善，在第 {epoch + 1} 轮提前停止 "
+                      f"(最优轮次: {early_stop_state['best_epoch']})")
+                stopped = True
+
+        if checkpoint_path and ((epoch + 1) % checkpoint_every == 0 or stopped):
+            save_checkpoint(checkpoint_path, epoch + 1, model, optimizer, results, early_stop_state, checkpoint_meta)
+
+    # 早停时恢复验证损失最优的参数
+    if patience > 0 and early_stop_state['best_state'] is not None:
+        model.load_state_dict(early_stop_state['best_state'])
 
     return results
 
+def _stacked_metrics(loss, predictions, targets) -> torch.Tensor:
+    # 每个模型单独计算指标，返回形状 (4, M)
+    dims = tuple(range(1, predictions.dim()))
+    err = predictions - targets
+    epsilon = 1e-8
+    return torch.stack([
+        loss.detach(),
+        err.abs().mean(dim=dims).detach(),
+        err.pow(2).mean(dim=dims).detach(),
+        (torch.abs(err / (targets + epsilon)).mean(dim=dims) * 10).detach(),
+    ])
+
+def stacked_step(
+        model,
+        data_x:torch.Tensor,
+        data_y:torch.Tensor,
+        loss_fn:torch.nn.Module,
+        optimizer:torch.optim.Optimizer | None,
+        batch_size:int = 1,
+) -> torch.Tensor:
+    # optimizer 为 None 时只做评估；返回每个模型的平均指标，形状 (4, M)
+    training = optimizer is not None
+    model.train(training)
+    N = data_x.size(1)
+    totals = data_x.new_zeros(4, data_x.size(0))
+    with torch.set_grad_enabled(training):
+        for start in range(0, N, batch_size):
+            x_batch = data_x[:, start:start + batch_size]
+            y_batch = data_y[:, start:start + batch_size]
+
+            predictions = model(x_batch)
+            # loss_fn 需要 reduction='none'，这里按模型求平均，得到每个模型各自的损失
+            loss = loss_fn(predictions, y_batch).flatten(1).mean(dim=1)
+
+            if training:
+                optimizer.zero_grad()
+                # 各模型参数互不相交，对损失求和后每组参数拿到的梯度与单独训练相同
+                loss.sum().backward()
+                optimizer.step()
+
+            totals += _stacked_metrics(loss, predictions, y_batch) * x_batch.size(1)
+    return totals / N
+
+def train_stacked(model,
+                  data_x,
+                  data_y,
+                  loss_fn:torch.nn.Module,
+                  optimizer:torch.optim.Optimizer,
+                  num_epochs:int,
+                  device:str,
+                  batch_size:int = 1,
+                  verbose:bool = True) -> list[dict[str, list[Any]]]:
+    # 堆叠训练：data_x 形状 (M, N, W, F)，data_y 形状 (M, N, P, 1)
+    # 返回 M 个结果字典，格式与 train() 的返回值一致；verbose 为 False 时不显示进度条和每轮指标
+    keys = ['loss', 'mae', 'mse', 'mape']
+    results = [
+        {f'{split}_{key}': [] for split in ('train', 'test') for key in keys}
+        for _ in range(len(data_x))
+    ]
+    if data_x.shape[1] == 0:
+        print("警告: 训练样本数为 0，请检查数据长度和 WINDOW/PREDICT_STEPS 设置。")
+        return results
+    model.to(device)
+    data_x = to_tensor(data_x, device)
+    data_y = to_tensor(data_y, device)
+    for epoch in tqdm(range(num_epochs), disable=not verbose):
+        train_metrics = stacked_step(model, data_x, data_y, loss_fn, optimizer, batch_size)
+        test_metrics = stacked_step(model, data_x, data_y, loss_fn, None, batch_size)
+        # 每轮只同步一次
+        epoch_metrics = torch.cat([train_metrics, test_metrics]).T.tolist()
+        for result, values in zip(results, epoch_metrics):
+            for key, value in zip(result, values):
+                result[key].append(value)
+        if verbose:
+            print(
+                f"轮次: {epoch + 1} | "
+                f"平均 train_loss: {np.mean([m[0] for m in epoch_metrics]):.4f} | "
+                f"平均 test_loss: {np.mean([m[4] for m in epoch_metrics]):.4f} | "
+            )
+    return results
+
 def predict(model,
             data,
             device: str):
     model.eval()
     # 1. 确保转为 Tensor
-    if not torch.is_tensor(data):
-        data = torch.from_numpy(data).float()
+    data = to_tensor(data, device)
 
     # 2. 增加批次维度 (如果输入是单个样本 (W, F))
     if data.dim() == 2:
         data = data.unsqueeze(0)
 
-    data = data.to(device)
-
     # 3. 模型预测 (一次性算出所有结果)
     with torch.no_grad():
         predictions = model(data)
@@ -0,0 +1,202 @@
+import os
+import re
+import csv
+import argparse
+
+import data_setup
+from data_setup import PROVINCES
+
+# 国家统计局导出的宽表 (行为地区，列为 "2024年" 等年份)，与 data_setup.FEATURE_FILES 一一对应
+WIDE_FILES = ["分省年度人口数据.csv", "分省年度消费品数据.csv", "分省年度数据.csv", "分省年度地方财政支出数据.csv"]
+# 单独指定各宽表的命令行参数 (与 FEATURE_COLUMNS 一一对应，列名 polulation 沿用数据文件中的拼写)
+FEATURE_FLAGS = ['--population', '--consumption', '--gdp', '--financial']
+# 导出文件中可能出现、但不参与训练的地区
+IGNORED_REGIONS = {'全国', '台湾省', '香港特别行政区', '澳门特别行政区'}
+# 网页导出的文件是 GBK 编码，手工另存的通常是 UTF-8
+ENCODINGS = ('utf-8-sig', 'gbk')
+REGION_HEADER = '地区'
+YEAR_PATTERN = re.compile(r'^(\d{4})年$')
+NUMBER_PATTERN = re.compile(r'^-?\d+(\.\d+)?$')
+
+
+class IngestError(ValueError):
+    """宽表内容不符合要求 (未知地区、缺失年份、非数值单元格等)"""
+
+
+def open_text(path):
+    """依次尝试 ENCODINGS，返回能正确解码首行的文件对象"""
+    for encoding in ENCODINGS:
+        f = open(path, 'r', encoding=encoding, newline='')
+        try:
+            f.readline()
+            f.seek(0)
+            return f
+        except UnicodeDecodeError:
+            f.close()
+    raise IngestError(f"{path}: 无法识别文件编码 (已尝试 {', '.join(ENCODINGS)})")
+
+
+def read_wide_file(path: str) -> dict:
+    """
+    逐行读取一个宽表，跳过表头说明和表尾注释，校验地区名和每个单元格
+    :return: {'years': 年份列表 (与文件列顺序相同), 'regions': 地区顺序, 'cells': {地区: 单元格文本列表}}
+    """
+    name = os.path.basename(path)
+    years = None
+    regions, cells = [], {}
+    with open_text(path) as f:
+        for line_no, row in enumerate(csv.reader(f), start=1):
+            row = [cell.strip() for cell in row]
+            if not any(row):
+                continue
+            if years is None:
+                # 表头之前是 "数据库：..."、"指标：..." 等说明行
+                if row[0] != REGION_HEADER:
+                    continue
+                years = []
+                for cell in row[1:]:
+                    match = YEAR_PATTERN.match(cell)
+                    if match is None:
+                        raise IngestError(f"{name}:{line_no}: 无法识别的年份列 '{cell}'")
+                    years.append(int(match.group(1)))
+                if sorted(years) != list(range(min(years), max(years) + 1)):
+                    missing = sorted(set(range(min(years), max(years) + 1)) - set(years))
+                    raise IngestError(f"{name}:{line_no}: 年份列不连续或重复，缺少 {missing}")
+                continue
+
+            region = row[0]
+            # 表尾是 "注：..."、"数据来源：..." 等说明
+            if region.startswith('注') or region.startswith('数据来源'):
+                break
+            if region in IGNORED_REGIONS:
+                continue
+            if region not in PROVINCES:
+                raise IngestError(f"{name}:{line_no}: 未知地区 '{region}'")
+            if region in cells:
+                raise IngestError(f"{name}:{line_no}: 地区 '{region}' 重复出现")
+            if len(row) != len(years) + 1:
+                raise IngestError(f"{name}:{line_no}: {region} 有 {len(row) - 1} 个数值，应为 {len(years)} 个")
+            for year, cell in zip(years, row[1:]):
+                if not NUMBER_PATTERN.match(cell):
+                    raise IngestError(f"{name}:{line_no}: {region} {year}年 缺失或不是数值: '{cell}'")
+            regions.append(region)
+            cells[region] = row[1:]
+
+    if years is None:
+        raise IngestError(f"{name}: 未找到以 '{REGION_HEADER}' 开头的表头行")
+    missing = [province for province in PROVINCES if province not in cells]
+    if missing:
+        raise IngestError(f"{name}: 缺少省份 {missing}")
+    return {'years': years, 'regions': regions, 'cells': cells}
+
+
+def read_year_file(path: str) -> tuple[list, dict]:
+    """
+    读取现有的 Year*.csv (列为省份，行为年份，最新的年份在第一行)
+    :return: (省份列顺序, {年份: {省份: 单元格文本}})
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        rows = [row for row in csv.reader(f) if row]
+    header, rows = rows[0], rows[1:]
+    last_year = data_setup.FIRST_YEAR + len(rows) - 1
+    return header, {last_year - i: dict(zip(header, row)) for i, row in enumerate(rows)}
+
+
+def build_year_table(wide: dict, existing: dict | None) -> tuple[list, dict]:
+    """
+    合并新导出的宽表和已有数据：重叠年份以新数据为准 (统计局会修订历史数据)，
+    已有数据中更早的年份保留，使历史不会因为导出只含 "最近20年" 而缩短
+    :return: (省份列顺序, {年份: {省份: 单元格文本}})
+    """
+    table = {}
+    for i, year in enumerate(wide['years']):
+        table[year] = {region: wide['cells'][region][i] for region in wide['regions']}
+    if existing:
+        for year, row in existing.items():
+            table.setdefault(year, row)
+
+    years = sorted(table)
+    if years[0] != data_setup.FIRST_YEAR:
+        raise IngestError(f"数据起始年份为 {years[0]}，与 data_setup.FIRST_YEAR ({data_setup.FIRST_YEAR}) 不一致")
+    if years != list(range(years[0], years[-1] + 1)):
+        missing = sorted(set(range(years[0], years[-1] + 1)) - set(years))
+        raise IngestError(f"合并后缺少年份 {missing}")
+    return years, table
+
+
+def write_year_file(path: str, provinces: list, years: list, table: dict):
+    """按 Year*.csv 的格式写出 (最新的年份在第一行)，先写临时文件再替换"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(provinces)
+        for year in reversed(years):
+            writer.writerow([table[year][province] for province in provinces])
+    os.replace(tmp_path, path)
+
+
+def ingest(source_paths: list, out_dir: str, replace=False, dry_run=False) -> dict:
+    """
+    把四个宽表写成训练用的 Year*.csv 并重新生成面板快照
+    :param replace: 不与已有的 Year*.csv 合并，直接用导出数据覆盖
+    :param dry_run: 只校验，不写文件
+    :return: {特征: 写入后的年份列表}
+    """
+    # 先完整校验全部文件，任何一个有问题都不写出，避免四个特征的年份不一致
+    wides = [read_wide_file(path) for path in source_paths]
+    years_by_feature = {}
+    outputs = []
+    for feature, file_name, path, wide in zip(data_setup.FEATURE_COLUMNS, data_setup.FEATURE_FILES,
+                                              source_paths, wides):
+        try:
+            out_path = data_setup.resolve_data_file(out_dir, file_name)
+        except FileNotFoundError:
+            out_path = os.path.join(out_dir, file_name)
+        # 沿用已有文件的省份列顺序，新文件按导出文件的地区顺序
+        provinces, existing = wide['regions'], None
+        if not replace and os.path.exists(out_path):
+            provinces, existing = read_year_file(out_path)
+        years, table = build_year_table(wide, existing)
+        years_by_feature[feature] = years
+        outputs.append((out_path, provinces, years, table))
+        print(f"{os.path.basename(path)} → {os.path.basename(out_path)}: {years[0]}-{years[-1]} 年, {len(provinces)} 个省份")
+
+    year_ranges = {tuple(years) for years in years_by_feature.values()}
+    if len(year_ranges) != 1:
+        detail = ', '.join(f"{feature}: {years[0]}-{years[-1]}" for feature, years in years_by_feature.items())
+        raise IngestError(f"四个特征的年份范围不一致 ({detail})")
+
+    if dry_run:
+        print("✅ 校验通过 (--dry-run，未写入文件)")
+        return years_by_feature
+    os.makedirs(out_dir, exist_ok=True)
+    for out_path, provinces, years, table in outputs:
+        write_year_file(out_path, provinces, years, table)
+    snapshot_path = data_setup.compile_snapshot(out_dir)
+    print(f"✅ 已写入 Year*.csv 并重新生成面板快照: {snapshot_path}")
+    return years_by_feature
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把国家统计局导出的分省年度宽表导入为训练数据")
+    parser.add_argument('--source-dir', default=data_setup.DEFAULT_DATA_DIR, help="宽表所在目录，默认 GDP_LSTM/data")
+    for flag, feature, file_name in zip(FEATURE_FLAGS, data_setup.FEATURE_COLUMNS, WIDE_FILES):
+        parser.add_argument(flag, dest=feature, default=None, metavar='PATH', help=f"{feature} 宽表路径，默认 <source-dir>/{file_name}")
+    parser.add_argument('--data-dir', default=data_setup.DEFAULT_DATA_DIR, help="Year*.csv 输出目录，默认 GDP_LSTM/data")
+    parser.add_argument('--replace', action='store_true', help="不与已有数据合并，直接覆盖")
+    parser.add_argument('--dry-run', action='store_true', help="只校验，不写文件")
+    args = parser.parse_args()
+
+    source_paths = [
+        getattr(args, feature) or os.path.join(args.source_dir, file_name)
+        for feature, file_name in zip(data_setup.FEATURE_COLUMNS, WIDE_FILES)
+    ]
+    try:
+        ingest(source_paths, args.data_dir, replace=args.replace, dry_run=args.dry_run)
+    except IngestError as e:
+        print(f"❌ 导入失败: {e}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,21 @@ from torch import nn
 import torch
 
 class Seq2Seq(nn.Module):
-    def __init__(self,input_size, hidden_size, num_layers, output_size, predict_steps):
+    def __init__(self,input_size, hidden_size, num_layers, output_size, predict_steps, fused_decoder=True):
         '''
         :param input_size: 输入特征的数量
         :param hidden_size: 隐藏层
         :param num_layers: LSTM堆叠层数
         :param output_size: 输出特征，即预测特征
         :param predict_steps:预测的年数
+        :param fused_decoder: 解码器是否使用融合实现(直接用解码器权重做矩阵运算，不逐步调用 nn.LSTM)
         '''
         super(Seq2Seq, self).__init__()
         self.hidden_size = hidden_size
         self.num_layers = num_layers
         self.output_size = output_size
         self.predict_steps = predict_steps
+        self.fused_decoder = fused_decoder
 
         self.encoder = nn.LSTM(input_size, hidden_size, num_layers, batch_first=True)
         self.decoder = nn.LSTM(output_size, hidden_size, num_layers, batch_first=True)
@@ -25,6 +27,43 @@ class Seq2Seq(nn.Module):
         # enc_hn, enc_cn 形状: (num_layers, B, H)
         # 1. 编码器阶段
         _, (enc_hn, enc_cn) = self.encoder(x)
+        if self.fused_decoder:
+            return self._decode_fused(enc_hn, enc_cn)
+        return self._decode_loop(x, enc_hn, enc_cn)
+
+    def _decode_fused(self, enc_hn, enc_cn):
+        # 循环外一次性准备好每层的转置权重和合并后的偏置，
+        # 循环内只有 addmm 和逐元素运算，没有 nn.LSTM 调用和原地写入
+        H = self.hidden_size
+        layers = [
+            (w_ih.t(), w_hh.t(), b_ih + b_hh)
+            for w_ih, w_hh, b_ih, b_hh in self.decoder.all_weights
+        ]
+        fc_w = self.fc.weight.t()
+        fc_b = self.fc.bias
+
+        h = list(enc_hn.unbind(0))
+        c = list(enc_cn.unbind(0))
+        # 解码器的第一个输入（未来的数据全为0）
+        dec_input = enc_hn.new_zeros(enc_hn.size(1), self.output_size)
+        predictions = []
+        for t in range(self.predict_steps):
+            layer_input = dec_input
+            for layer, (w_ih, w_hh, bias) in enumerate(layers):
+                gates = torch.addmm(torch.addmm(bias, layer_input, w_ih), h[layer], w_hh)
+                # 门的顺序与 nn.LSTM 一致: i, f, g, o；一次 sigmoid 覆盖全部门
+                act = torch.sigmoid(gates)
+                g = torch.tanh(gates[:, 2 * H:3 * H])
+                c[layer] = act[:, H:2 * H] * c[layer] + act[:, :H] * g
+                h[layer] = act[:, 3 * H:] * torch.tanh(c[layer])
+                layer_input = h[layer]
+            dec_input = torch.addmm(fc_b, layer_input, fc_w)
+            predictions.append(dec_input)
+        # predictions 形状: (B, predict_steps, output_size)
+        return torch.stack(predictions, dim=1)
+
+    def _decode_loop(self, x, enc_hn, enc_cn):
+        # 原始实现：每一步调用一次 nn.LSTM，保留用于对照和基准测试
         # 初始化结果容器，用来存储未来时间步的GDP预测值
         predictions = torch.zeros(x.size(0), self.predict_steps, self.output_size).to(x.device)
         # 初始化解码器的第一个输入（未来的数据全为0）
@@ -45,3 +84,121 @@ class Seq2Seq(nn.Module):
             dec_input = pred.unsqueeze(1)
 
         return predictions
+
+
+class StackedSeq2Seq(nn.Module):
+    def __init__(self, num_models, input_size, hidden_size, num_layers, output_size, predict_steps):
+        '''
+        把 num_models 个相互独立的 Seq2Seq 参数堆叠在一起，一次前向传播同时计算全部模型。
+        每组参数的结构与 Seq2Seq 完全一致，可以通过 to_state_dict 拆回单个 Seq2Seq。
+        :param num_models: 堆叠的模型数量(如省份数)
+        :param input_size: 输入特征的数量
+        :param hidden_size: 隐藏层
+        :param num_layers: LSTM堆叠层数
+        :param output_size: 输出特征，即预测特征
+        :param predict_steps:预测的年数
+        '''
+        super(StackedSeq2Seq, self).__init__()
+        self.num_models = num_models
+        self.input_size = input_size
+        self.hidden_size = hidden_size
+        self.num_layers = num_layers
+        self.output_size = output_size
+        self.predict_steps = predict_steps
+
+        # 用 num_models 个标准 Seq2Seq 的初始化结果作为初始参数，保证初始化分布与单模型一致；
+        # 各组参数从同一个随机数流中依次生成，需要与逐省训练的初始化完全相同时用 from_state_dicts
+        models = [
+            Seq2Seq(input_size, hidden_size, num_layers, output_size, predict_steps)
+            for _ in range(num_models)
+        ]
+        for name in models[0].state_dict():
+            stacked = torch.stack([m.state_dict()[name] for m in models])
+            self.register_parameter(self._param_name(name), nn.Parameter(stacked))
+
+    @staticmethod
+    def _param_name(name):
+        # "encoder.weight_ih_l0" -> "encoder__weight_ih_l0" (参数名中不能包含 ".")
+        return name.replace('.', '__')
+
+    @classmethod
+    def from_state_dicts(cls, state_dicts, input_size, hidden_size, num_layers, output_size, predict_steps):
+        '''用若干个 Seq2Seq 的 state_dict 构建堆叠模型'''
+        model = cls(len(state_dicts), input_size, hidden_size, num_layers, output_size, predict_steps)
+        with torch.no_grad():
+            for name in state_dicts[0]:
+                stacked = torch.stack([sd[name] for sd in state_dicts])
+                getattr(model, cls._param_name(name)).copy_(stacked)
+        return model
+
+    def to_state_dict(self, index):
+        '''取出第 index 组参数，返回可直接加载到 Seq2Seq 的 state_dict'''
+        return {
+            name.replace('__', '.'): param[index].detach().clone()
+            for name, param in self.named_parameters()
+        }
+
+    def _param(self, name, index):
+        # index 为 None 时使用全部模型，否则只取出 index 对应的几组参数
+        param = getattr(self, name)
+        return param if index is None else param.index_select(0, index)
+
+    def _weights(self, module, layer, index=None):
+        w_ih = self._param(f'{module}__weight_ih_l{layer}', index)
+        w_hh = self._param(f'{module}__weight_hh_l{layer}', index)
+        bias = self._param(f'{module}__bias_ih_l{layer}', index) + self._param(f'{module}__bias_hh_l{layer}', index)
+        return w_ih, w_hh, bias
+
+    @staticmethod
+    def _cell(gates, c):
+        # 门的顺序与 nn.LSTM 一致: 输入门 i, 遗忘门 f, 候选 g, 输出门 o
+        # 用切片而不是 chunk，chunk 导出为 opset 18 的 Split，在 opset 17 下无效
+        H = gates.shape[-1] // 4
+        i, f, g, o = gates[..., :H], gates[..., H:2 * H], gates[..., 2 * H:3 * H], gates[..., 3 * H:]
+        c = torch.sigmoid(f) * c + torch.sigmoid(i) * torch.tanh(g)
+        h = torch.sigmoid(o) * torch.tanh(c)
+        return h, c
+
+    def forward(self, x, index=None):
+        # x 形状: (M, B, W, F)，M 为模型数量
+        # index: 形状 (M,) 的 int64 张量，x[m] 使用第 index[m] 组参数；为 None 时 x 必须包含全部模型
+        M, B, W, _ = x.shape
+        h_n, c_n = [], []
+
+        # 1. 编码器阶段：逐层计算，每层的输入投影对全部时间步一次性完成
+        layer_input = x
+        for layer in range(self.num_layers):
+            w_ih, w_hh, bias = self._weights('encoder', layer, index)
+            proj = torch.matmul(layer_input.reshape(M, B * W, -1), w_ih.transpose(1, 2))
+            proj = proj.reshape(M, B, W, -1) + bias.unsqueeze(1).unsqueeze(1)
+            h = x.new_zeros(M, B, self.hidden_size)
+            c = x.new_zeros(M, B, self.hidden_size)
+            outputs = []
+            for t in range(W):
+                gates = proj[:, :, t] + torch.matmul(h, w_hh.transpose(1, 2))
+                h, c = self._cell(gates, c)
+                outputs.append(h)
+            layer_input = torch.stack(outputs, dim=2)
+            h_n.append(h)
+            c_n.append(c)
+
+        # 2. 解码器阶段：逐步预测，初始输入为 0，隐藏状态继承自编码器
+        fc_w = self._param('fc__weight', index)
+        fc_b = self._param('fc__bias', index).unsqueeze(1)
+        dec_input = x.new_zeros(M, B, self.output_size)
+        predictions = []
+        for t in range(self.predict_steps):
+            step_input = dec_input
+            for layer in range(self.num_layers):
+                w_ih, w_hh, bias = self._weights('decoder', layer, index)
+                gates = (torch.matmul(step_input, w_ih.transpose(1, 2))
+                         + torch.matmul(h_n[layer], w_hh.transpose(1, 2))
+                         + bias.unsqueeze(1))
+                h_n[layer], c_n[layer] = self._cell(gates, c_n[layer])
+                step_input = h_n[layer]
+            pred = torch.matmul(step_input, fc_w.transpose(1, 2)) + fc_b
+            predictions.append(pred)
+            dec_input = pred
+
+        # predictions 形状: (M, B, P, output_size)
+        return torch.stack(predictions, dim=2)
@@ -0,0 +1,167 @@
+import os
+import argparse
+import datetime
+from timeit import default_timer as timer
+
+import numpy as np
+import onnx
+import onnxruntime
+import torch
+from onnx import helper, numpy_helper, TensorProto
+from onnxruntime.quantization import quantize_dynamic, QuantType
+
+import engine
+import registry
+import train
+
+# 单次推理延迟的测量次数 (取中位数)
+LATENCY_REPEAT = 200
+
+
+def quantize_int8(src_path, dst_path):
+    """动态量化：权重存为 int8，激活在运行时量化 (MatMulInteger / DynamicQuantizeLSTM)"""
+    quantize_dynamic(src_path, dst_path, weight_type=QuantType.QInt8)
+
+
+def convert_fp16_weights(src_path, dst_path):
+    """
+    权重以 float16 存储，每个权重后接一个 Cast 转回 float32，计算仍为 float32
+    (CPU 上 LSTM 没有 float16 实现，整图转换为 float16 无法运行)
+    """
+    model = onnx.load(src_path)
+    graph = model.graph
+    casts = []
+    for initializer in graph.initializer:
+        if initializer.data_type != TensorProto.FLOAT:
+            continue
+        name = initializer.name
+        half = numpy_helper.from_array(numpy_helper.to_array(initializer).astype(np.float16), f"{name}_fp16")
+        initializer.CopyFrom(half)
+        casts.append(helper.make_node('Cast', [half.name], [name], name=f"{name}_cast", to=TensorProto.FLOAT))
+    # Cast 节点放在最前面，保持节点的拓扑顺序
+    nodes = casts + list(graph.node)
+    del graph.node[:]
+    graph.node.extend(nodes)
+    onnx.checker.check_model(model)
+    onnx.save(model, dst_path)
+
+
+CONVERTERS = {
+    'int8': quantize_int8,
+    'fp16': convert_fp16_weights,
+}
+
+
+def province_windows(data, window_size):
+    """省份全部历史窗口 (包括最后一个用于预测未来的窗口)，形状 (N, window_size, 特征)"""
+    windows = np.lib.stride_tricks.sliding_window_view(data, window_size, axis=0)
+    return np.ascontiguousarray(windows.transpose(0, 2, 1), dtype=np.float32)
+
+
+def model_size(path):
+    """模型文件大小，包括外部权重文件 (.onnx.data)"""
+    return sum(os.path.getsize(p) for p in (path, path + '.data') if os.path.exists(p))
+
+
+def evaluate_variant(path, windows, reference, scaler, repeat=LATENCY_REPEAT):
+    """
+    在全部窗口上对比模型与 float32 .pth 的 GDP 预测 (反归一化后，单位亿)，并测量单个窗口的推理延迟
+    :param reference: .pth 的 GDP 预测，形状 (N, predict_steps)
+    """
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = 1
+    options.inter_op_num_threads = 1
+    session = onnxruntime.InferenceSession(path, options)
+    input_name = session.get_inputs()[0].name
+    gdp = train.GDP_COL_INDEX
+    predicted = session.run(None, {input_name: windows})[0][..., 0].astype(np.float64)
+    predicted = (predicted - scaler['min'][gdp]) / scaler['scale'][gdp]
+    error = np.abs(predicted - reference)
+    rel_error = error / np.abs(reference) * 100
+
+    # 与推理服务一致，每次只预测一个窗口
+    feed = {input_name: windows[-1:]}
+    session.run(None, feed)
+    latencies = []
+    for _ in range(repeat):
+        start = timer()
+        session.run(None, feed)
+        latencies.append(timer() - start)
+
+    return {
+        'file': os.path.basename(path),
+        'sha256': registry.file_checksum(path),
+        'size_bytes': model_size(path),
+        'latency_us': float(np.median(latencies) * 1e6),
+        'max_abs_error': float(error.max()),
+        'max_rel_error': float(rel_error.max()),
+        'mean_rel_error': float(rel_error.mean()),
+    }
+
+
+def quantize_province(PROVINCE, variants=registry.MODEL_VARIANTS, repeat=LATENCY_REPEAT):
+    """生成该省份的模型变体，以 float32 的 .pth 为基准评估 fp32 ONNX 与各变体"""
+    hyperparams = train.current_hyperparams()
+    hyperparams.update(registry.get_hyperparams(train.MODEL_PATH, PROVINCE))
+    pth_path = os.path.join(train.MODEL_PATH, f"{PROVINCE}_seq2seq_gdp_model.pth")
+    fp32_path = registry.variant_model_path(train.MODEL_PATH, PROVINCE)
+    for path in (pth_path, fp32_path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} 不存在，请先运行 train.py")
+
+    prepared = train.prepare_province(PROVINCE, hyperparams)
+    scaler = prepared['scaler']
+    windows = province_windows(prepared['data'], hyperparams['window_size'])
+
+    model = train.build_model(hyperparams)
+    model.load_state_dict(torch.load(pth_path, map_location=train.device))
+    model.eval()
+    with torch.no_grad():
+        reference = model(engine.to_tensor(windows, train.device))[..., 0].cpu().numpy().astype(np.float64)
+    gdp = train.GDP_COL_INDEX
+    reference = (reference - scaler['min'][gdp]) / scaler['scale'][gdp]
+
+    results = {'fp32': evaluate_variant(fp32_path, windows, reference, scaler, repeat)}
+    for variant in variants:
+        path = registry.variant_model_path(train.MODEL_PATH, PROVINCE, variant)
+        CONVERTERS[variant](fp32_path, path)
+        results[variant] = evaluate_variant(path, windows, reference, scaler, repeat)
+
+    return {
+        'pth_sha256': registry.file_checksum(pth_path),
+        'windows': len(windows),
+        'variants': results,
+        'updated_at': datetime.datetime.now().isoformat(),
+    }
+
+
+def quantize_provinces(provinces, variants=registry.MODEL_VARIANTS, repeat=LATENCY_REPEAT):
+    """为每个省份生成模型变体，结果写入 models/quantization_report.json"""
+    report = registry.load_quantization_report(train.MODEL_PATH)
+    report['onnxruntime'] = onnxruntime.__version__
+    for PROVINCE in provinces:
+        try:
+            entry = quantize_province(PROVINCE, variants, repeat)
+        except Exception as e:
+            print(f"❌ {PROVINCE} 模型变体生成失败: {e}")
+            continue
+        report['provinces'][PROVINCE] = entry
+        print(f"✅ {PROVINCE}: " + ", ".join(
+            f"{variant} {info['size_bytes'] / 1024:.1f}KB {info['latency_us']:.0f}us 误差≤{info['max_rel_error']:.3f}%"
+            for variant, info in entry['variants'].items()))
+    registry.save_quantization_report(report, train.MODEL_PATH)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成 int8 动态量化与 fp16 权重的 ONNX 模型变体，并评估大小、延迟和 GDP 误差")
+    parser.add_argument('--provinces', nargs='*', default=None, help="只处理指定省份，默认全部省份")
+    parser.add_argument('--variants', nargs='*', choices=registry.MODEL_VARIANTS, default=list(registry.MODEL_VARIANTS))
+    parser.add_argument('--repeat', type=int, default=LATENCY_REPEAT, help="单次推理延迟的测量次数")
+    args = parser.parse_args()
+
+    quantize_provinces(args.provinces or train.PROVINCES, args.variants, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
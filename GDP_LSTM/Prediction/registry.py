@@ -0,0 +1,176 @@
+import os
+import json
+import hashlib
+import datetime
+import numpy as np
+
+# 模型产物清单，记录每个省份的数据哈希、超参数和产物校验值
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+# 包含全部省份参数的 ONNX 模型 (.onnx) 及其说明文件 (.json)
+COMBINED_MODEL_NAME = "all_provinces_seq2seq_gdp_model"
+# 种子集成: 全部省份 × 种子副本的参数堆叠在一起 (.pth / .onnx / .json)
+ENSEMBLE_MODEL_NAME = "all_provinces_ensemble_gdp_model"
+# 省份模型的 int8 动态量化 / fp16 权重变体 (quantize.py 生成) 及其精度、延迟报告
+MODEL_VARIANTS = ('int8', 'fp16')
+QUANTIZATION_REPORT_NAME = "quantization_report.json"
+QUANTIZATION_REPORT_VERSION = 1
+
+
+def hash_series(data) -> str:
+    """对输入序列(create_dataset 返回的原始数据)计算哈希"""
+    array = np.ascontiguousarray(np.asarray(data, dtype=np.float64))
+    digest = hashlib.sha256()
+    digest.update(str(array.shape).encode('utf-8'))
+    digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def hash_hyperparams(hyperparams: dict) -> str:
+    """对超参数字典计算哈希 (键排序后序列化，与字典顺序无关)"""
+    payload = json.dumps(hyperparams, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def file_checksum(path: str) -> str:
+    """分块计算文件的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(model_dir: str) -> dict:
+    """读取清单，不存在或损坏时返回空清单"""
+    path = os.path.join(model_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                return manifest
+            print(f"警告: 清单版本不匹配，将重新生成: {path}")
+        except (OSError, ValueError) as e:
+            print(f"警告: 读取清单失败，将重新生成: {e}")
+    return {'version': MANIFEST_VERSION, 'provinces': {}}
+
+
+def save_manifest(manifest: dict, model_dir: str):
+    """先写临时文件再替换，避免中途中断留下半个清单"""
+    os.makedirs(model_dir, exist_ok=True)
+    path = os.path.join(model_dir, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def check_stale(manifest: dict, province: str, data_hash: str, hyperparams: dict, model_dir: str):
+    """
+    判断省份模型是否需要重新训练
+    :return: (是否过期, 原因)
+    """
+    entry = manifest['provinces'].get(province)
+    if entry is None:
+        return True, "清单中没有记录"
+    if entry.get('data_hash') != data_hash:
+        return True, "输入数据已变化"
+    if entry.get('hyperparams_hash') != hash_hyperparams(hyperparams):
+        return True, "超参数已变化"
+    for kind, artifact in entry.get('artifacts', {}).items():
+        path = os.path.join(model_dir, artifact['file'])
+        if not os.path.exists(path):
+            return True, f"{kind} 文件缺失"
+        if file_checksum(path) != artifact['sha256']:
+            return True, f"{kind} 文件校验值不一致"
+    return False, "最新"
+
+
+def record_province(manifest: dict, province: str, data_hash: str, hyperparams: dict, artifact_paths: dict,
+                    overrides: dict = None):
+    """
+    训练并导出成功后，把该省份的数据哈希、超参数和产物校验值写入清单
+    :param overrides: 相对 train.py 默认值的超参数覆盖 (sweep.py 晋升的配置)；为 None 时保留清单中已有的记录
+    """
+    if overrides is None:
+        overrides = manifest['provinces'].get(province, {}).get('overrides', {})
+    manifest['provinces'][province] = {
+        'data_hash': data_hash,
+        'hyperparams_hash': hash_hyperparams(hyperparams),
+        'hyperparams': hyperparams,
+        'overrides': overrides,
+        'artifacts': {
+            kind: {'file': os.path.basename(path), 'sha256': file_checksum(path)}
+            for kind, path in artifact_paths.items()
+        },
+        'updated_at': datetime.datetime.now().isoformat(),
+    }
+
+
+def refresh_artifact(manifest: dict, province: str, kind: str, path: str) -> bool:
+    """产物文件在训练之后被修改 (如写入回测结果) 时更新其校验值；清单中没有该产物时返回 False"""
+    entry = manifest['provinces'].get(province)
+    if entry is None or kind not in entry.get('artifacts', {}):
+        return False
+    entry['artifacts'][kind]['sha256'] = file_checksum(path)
+    return True
+
+
+def variant_model_path(model_dir: str, province: str, variant: str = 'fp32') -> str:
+    """省份 ONNX 模型的路径，fp32 为训练时导出的原始模型，其他变体为 {省份}_seq2seq_gdp_model.{变体}.onnx"""
+    suffix = '' if variant == 'fp32' else f'.{variant}'
+    return os.path.join(model_dir, f"{province}_seq2seq_gdp_model{suffix}.onnx")
+
+
+def load_quantization_report(model_dir: str) -> dict:
+    """读取模型变体报告，不存在或版本不匹配时返回空报告"""
+    path = os.path.join(model_dir, QUANTIZATION_REPORT_NAME)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                report = json.load(f)
+            if report.get('version') == QUANTIZATION_REPORT_VERSION:
+                return report
+        except (OSError, ValueError) as e:
+            print(f"警告: 读取模型变体报告失败: {e}")
+    return {'version': QUANTIZATION_REPORT_VERSION, 'provinces': {}}
+
+
+def save_quantization_report(report: dict, model_dir: str):
+    """与清单相同，先写临时文件再替换"""
+    path = os.path.join(model_dir, QUANTIZATION_REPORT_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def recorded_hyperparams(manifest: dict, province: str, defaults: dict) -> dict:
+    """
+    清单中记录的省份正式模型训练时的超参数 (回测、增量更新与正式模型保持一致)；
+    没有记录或记录中缺少的项使用 defaults (train.current_hyperparams())。
+    与 train.province_hyperparams 不同，后者是下一次训练要使用的超参数 (默认值加晋升的覆盖值)
+    """
+    hyperparams = dict(defaults)
+    entry = manifest['provinces'].get(province)
+    if entry is not None:
+        hyperparams.update(entry['hyperparams'])
+    return hyperparams
+
+
+def get_hyperparams(model_dir: str, province: str) -> dict:
+    """
+    读取省份模型训练时使用的超参数，供推理服务使用。
+    优先读取清单；旧模型没有清单记录时回退到 {province}_training_metrics.json。
+    """
+    entry = load_manifest(model_dir)['provinces'].get(province)
+    if entry is not None:
+        return entry['hyperparams']
+
+    metrics_path = os.path.join(model_dir, f"{province}_training_metrics.json")
+    if os.path.exists(metrics_path):
+        with open(metrics_path, 'r', encoding='utf-8') as f:
+            return json.load(f)['hyperparams']
+
+    raise FileNotFoundError(f"未找到 {province} 的模型清单记录或训练指标文件，无法确定超参数。")
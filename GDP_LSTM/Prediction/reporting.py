@@ -0,0 +1,132 @@
+import os
+import json
+import html
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 延迟绘图时，每个省份目录下保存的原始序列文件
+SERIES_FILE = "plot_series.json"
+REPORT_FILE = "report.html"
+
+
+def build_series(province, origin_data: pd.DataFrame, train_pred: np.ndarray, train_true: np.ndarray,
+                 pred_years, pred_gdp: np.ndarray, results: dict, window_size: int) -> dict:
+    """收集绘图所需的全部原始数据 (只包含可 JSON 序列化的类型)"""
+    return {
+        'province': province,
+        'window_size': window_size,
+        'origin_data': {
+            'columns': origin_data.columns.tolist(),
+            'index': origin_data.index.tolist(),
+            'values': origin_data.values.tolist(),
+        },
+        'train_pred': np.asarray(train_pred).tolist(),
+        'train_true': np.asarray(train_true).tolist(),
+        'pred_years': [int(y) for y in pred_years],
+        'pred_gdp': np.asarray(pred_gdp).tolist(),
+        'metrics': results,
+    }
+
+
+def save_series(series: dict, out_dir: str) -> str:
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, SERIES_FILE)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(series, f, ensure_ascii=False)
+    return path
+
+
+def render_series(series: dict, out_dir: str, show=False) -> list[str]:
+    """把一个省份的序列渲染成 PNG，返回生成的文件列表"""
+    import utils
+
+    os.makedirs(out_dir, exist_ok=True)
+    province = series['province']
+    origin = series['origin_data']
+    origin_data = pd.DataFrame(origin['values'], index=origin['index'], columns=origin['columns'])
+
+    paths = [
+        os.path.join(out_dir, 'data_trend.png'),
+        os.path.join(out_dir, 'train_comparison.png'),
+        os.path.join(out_dir, 'gdp_forecast.png'),
+    ]
+    utils.create_plot_sequences(origin_data, province, save_path=paths[0], show=show)
+    utils.plot_training_comparison(
+        origin_data=origin_data,
+        data_x=None,
+        data_y_pred=np.asarray(series['train_pred']),
+        data_y_true=np.asarray(series['train_true']),
+        province=province,
+        window_size=series['window_size'],
+        gdp_col_name='GDP',
+        save_path=paths[1],
+        show=show
+    )
+    utils.plot_gdp_comparison(
+        origin_data=origin_data,
+        province=province,
+        pred_years=series['pred_years'],
+        pred_gdp_values=np.asarray(series['pred_gdp']),
+        gdp_col_name='GDP',
+        save_path=paths[2],
+        show=show
+    )
+    paths += utils.plot_training_metrics(series['metrics'], out_dir, show=show)
+    return paths
+
+
+def _init_render_worker():
+    # 子进程只渲染文件，使用无界面的 Agg 后端
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _render_file(series_path: str):
+    try:
+        with open(series_path, 'r', encoding='utf-8') as f:
+            series = json.load(f)
+        return series['province'], render_series(series, os.path.dirname(series_path)), ''
+    except Exception as e:
+        return os.path.basename(os.path.dirname(series_path)), [], f"{type(e).__name__}: {e}"
+
+
+def render_deferred(plot_root: str, series_paths: list, workers: int = 1, combined: bool = False) -> dict:
+    """
+    训练结束后统一渲染本次训练保存的 plot_series.json (plot_root 中以前留下的序列不渲染)
+    :param series_paths: 本次训练保存的序列文件 (train.record_outputs 的返回值)
+    :param workers: 渲染进程数
+    :param combined: 额外生成一个汇总这些省份图表的 plot_root/report.html
+    :return: {省份: 生成的图片路径列表}
+    """
+    rendered = {}
+    with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_render_worker) as executor:
+        futures = [executor.submit(_render_file, path) for path in series_paths]
+        for future in as_completed(futures):
+            province, paths, error = future.result()
+            if error:
+                print(f"❌ {province} 图表渲染失败: {error}")
+            else:
+                rendered[province] = paths
+    print(f"✅ 已渲染 {len(rendered)} 个省份的图表: {plot_root}")
+
+    if combined:
+        report_path = write_combined_report(plot_root, rendered)
+        print(f"✅ 汇总报告已生成: {report_path}")
+    return rendered
+
+
+def write_combined_report(plot_root: str, rendered: dict) -> str:
+    """生成一个引用全部省份图表的 HTML 报告"""
+    sections = []
+    for province in sorted(rendered):
+        images = ''.join(
+            f'<img src="{html.escape(os.path.relpath(path, plot_root))}" style="max-width:48%;margin:4px">'
+            for path in rendered[province]
+        )
+        sections.append(f'<h2>{html.escape(province)}</h2>\n<div>{images}</div>')
+    path = os.path.join(plot_root, REPORT_FILE)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>训练报告</title></head><body>\n'
+                '<h1>各省份 GDP 模型训练报告</h1>\n' + '\n'.join(sections) + '\n</body></html>\n')
+    return path
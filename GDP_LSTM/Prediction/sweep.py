@@ -0,0 +1,254 @@
+import os
+import json
+import random
+import argparse
+import itertools
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+import torch
+from torch import nn
+
+import data_setup
+import engine
+import registry
+import train
+import utils
+
+# 可搜索的超参数；未出现在搜索空间中的超参数使用 train.py 中的默认值
+SEARCHABLE_KEYS = ['hidden_size', 'num_layers', 'window_size', 'predict_steps',
+                   'learning_rate', 'num_epochs', 'batch_size']
+
+# 未指定 --space 时使用的搜索空间
+DEFAULT_SPACE = {
+    'hidden_size': [8, 16],
+    'num_layers': [1, 2],
+    'window_size': [4, 6],
+    'learning_rate': [0.001, 0.005],
+}
+
+SWEEP_DIR = "sweeps"
+# 数据的最后 VAL_YEARS 年是所有试验共同的验证目标年份：训练窗口的预测目标都在这些年份之前，
+# 验证窗口的预测目标都落在这些年份中，窗口大小和预测步数不同的试验都在同样的年份上比较
+VAL_YEARS = 2
+
+# 子进程中共享的预处理数据: {省份: {'data': 归一化后的数据, 'scaler': 归一化参数}}
+_SHARED_DATA = {}
+
+
+def load_space(space_arg):
+    """--space 可以是 JSON 字符串，也可以是 JSON 文件路径"""
+    if space_arg is None:
+        return DEFAULT_SPACE
+    if os.path.exists(space_arg):
+        with open(space_arg, 'r', encoding='utf-8') as f:
+            space = json.load(f)
+    else:
+        space = json.loads(space_arg)
+    unknown = set(space) - set(SEARCHABLE_KEYS)
+    if unknown:
+        raise ValueError(f"搜索空间包含不支持的超参数: {sorted(unknown)}，可选: {SEARCHABLE_KEYS}")
+    return space
+
+
+def generate_trials(space, mode='grid', num_trials=None, seed=0):
+    """
+    根据搜索空间生成试验配置
+    :param mode: grid 网格搜索全部组合; random 从全部组合中随机抽取 num_trials 个
+    """
+    keys = sorted(space)
+    combos = [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+    if mode == 'random' and num_trials is not None and num_trials < len(combos):
+        combos = random.Random(seed).sample(combos, num_trials)
+    return combos
+
+
+def preprocess(provinces):
+    """每个省份只读取和归一化一次，所有试验共用"""
+    shared = {}
+    panel = data_setup.load_panel(train.data_dir)
+    for province in provinces:
+        _, data = data_setup.create_dataset(train.data_dir, province)
+        shared[province] = {'data': data, 'scaler': data_setup.province_scaler(panel, province)}
+    return shared
+
+
+def _init_worker(shared, num_threads):
+    global _SHARED_DATA
+    _SHARED_DATA = shared
+    torch.set_num_threads(num_threads)
+
+
+def split_by_years(data_x, data_y, num_years, window_size, predict_steps, val_years=VAL_YEARS):
+    """
+    按固定的验证年份划分窗口：窗口 i 的预测目标为第 i + window_size 到 i + window_size + predict_steps - 1 年。
+    训练窗口的目标都在最后 val_years 年之前，验证窗口的目标都在最后 val_years 年之内，跨越两段的窗口不使用
+    """
+    if predict_steps > val_years:
+        raise ValueError(f"预测步数 ({predict_steps}) 超过验证年数 ({val_years})")
+    first_val_year = num_years - val_years
+    num_train = first_val_year - window_size - predict_steps + 1
+    if num_train < 1:
+        raise ValueError(f"数据只有 {num_years} 年，留出 {val_years} 个验证年份后没有训练窗口")
+    val_start = first_val_year - window_size
+    return data_x[:num_train], data_y[:num_train], data_x[val_start:], data_y[val_start:]
+
+
+def run_trial(trial_id, overrides, province):
+    """在一个省份上训练一个配置，返回该 (试验, 省份) 的最终指标"""
+    start = timer()
+    hyperparams = train.current_hyperparams(overrides=overrides)
+    row = {'trial': trial_id, 'province': province, **{k: hyperparams[k] for k in SEARCHABLE_KEYS}}
+    try:
+        data = _SHARED_DATA[province]['data']
+        data_x, data_y, _, _ = utils.create_training_sequences(
+            data,
+            hyperparams['window_size'],
+            hyperparams['predict_steps'],
+            train.GDP_COL_INDEX
+        )
+        train_x, train_y, val_x, val_y = split_by_years(
+            data_x, data_y, len(data), hyperparams['window_size'], hyperparams['predict_steps'])
+
+        torch.manual_seed(hyperparams['seed'])
+        model = train.build_model(hyperparams)
+        optimizer = torch.optim.Adam(model.parameters(), lr=hyperparams['learning_rate'])
+        results = engine.train(
+            model,
+            train_x,
+            train_y,
+            nn.MSELoss(),
+            optimizer,
+            hyperparams['num_epochs'],
+            train.device,
+            batch_size=hyperparams['batch_size'],
+            val_x=val_x,
+            val_y=val_y,
+            verbose=False)
+
+        # 反归一化后的 GDP 误差 (单位亿，MAPE 为百分比)，不同配置的归一化损失不能直接比较
+        model.eval()
+        with torch.no_grad():
+            predicted = model(engine.to_tensor(val_x, train.device)).cpu().numpy()[..., 0]
+        scaler = _SHARED_DATA[province]['scaler']
+        gdp = train.GDP_COL_INDEX
+        predicted = (predicted - scaler['min'][gdp]) / scaler['scale'][gdp]
+        actual = (np.asarray(val_y)[..., 0] - scaler['min'][gdp]) / scaler['scale'][gdp]
+        row.update({
+            'status': 'ok',
+            'final_train_loss': results['train_loss'][-1],
+            'final_val_loss': results['val_loss'][-1],
+            'val_gdp_mae': float(np.abs(predicted - actual).mean()),
+            'val_gdp_mape': float((np.abs(predicted - actual) / np.abs(actual)).mean() * 100),
+            'error': '',
+        })
+    except Exception as e:
+        traceback.print_exc()
+        row.update({'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+    row['seconds'] = timer() - start
+    return row
+
+
+def run_sweep(provinces, trials, workers=1):
+    """用进程池运行全部 (试验, 省份) 组合，返回结果表"""
+    shared = preprocess(provinces)
+    threads_per_worker = max(1, (os.cpu_count() or 1) // max(1, workers))
+    rows = []
+    with ProcessPoolExecutor(max_workers=max(1, workers),
+                             initializer=_init_worker,
+                             initargs=(shared, threads_per_worker)) as executor:
+        futures = [
+            executor.submit(run_trial, trial_id, overrides, province)
+            for trial_id, overrides in enumerate(trials)
+            for province in provinces
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            row = future.result()
+            rows.append(row)
+            print(f"[{done}/{len(futures)}] 试验 {row['trial']} {row['province']}: "
+                  f"{row['status']} val_gdp_mape={row.get('val_gdp_mape', float('nan')):.2f}%")
+    return pd.DataFrame(rows).sort_values(['trial', 'province']).reset_index(drop=True)
+
+
+def best_configs(results: pd.DataFrame, predict_steps=None) -> dict:
+    """
+    每个省份取验证年份上 GDP MAPE 最小的配置。
+    只在预测步数相同的试验之间比较 (预测步数不同时同一年份的预测距离不同)：
+    predict_steps 为 None 时，结果中只有一种预测步数则使用它，否则使用 train.py 的 PREDICT_STEPS
+    """
+    ok = results[results['status'] == 'ok']
+    if predict_steps is None:
+        horizons = sorted(ok['predict_steps'].unique())
+        predict_steps = horizons[0] if len(horizons) == 1 else train.PREDICT_STEPS
+    ok = ok[ok['predict_steps'] == predict_steps]
+    if ok.empty:
+        raise ValueError(f"没有预测步数为 {predict_steps} 的成功试验")
+    best = ok.loc[ok.groupby('province')['val_gdp_mape'].idxmin()]
+    configs = {}
+    for _, row in best.iterrows():
+        configs[row['province']] = {
+            key: (float(row[key]) if key == 'learning_rate' else int(row[key]))
+            for key in SEARCHABLE_KEYS
+        }
+    return configs
+
+
+def promote(configs: dict):
+    """用每个省份的最优配置在全部窗口上重新训练，写入 models/ 和清单"""
+    manifest = registry.load_manifest(train.MODEL_PATH)
+    train_options = dict(train.default_train_options(), patience=0, plots='none')
+    for province, overrides in configs.items():
+        print(f"⬆️ {province} 使用最优配置重新训练: {overrides}")
+        hyperparams = train.current_hyperparams(train_options, overrides)
+        summary = train.run_province(province, train_options, hyperparams)
+        if summary['status'] == 'ok':
+            # 记录覆盖值，之后直接运行 train.py 时该省份继续使用晋升的配置
+            train.record_outputs(manifest, province, summary['data_hash'], summary['artifacts'], hyperparams,
+                                 overrides)
+        else:
+            print(f"❌ {province} 晋升失败: {summary['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并行超参数搜索")
+    parser.add_argument('--space', default=None,
+                        help="搜索空间: JSON 字符串或 JSON 文件路径，如 '{\"hidden_size\": [8, 16]}'")
+    parser.add_argument('--mode', choices=['grid', 'random'], default='grid')
+    parser.add_argument('--trials', type=int, default=None, help="random 模式下的试验数量")
+    parser.add_argument('--seed', type=int, default=0, help="random 模式的随机种子")
+    parser.add_argument('--provinces', nargs='*', default=None, help="只在指定省份上搜索，默认全部省份")
+    parser.add_argument('--workers', type=int, default=data_setup.NUM_WORKERS)
+    parser.add_argument('--out', default=os.path.join(SWEEP_DIR, "results.csv"), help="结果表路径")
+    parser.add_argument('--promote', action='store_true',
+                        help="把每个省份验证损失最小的配置重新训练并写入 models/")
+    parser.add_argument('--from-results', default=None,
+                        help="不重新搜索，直接根据已有结果表晋升最优配置")
+    parser.add_argument('--predict-steps', type=int, default=None,
+                        help="只在该预测步数的试验中选择最优配置，默认与 train.py 的 PREDICT_STEPS 相同")
+    args = parser.parse_args()
+
+    if args.from_results:
+        results = pd.read_csv(args.from_results, encoding='utf-8-sig')
+        promote(best_configs(results, args.predict_steps))
+        return
+
+    provinces = args.provinces or train.PROVINCES
+    trials = generate_trials(load_space(args.space), args.mode, args.trials, args.seed)
+    print(f"共 {len(trials)} 组配置 × {len(provinces)} 个省份")
+
+    results = run_sweep(provinces, trials, args.workers)
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    results.to_csv(args.out, index=False, encoding='utf-8-sig')
+    print(f"✅ 搜索结果已保存: {args.out}")
+
+    configs = best_configs(results, args.predict_steps)
+    print(pd.DataFrame.from_dict(configs, orient='index').to_string())
+    if args.promote:
+        promote(configs)
+
+
+if __name__ == "__main__":
+    main()
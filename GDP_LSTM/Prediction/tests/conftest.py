@@ -0,0 +1,70 @@
+import os
+import sys
+import shutil
+
+import pytest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+prediction_dir = os.path.dirname(tests_dir)
+for path in (prediction_dir, os.path.join(prediction_dir, "backend_api")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import data_setup
+
+# 测试只用两个省份，数据来自仓库中的 data/ 和 models/
+TEST_PROVINCES = ["北京市", "西藏自治区"]
+DATA_DIR = os.path.join(os.path.dirname(prediction_dir), "data")
+MODEL_DIR = os.path.join(prediction_dir, "models")
+MODEL_SUFFIXES = ("_seq2seq_gdp_model.onnx", "_seq2seq_gdp_model.onnx.data", "_seq2seq_gdp_model.pth",
+                  "_training_metrics.json", data_setup.SCALER_SUFFIX)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """只包含四个 Year*.csv 的临时数据目录 (没有面板快照)"""
+    path = tmp_path / "data"
+    path.mkdir()
+    for name in data_setup.FEATURE_FILES:
+        shutil.copy(data_setup.resolve_data_file(DATA_DIR, name), path)
+    return path
+
+
+def touch(path, seconds=1):
+    """推后文件的修改时间，模拟 CSV 被重新写入"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 1_000_000_000))
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    """只包含 TEST_PROVINCES 各自 fp32 模型的临时模型目录 (与只部署了各省份 ONNX 文件的默认环境相同)"""
+    path = tmp_path / "models"
+    path.mkdir()
+    for province in TEST_PROVINCES:
+        for suffix in MODEL_SUFFIXES:
+            source = os.path.join(MODEL_DIR, f"{province}{suffix}")
+            if os.path.exists(source):
+                shutil.copy(source, path)
+    return path
+
+
+@pytest.fixture
+def service(model_dir, tmp_path, monkeypatch):
+    """模型目录指向 model_dir、进程内缓存全部清空的 gdp_onnx_service"""
+    # config.py 导入时在当前目录下创建 output/，避免写到仓库里
+    monkeypatch.chdir(tmp_path)
+    import gdp_onnx_service
+
+    monkeypatch.setattr(gdp_onnx_service, 'MODEL_DIR', str(model_dir))
+    monkeypatch.setattr(gdp_onnx_service, 'ORT_CACHE_DIR', str(model_dir / "ort_cache"))
+    monkeypatch.setattr(gdp_onnx_service, '_combined_model', None)
+    monkeypatch.setattr(gdp_onnx_service, '_ensemble_model', None)
+    monkeypatch.setattr(gdp_onnx_service, '_predictors_cache',
+                        gdp_onnx_service.PredictorCache(gdp_onnx_service.PREDICTOR_CACHE_SIZE))
+    monkeypatch.setattr(gdp_onnx_service, '_result_cache', {})
+    monkeypatch.setattr(gdp_onnx_service, '_result_stats', {"hits": 0, "misses": 0})
+    monkeypatch.setattr(gdp_onnx_service, '_data_version', {"value": None, "checked_at": 0.0})
+    monkeypatch.setattr(gdp_onnx_service, '_model_checked_at', {})
+    monkeypatch.setattr(gdp_onnx_service, '_shared_model_versions', {})
+    return gdp_onnx_service
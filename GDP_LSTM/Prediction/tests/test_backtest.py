@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import backtest
+import train
+
+NUM_PROVINCES, NUM_YEARS, NUM_FEATURES = 2, 20, 4
+HYPERPARAMS = {'window_size': 6, 'predict_steps': 2}
+
+
+def panel():
+    return np.random.default_rng(0).random((NUM_PROVINCES, NUM_YEARS, NUM_FEATURES)) * 100 + 1
+
+
+def origin_rows(batch, index):
+    """build_backtest_batch 结果中第 index 个起点的各模型数据"""
+    rows = slice(index * NUM_PROVINCES, (index + 1) * NUM_PROVINCES)
+    return [array[rows] for array in batch]
+
+
+@pytest.mark.parametrize('window_size, predict_steps', [(6, 2), (4, 1)])
+def test_origins_have_enough_windows_and_known_targets(window_size, predict_steps):
+    origins = backtest.forecast_origins(NUM_YEARS, window_size, predict_steps, min_train_windows=3)
+    assert origins
+    for origin in origins:
+        assert origin - window_size - predict_steps + 1 >= 3
+        assert origin + predict_steps <= NUM_YEARS
+
+
+def test_no_data_from_or_after_origin_is_used():
+    """把起点及之后的年份改成极端值，该起点的训练数据、预测输入和归一化参数都不应改变"""
+    data = panel()
+    origins = backtest.forecast_origins(NUM_YEARS, HYPERPARAMS['window_size'], HYPERPARAMS['predict_steps'])
+    batch = backtest.build_backtest_batch(data, origins, HYPERPARAMS)
+    for index, origin in enumerate(origins):
+        future_changed = data.copy()
+        future_changed[:, origin:] *= 1000
+        changed = backtest.build_backtest_batch(future_changed, origins, HYPERPARAMS)
+        for actual, expected in zip(origin_rows(changed, index), origin_rows(batch, index)):
+            np.testing.assert_array_equal(actual, expected)
+
+
+def test_training_targets_precede_origin():
+    """GDP 列等于年份序号时，训练目标都在起点之前，预测输入是起点前最近的窗口"""
+    data = panel()
+    data[:, :, train.GDP_COL_INDEX] = np.arange(NUM_YEARS)
+    origins = backtest.forecast_origins(NUM_YEARS, HYPERPARAMS['window_size'], HYPERPARAMS['predict_steps'])
+    data_x, data_y, forecast_x, data_min, data_range = backtest.build_backtest_batch(data, origins, HYPERPARAMS)
+    gdp_min = data_min[:, train.GDP_COL_INDEX, np.newaxis, np.newaxis]
+    gdp_range = data_range[:, train.GDP_COL_INDEX, np.newaxis, np.newaxis]
+    years_y = data_y[..., 0] * gdp_range + gdp_min
+    years_forecast = forecast_x[:, 0, :, train.GDP_COL_INDEX] * gdp_range[:, 0] + gdp_min[:, 0]
+    for m, origin in enumerate(np.repeat(origins, NUM_PROVINCES)):
+        assert years_y[m].max() == pytest.approx(origin - 1)
+        np.testing.assert_allclose(years_forecast[m], np.arange(origin - HYPERPARAMS['window_size'], origin))
@@ -0,0 +1,56 @@
+import os
+
+import torch
+
+import train
+from conftest import TEST_PROVINCES
+
+PROVINCE = TEST_PROVINCES[0]
+EPOCHS = 4
+
+
+def run(monkeypatch, tmp_path, interrupt=False, learning_rate=train.LEARNING_RATE, **options):
+    """训练 PROVINCE；interrupt 时在训练结束、保存产物之前中断，检查点保留下来"""
+    monkeypatch.setattr(train, 'MODEL_PATH', str(tmp_path / 'models'))
+    monkeypatch.setattr(train, 'CHECKPOINT_DIR', str(tmp_path / 'checkpoints'))
+    train_options = dict(train.default_train_options(), plots='none', checkpoint_every=2, resume=True, **options)
+    hyperparams = train.current_hyperparams(train_options, {'num_epochs': EPOCHS, 'learning_rate': learning_rate})
+    if interrupt:
+        def stop(*args, **kwargs):
+            raise KeyboardInterrupt
+        monkeypatch.setattr(train, 'save_province_outputs', stop)
+    try:
+        return train.train_province(PROVINCE, train_options, hyperparams)[0]
+    except KeyboardInterrupt:
+        return None
+    finally:
+        monkeypatch.undo()
+
+
+def checkpoint_path(tmp_path):
+    return tmp_path / 'checkpoints' / f"{PROVINCE}_checkpoint.pt"
+
+
+def test_matching_checkpoint_is_resumed(tmp_path, monkeypatch):
+    run(monkeypatch, tmp_path, interrupt=True)
+    assert torch.load(checkpoint_path(tmp_path), weights_only=False)['epoch'] == EPOCHS
+    results = run(monkeypatch, tmp_path)
+    # 检查点已完成全部轮次，恢复后不再训练，指标直接来自检查点
+    assert len(results['train_loss']) == EPOCHS
+    assert not os.path.exists(checkpoint_path(tmp_path))
+
+
+def test_checkpoint_without_validation_is_discarded_when_patience_is_enabled(tmp_path, monkeypatch):
+    run(monkeypatch, tmp_path, interrupt=True)
+    results = run(monkeypatch, tmp_path, patience=2, val_size=2)
+    assert len(results['val_loss']) == len(results['train_loss']) > 0
+
+
+def test_changed_learning_rate_discards_checkpoint(tmp_path, monkeypatch):
+    run(monkeypatch, tmp_path, interrupt=True)
+    saved = torch.load(checkpoint_path(tmp_path), weights_only=False)
+    run(monkeypatch, tmp_path, interrupt=True, learning_rate=0.01)
+    resaved = torch.load(checkpoint_path(tmp_path), weights_only=False)
+    assert resaved['optimizer_state']['param_groups'][0]['lr'] == 0.01
+    assert resaved['meta']['hyperparams']['learning_rate'] == 0.01
+    assert saved['meta'] != resaved['meta']
@@ -0,0 +1,57 @@
+import copy
+
+import numpy as np
+import pytest
+import torch
+from torch import nn
+
+import engine
+import train
+from conftest import TEST_PROVINCES
+
+
+@pytest.fixture
+def prepared():
+    return train.prepare_province(TEST_PROVINCES[0])
+
+
+def seeded_model():
+    torch.manual_seed(train.SEED)
+    return train.build_model()
+
+
+@pytest.mark.parametrize('batch_size', [1, 4])
+def test_train_step_matches_reference(prepared, batch_size):
+    """每个 mini-batch 一次前向/反向传播，batch_size=1 即原来的逐样本训练"""
+    data_x, data_y = prepared['data_x'], prepared['data_y']
+    model = seeded_model()
+    reference = copy.deepcopy(model)
+    optimizer = torch.optim.Adam(model.parameters(), lr=train.LEARNING_RATE)
+    reference_optimizer = torch.optim.Adam(reference.parameters(), lr=train.LEARNING_RATE)
+
+    engine.train_step(model, data_x, data_y, nn.MSELoss(), optimizer, 'cpu', batch_size=batch_size)
+    for start in range(0, len(data_x), batch_size):
+        x = engine.to_tensor(data_x[start:start + batch_size], 'cpu')
+        y = engine.to_tensor(data_y[start:start + batch_size], 'cpu')
+        reference_optimizer.zero_grad()
+        nn.MSELoss()(reference(x), y).backward()
+        reference_optimizer.step()
+
+    for (name, value), expected in zip(model.state_dict().items(), reference.state_dict().values()):
+        torch.testing.assert_close(value, expected, msg=name)
+
+
+def test_test_step_metrics_do_not_depend_on_batch_size(prepared):
+    """按批次样本数加权后，各批大小的平均指标与逐样本平均相同"""
+    model = seeded_model()
+    metrics = [engine.test_step(model, prepared['data_x'], prepared['data_y'], nn.MSELoss(), 'cpu', batch_size=size)
+               for size in (1, 3, len(prepared['data_x']))]
+    for result in metrics[1:]:
+        np.testing.assert_allclose(result, metrics[0], rtol=1e-5)
+
+
+def test_empty_data_returns_none():
+    model = seeded_model()
+    empty_x = np.zeros((0, train.WINDOW_SIZE, train.INPUT_FEATURE_SIZE))
+    empty_y = np.zeros((0, train.PREDICT_STEPS, 1))
+    assert engine.test_step(model, empty_x, empty_y, nn.MSELoss(), 'cpu') is None
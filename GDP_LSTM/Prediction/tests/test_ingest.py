@@ -0,0 +1,206 @@
+import os
+import csv
+
+import pytest
+
+import data_setup
+import ingest
+from conftest import DATA_DIR
+
+GDP = data_setup.FEATURE_COLUMNS.index('GDP')
+
+
+def read_rows(path):
+    with ingest.open_text(path) as f:
+        return [row for row in csv.reader(f)]
+
+
+def write_rows(path, rows, encoding='utf-8'):
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        csv.writer(f, lineterminator='\n').writerows(rows)
+
+
+def header_index(rows):
+    return next(i for i, row in enumerate(rows) if row and row[0].strip() == ingest.REGION_HEADER)
+
+
+def row_index(rows, region):
+    return next(i for i, row in enumerate(rows) if row and row[0].strip() == region)
+
+
+@pytest.fixture
+def sources(tmp_path):
+    """仓库中四个宽表的 UTF-8 副本，返回 [表格行] 和写回文件的函数"""
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    paths = [str(source_dir / name) for name in ingest.WIDE_FILES]
+    tables = [read_rows(os.path.join(DATA_DIR, name)) for name in ingest.WIDE_FILES]
+
+    def save():
+        for path, rows in zip(paths, tables):
+            write_rows(path, rows)
+        return paths
+
+    save()
+    return tables, save
+
+
+def year_files(data_dir):
+    return {name: ingest.read_year_file(data_setup.resolve_data_file(str(data_dir), name))
+            for name in data_setup.FEATURE_FILES}
+
+
+def year_values(data_dir):
+    """Year*.csv 的省份列顺序和数值 (宽表中的数字格式与 Year*.csv 不完全相同，如 5876.50 与 5876.5)"""
+    return {
+        name: (provinces, {year: {province: float(cell) for province, cell in row.items()} for year, row in table.items()})
+        for name, (provinces, table) in year_files(data_dir).items()
+    }
+
+
+def file_bytes(data_dir):
+    return {name: open(data_setup.resolve_data_file(str(data_dir), name), 'rb').read()
+            for name in data_setup.FEATURE_FILES}
+
+
+def test_existing_values_round_trip(data_dir, sources):
+    """用导出 Year*.csv 时的宽表重新导入，已有的数值原样保留"""
+    _, save = sources
+    before = year_values(data_dir)
+    years = ingest.ingest(save(), str(data_dir))
+
+    assert year_values(data_dir) == before
+    assert all(value[0] == data_setup.FIRST_YEAR for value in years.values())
+    assert os.path.exists(os.path.join(data_dir, data_setup.SNAPSHOT_NAME))
+    assert not [name for name in os.listdir(data_dir) if name.endswith('.tmp')]
+
+
+def test_replace_writes_the_same_files(tmp_path, data_dir, sources):
+    _, save = sources
+    out_dir = tmp_path / "fresh"
+    ingest.ingest(save(), str(out_dir), replace=True)
+    assert year_values(out_dir) == year_values(data_dir)
+
+
+def test_new_values_win_when_merging(data_dir, sources):
+    """重叠年份以新导出的数据为准 (统计局修订)，新数据中没有的早期年份保留已有的值"""
+    tables, save = sources
+    rows = tables[GDP]
+    header = header_index(rows)
+    # 只保留最近 10 年 (表头中年份从新到旧)，修订北京 2024 年的 GDP
+    for i in range(header, len(rows)):
+        if rows[i] and (i == header or rows[i][0].strip() in data_setup.PROVINCES):
+            rows[i] = rows[i][:11]
+    rows[row_index(rows, '北京市')][1] = '50000.5'
+    before = year_files(data_dir)
+    last_year = max(before[data_setup.FEATURE_FILES[GDP]][1])
+
+    ingest.ingest(save(), str(data_dir))
+    provinces, table = year_files(data_dir)[data_setup.FEATURE_FILES[GDP]]
+    old_provinces, old_table = before[data_setup.FEATURE_FILES[GDP]]
+    assert provinces == old_provinces
+    assert table[last_year]['北京市'] == '50000.5'
+    assert table[last_year]['天津市'] == old_table[last_year]['天津市']
+    assert table[data_setup.FIRST_YEAR] == old_table[data_setup.FIRST_YEAR]
+    assert sorted(table) == sorted(old_table)
+
+
+def drop_header(rows):
+    del rows[header_index(rows)]
+
+
+def bad_year_label(rows):
+    rows[header_index(rows)][2] = '2023'
+
+
+def missing_year_column(rows):
+    header = header_index(rows)
+    for row in rows[header:]:
+        if row and (row[0].strip() == ingest.REGION_HEADER or row[0].strip() in data_setup.PROVINCES):
+            del row[2]
+
+
+def unknown_region(rows):
+    rows.insert(header_index(rows) + 1, ['火星省'] + rows[row_index(rows, '北京市')][1:])
+
+
+def duplicate_region(rows):
+    rows.insert(header_index(rows) + 1, list(rows[row_index(rows, '北京市')]))
+
+
+def missing_province(rows):
+    del rows[row_index(rows, '天津市')]
+
+
+def non_numeric_cell(rows):
+    rows[row_index(rows, '北京市')][3] = '约 45000'
+
+
+def empty_cell(rows):
+    rows[row_index(rows, '北京市')][3] = ''
+
+
+def short_row(rows):
+    rows[row_index(rows, '北京市')].pop()
+
+
+@pytest.mark.parametrize('corrupt, message', [
+    (drop_header, '未找到'),
+    (bad_year_label, '无法识别的年份列'),
+    (missing_year_column, '年份列不连续'),
+    (unknown_region, '未知地区'),
+    (duplicate_region, '重复出现'),
+    (missing_province, '缺少省份'),
+    (non_numeric_cell, '缺失或不是数值'),
+    (empty_cell, '缺失或不是数值'),
+    (short_row, '个数值'),
+])
+def test_malformed_files_are_rejected(data_dir, sources, corrupt, message):
+    """任何一个宽表有问题都不写入任何文件"""
+    tables, save = sources
+    corrupt(tables[GDP])
+    before = file_bytes(data_dir)
+    with pytest.raises(ingest.IngestError, match=message):
+        ingest.ingest(save(), str(data_dir))
+    assert file_bytes(data_dir) == before
+
+
+def test_year_ranges_must_match(tmp_path, sources):
+    """不合并已有数据时，四个特征的年份范围必须相同"""
+    tables, save = sources
+    rows = tables[GDP]
+    for row in rows[header_index(rows):]:
+        if row and (row[0].strip() == ingest.REGION_HEADER or row[0].strip() in data_setup.PROVINCES):
+            del row[1]
+    with pytest.raises(ingest.IngestError, match='年份范围不一致'):
+        ingest.ingest(save(), str(tmp_path / "fresh"), replace=True)
+
+
+def test_gbk_source(data_dir, sources, tmp_path):
+    """网页导出的 GBK 编码宽表与 UTF-8 的结果相同"""
+    tables, save = sources
+    paths = save()
+    gbk_path = str(tmp_path / "gbk.csv")
+    write_rows(gbk_path, tables[GDP], encoding='gbk')
+    paths[GDP] = gbk_path
+    before = year_values(data_dir)
+    ingest.ingest(paths, str(data_dir))
+    assert year_values(data_dir) == before
+
+
+def test_write_is_atomic(data_dir):
+    """写出过程中出错时原文件保持不变"""
+    path = data_setup.resolve_data_file(str(data_dir), data_setup.FEATURE_FILES[GDP])
+    before = open(path, 'rb').read()
+    provinces, table = ingest.read_year_file(path)
+    years = sorted(table)
+    # 最早一年缺少省份，写到最后一行时才出错
+    table[years[0]] = {}
+    with pytest.raises(KeyError):
+        ingest.write_year_file(path, provinces, years, table)
+    assert open(path, 'rb').read() == before
+
+    del table[years[0]]
+    ingest.write_year_file(path, provinces, years[1:], table)
+    assert ingest.read_year_file(path)[0] == provinces
+    assert not os.path.exists(path + '.tmp')
@@ -0,0 +1,120 @@
+import json
+
+import numpy as np
+import pytest
+import torch
+
+import model_builder
+import registry
+import train
+from conftest import TEST_PROVINCES
+
+REPLICAS = 3
+
+
+def point_predictions(service):
+    return {
+        province: [item['gdp'] for item in service.get_predictor_service(province).predict_gdp()['predictions']]
+        for province in TEST_PROVINCES
+    }
+
+
+def write_ensemble(model_dir):
+    """用各省份的 .pth 复制 REPLICAS 份组成集成模型，并写入与之一致的清单"""
+    # 旧的指标文件中缺少的超参数使用 train.py 中的默认值
+    hyperparams = {
+        province: {**train.current_hyperparams(),
+                   **json.loads((model_dir / f"{province}_training_metrics.json").read_text(encoding='utf-8'))['hyperparams']}
+        for province in TEST_PROVINCES
+    }
+    structure = {key: hyperparams[TEST_PROVINCES[0]][key] for key in
+                 ('input_feature_size', 'output_feature_size', 'hidden_size', 'num_layers',
+                  'predict_steps', 'window_size')}
+    state_dicts = [torch.load(model_dir / f"{province}_seq2seq_gdp_model.pth", map_location='cpu')
+                   for province in TEST_PROVINCES for _ in range(REPLICAS)]
+    model = model_builder.StackedSeq2Seq.from_state_dicts(
+        state_dicts,
+        input_size=structure['input_feature_size'],
+        hidden_size=structure['hidden_size'],
+        num_layers=structure['num_layers'],
+        output_size=structure['output_feature_size'],
+        predict_steps=structure['predict_steps']
+    ).eval()
+    base_path = model_dir / registry.ENSEMBLE_MODEL_NAME
+    train.export_stacked_onnx(model, structure, f"{base_path}.onnx")
+
+    data_hashes = {province: train.province_data_hash(province) for province in TEST_PROVINCES}
+    meta = {'provinces': TEST_PROVINCES, 'replicas': REPLICAS, 'hyperparams': structure, 'data_hashes': data_hashes}
+    (model_dir / f"{registry.ENSEMBLE_MODEL_NAME}.json").write_text(json.dumps(meta), encoding='utf-8')
+    manifest = registry.load_manifest(str(model_dir))
+    for province in TEST_PROVINCES:
+        manifest['provinces'][province] = {'data_hash': data_hashes[province], 'hyperparams': hyperparams[province]}
+    registry.save_manifest(manifest, str(model_dir))
+
+
+def test_per_province_fallback(service):
+    """没有集成模型和合并模型时用各省份自己的 ONNX 模型，输入为 float32 的批量窗口"""
+    assert service.get_ensemble_model() is None and service.get_combined_model() is None
+    result = service.predict_with_intervals(TEST_PROVINCES, level=0.9, bootstrap=20, seed=0)
+
+    assert result['errors'] == {}
+    assert result['samples'] == 21
+    assert [item['province'] for item in result['predictions']] == TEST_PROVINCES
+    for item in result['predictions']:
+        assert item['replicas'] == 1
+        for step in item['predictions']:
+            assert step['lower'] <= step['gdp'] <= step['upper']
+            assert step['lower'] < step['upper']
+
+
+def test_fallback_without_bootstrap_matches_point_prediction(service):
+    result = service.predict_with_intervals(TEST_PROVINCES, bootstrap=0)
+    expected = point_predictions(service)
+    for item in result['predictions']:
+        gdp = [step['gdp'] for step in item['predictions']]
+        np.testing.assert_allclose(gdp, expected[item['province']], atol=0.02)
+        assert all(step['lower'] == step['upper'] == step['gdp'] for step in item['predictions'])
+
+
+def test_seed_is_reproducible(service):
+    first = service.predict_with_intervals(TEST_PROVINCES, bootstrap=10, seed=3)
+    second = service.predict_with_intervals(TEST_PROVINCES, bootstrap=10, seed=3)
+    assert first == second
+
+
+def test_ensemble_path(service, model_dir):
+    """副本都是主模型的拷贝时，集成模型的结果与主模型一致"""
+    write_ensemble(model_dir)
+    assert service.get_ensemble_model() is not None
+    result = service.predict_with_intervals(TEST_PROVINCES, bootstrap=0)
+
+    assert result['errors'] == {}
+    expected = point_predictions(service)
+    for item in result['predictions']:
+        assert item['replicas'] == REPLICAS
+        np.testing.assert_allclose([step['gdp'] for step in item['predictions']], expected[item['province']], atol=0.02)
+        np.testing.assert_allclose([step['lower'] for step in item['predictions']], expected[item['province']], atol=0.02)
+
+
+@pytest.mark.parametrize('kwargs', [{'level': 1.0}, {'level': 0}, {'bootstrap': -1}, {'bootstrap': 100000}])
+def test_invalid_arguments(service, kwargs):
+    with pytest.raises(ValueError):
+        service.predict_with_intervals(TEST_PROVINCES, **kwargs)
+
+
+def test_ensemble_rechecked_after_rebuild(service, model_dir, monkeypatch):
+    """进程启动时没有集成模型，之后导出的集成模型在刷新后生效；清单中的数据哈希变化后不再使用"""
+    monkeypatch.setattr(service, 'RESULT_VERSION_TTL', 3600)
+    assert service.get_ensemble_model() is None
+    write_ensemble(model_dir)
+    # RESULT_VERSION_TTL 内沿用上次的检查结果
+    assert service.get_ensemble_model() is None
+    service.invalidate_result_versions()
+    assert service.get_ensemble_model() is not None
+
+    # 主模型用新数据重新训练后集成模型过期
+    manifest = registry.load_manifest(str(model_dir))
+    manifest['provinces'][TEST_PROVINCES[0]]['data_hash'] = 'retrained'
+    registry.save_manifest(manifest, str(model_dir))
+    service.invalidate_result_versions()
+    assert service.get_ensemble_model() is None
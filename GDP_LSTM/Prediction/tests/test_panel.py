@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_setup
+from conftest import TEST_PROVINCES, touch
+
+
+def csv_values(data_dir, province):
+    """直接用 pandas 读取一个省份的四个特征，年份从远到近"""
+    columns = [pd.read_csv(data_setup.resolve_data_file(str(data_dir), name))[province].to_numpy()[::-1]
+               for name in data_setup.FEATURE_FILES]
+    return np.stack(columns, axis=-1)
+
+
+def test_panel_matches_csv(data_dir):
+    panel = data_setup.load_panel(str(data_dir))
+    assert panel['values'].shape == (len(panel['years']), len(panel['provinces']), len(data_setup.FEATURE_COLUMNS))
+    assert panel['years'][0] == data_setup.FIRST_YEAR
+    selected = data_setup.select_provinces(panel, TEST_PROVINCES)
+    for index, province in enumerate(TEST_PROVINCES):
+        np.testing.assert_array_equal(selected[index], csv_values(data_dir, province))
+        origin_data, _ = data_setup.create_dataset(str(data_dir), province)
+        np.testing.assert_array_equal(origin_data.values, csv_values(data_dir, province))
+
+
+def test_panel_is_cached_and_read_only(data_dir):
+    panel = data_setup.load_panel(str(data_dir))
+    assert data_setup.load_panel(str(data_dir)) is panel
+    with pytest.raises(ValueError):
+        panel['values'][0, 0, 0] = 0
+
+
+def test_modified_csv_is_reloaded(data_dir):
+    panel = data_setup.load_panel(str(data_dir))
+    path = data_setup.resolve_data_file(str(data_dir), 'YearGDP.csv')
+    frame = pd.read_csv(path)
+    frame.loc[0, TEST_PROVINCES[0]] = 123456.0
+    frame.to_csv(path, index=False)
+    touch(path)
+
+    reloaded = data_setup.load_panel(str(data_dir))
+    assert reloaded is not panel
+    gdp = data_setup.FEATURE_COLUMNS.index('GDP')
+    assert reloaded['values'][-1, reloaded['provinces'].index(TEST_PROVINCES[0]), gdp] == 123456.0
@@ -0,0 +1,53 @@
+import pytest
+import torch
+
+import train
+from conftest import TEST_PROVINCES
+
+EPOCHS = 3
+
+
+def use_model_dir(monkeypatch, model_path):
+    # 进程池以 fork 启动，子进程继承修改后的路径
+    monkeypatch.setattr(train, 'MODEL_PATH', str(model_path))
+    monkeypatch.setattr(train, 'CHECKPOINT_DIR', str(model_path / 'checkpoints'))
+
+
+def options():
+    train_options = dict(train.default_train_options(), plots='none')
+    return train_options, train.current_hyperparams(train_options, {'num_epochs': EPOCHS})
+
+
+def load_models(model_path):
+    return {province: torch.load(model_path / f"{province}_seq2seq_gdp_model.pth") for province in TEST_PROVINCES}
+
+
+def test_parallel_matches_serial(tmp_path, monkeypatch):
+    train_options, hyperparams = options()
+    use_model_dir(monkeypatch, tmp_path / 'serial')
+    serial = [train.run_province(province, train_options, hyperparams) for province in TEST_PROVINCES]
+    use_model_dir(monkeypatch, tmp_path / 'parallel')
+    recorded = []
+    parallel = train.train_parallel(TEST_PROVINCES, 2, recorded.append, train_options,
+                                    {province: hyperparams for province in TEST_PROVINCES})
+
+    # 结果按输入顺序返回，每个省份完成时回调一次
+    assert [summary['province'] for summary in parallel] == TEST_PROVINCES
+    assert sorted(summary['province'] for summary in recorded) == sorted(TEST_PROVINCES)
+    for expected, summary in zip(serial, parallel):
+        assert summary['status'] == 'ok'
+        assert summary['final_train_loss'] == pytest.approx(expected['final_train_loss'])
+        assert summary['data_hash'] == expected['data_hash']
+    serial_models, parallel_models = load_models(tmp_path / 'serial'), load_models(tmp_path / 'parallel')
+    for province in TEST_PROVINCES:
+        for name, value in serial_models[province].items():
+            torch.testing.assert_close(parallel_models[province][name], value)
+
+
+def test_failed_province_does_not_stop_others(tmp_path, monkeypatch):
+    train_options, hyperparams = options()
+    use_model_dir(monkeypatch, tmp_path)
+    summaries = train.train_parallel([TEST_PROVINCES[0], "不存在的省"], 2, None, train_options,
+                                     {TEST_PROVINCES[0]: hyperparams})
+    assert [summary['status'] for summary in summaries] == ['ok', 'error']
+    assert summaries[1]['error']
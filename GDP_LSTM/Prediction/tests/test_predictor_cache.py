@@ -0,0 +1,110 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import TEST_PROVINCES
+
+THREADS = 8
+
+
+class Loader:
+    """记录调用次数的构建函数；release 之前阻塞，让其余线程都进入等待"""
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+        self.release = threading.Event()
+
+    def __call__(self, province):
+        self.calls.append(province)
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(province=province, variant='fp32')
+
+
+def get_concurrently(cache, province, loader):
+    """THREADS 个线程同时请求同一省份，返回各线程得到的预测器或异常"""
+    results = [None] * THREADS
+
+    def worker(i):
+        try:
+            results[i] = cache.get(province, loader)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    # 等所有线程都阻塞在构建上
+    time.sleep(0.2)
+    loader.release.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_gets_build_once(service):
+    cache = service.PredictorCache(4)
+    loader = Loader()
+    results = get_concurrently(cache, TEST_PROVINCES[0], loader)
+
+    assert loader.calls == [TEST_PROVINCES[0]]
+    assert all(result is results[0] for result in results)
+    stats = cache.stats()
+    assert stats['misses'] == 1 and stats['waits'] == THREADS - 1 and stats['hits'] == 0
+
+
+def test_load_error_reaches_every_waiter_and_is_not_cached(service):
+    cache = service.PredictorCache(4)
+    error = RuntimeError("模型加载失败")
+    loader = Loader(error)
+    results = get_concurrently(cache, TEST_PROVINCES[0], loader)
+
+    assert all(result is error for result in results)
+    assert len(loader.calls) == 1
+    stats = cache.stats()
+    assert stats['load_errors'] == 1 and stats['waits'] == THREADS - 1 and stats['size'] == 0
+
+    # 失败不缓存，下一次请求重新构建
+    retry = Loader()
+    retry.release.set()
+    predictor = cache.get(TEST_PROVINCES[0], retry)
+    assert retry.calls == [TEST_PROVINCES[0]]
+    assert cache.get(TEST_PROVINCES[0], retry) is predictor
+    assert cache.stats()['misses'] == 2
+
+
+def test_lru_eviction_order(service):
+    cache = service.PredictorCache(2)
+    loader = Loader()
+    loader.release.set()
+    for province in ['a', 'b', 'a', 'c']:
+        cache.get(province, loader)
+
+    # b 最久未使用，被淘汰；provinces 从最久未使用到最近使用
+    stats = cache.stats()
+    assert stats['provinces'] == ['a', 'c']
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 3, 1)
+    assert stats['variants'] == {'fp32': 2}
+    cache.get('b', loader)
+    assert cache.stats()['provinces'] == ['c', 'b']
+
+
+def test_cache_stats_counters(service, monkeypatch):
+    monkeypatch.setattr(service, '_predictors_cache', service.PredictorCache(1))
+    for province in TEST_PROVINCES + TEST_PROVINCES[-1:]:
+        service.get_predictor_service(province)
+    with pytest.raises(ValueError):
+        service.get_predictor_service("不存在的省")
+
+    stats = service.get_cache_stats()
+    assert stats['size'] == 1 and stats['max_size'] == 1
+    assert stats['provinces'] == [TEST_PROVINCES[-1]]
+    assert (stats['hits'], stats['misses'], stats['waits']) == (1, 3, 0)
+    assert stats['evictions'] == 1 and stats['load_errors'] == 1
+    assert stats['variants'] == {'fp32': 1}
+    assert set(stats['preload']) == {'status', 'loaded', 'failed'}
+    assert stats['results'] == {'size': 0, 'hits': 0, 'misses': 0}
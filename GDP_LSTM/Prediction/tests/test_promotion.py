@@ -0,0 +1,48 @@
+import registry
+import train
+from conftest import TEST_PROVINCES
+
+OVERRIDES = {'hidden_size': 16, 'window_size': 4}
+
+
+def promoted_manifest(overrides):
+    """模拟 sweep.promote 之后的清单：超参数为晋升的配置，产物为空"""
+    manifest = {'version': registry.MANIFEST_VERSION, 'provinces': {}}
+    for province in TEST_PROVINCES:
+        registry.record_province(manifest, province, train.province_data_hash(province),
+                                 train.current_hyperparams(overrides=OVERRIDES), {}, overrides)
+    return manifest
+
+
+def test_promoted_provinces_are_not_retrained(tmp_path, monkeypatch):
+    monkeypatch.setattr(train, 'MODEL_PATH', str(tmp_path))
+    manifest = promoted_manifest(OVERRIDES)
+    assert train.find_stale_provinces(TEST_PROVINCES, manifest) == []
+    hyperparams = train.province_hyperparams(manifest, TEST_PROVINCES[0])
+    assert hyperparams['hidden_size'] == 16 and hyperparams['window_size'] == 4
+
+
+def test_changed_defaults_still_trigger_retraining(tmp_path, monkeypatch):
+    monkeypatch.setattr(train, 'MODEL_PATH', str(tmp_path))
+    manifest = promoted_manifest(OVERRIDES)
+    monkeypatch.setattr(train, 'NUM_EPOCHS', train.NUM_EPOCHS + 1)
+    assert train.find_stale_provinces(TEST_PROVINCES, manifest) == TEST_PROVINCES
+
+
+def test_rerecording_keeps_overrides():
+    manifest = promoted_manifest(OVERRIDES)
+    province = TEST_PROVINCES[0]
+    registry.record_province(manifest, province, 'hash', train.province_hyperparams(manifest, province), {})
+    assert manifest['provinces'][province]['overrides'] == OVERRIDES
+
+
+def test_recorded_hyperparams_follow_the_trained_model(monkeypatch):
+    """回测和增量更新使用正式模型训练时记录的超参数，默认值改变后仍与已有模型一致"""
+    manifest = promoted_manifest(OVERRIDES)
+    monkeypatch.setattr(train, 'NUM_EPOCHS', train.NUM_EPOCHS + 1)
+    province = TEST_PROVINCES[0]
+    recorded = registry.recorded_hyperparams(manifest, province, train.current_hyperparams())
+    assert recorded == manifest['provinces'][province]['hyperparams']
+    assert train.province_hyperparams(manifest, province)['num_epochs'] == train.NUM_EPOCHS
+    # 没有记录的省份使用默认值
+    assert registry.recorded_hyperparams({'provinces': {}}, province, train.current_hyperparams()) == train.current_hyperparams()
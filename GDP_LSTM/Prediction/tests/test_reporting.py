@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import registry
+import reporting
+import train
+from conftest import TEST_PROVINCES
+
+EPOCHS = 3
+
+
+def save_series(plot_root, province):
+    years = list(range(2005, 2015))
+    origin_data = pd.DataFrame(np.arange(40, dtype=float).reshape(10, 4) + 1, index=years,
+                               columns=['polulation', 'consumption', 'GDP', 'financial'])
+    curve = list(np.linspace(1, 0.1, EPOCHS))
+    results = {f'{split}_{key}': curve for split in ('train', 'test') for key in ('loss', 'mae', 'mse', 'mape')}
+    series = reporting.build_series(province, origin_data, origin_data.values[4:], origin_data.values[4:],
+                                    [2015, 2016], np.array([50.0, 60.0]), results, window_size=4)
+    return reporting.save_series(series, os.path.join(plot_root, province))
+
+
+def test_render_only_given_series(tmp_path):
+    current, stale = [save_series(tmp_path, province) for province in TEST_PROVINCES]
+    rendered = reporting.render_deferred(str(tmp_path), [current], workers=1, combined=True)
+
+    assert list(rendered) == [TEST_PROVINCES[0]]
+    assert all(os.path.exists(path) for path in rendered[TEST_PROVINCES[0]])
+    assert os.listdir(os.path.dirname(stale)) == [reporting.SERIES_FILE]
+    report = (tmp_path / reporting.REPORT_FILE).read_text(encoding='utf-8')
+    assert TEST_PROVINCES[0] in report and TEST_PROVINCES[1] not in report
+
+
+def test_record_outputs_returns_series_without_recording_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(train, 'MODEL_PATH', str(tmp_path))
+    province = TEST_PROVINCES[0]
+    model_path = tmp_path / "model.pth"
+    model_path.write_bytes(b'model')
+    series_path = save_series(tmp_path, province)
+    manifest = registry.load_manifest(str(tmp_path))
+
+    returned = train.record_outputs(manifest, province, 'hash', {'pth': str(model_path), 'series': series_path},
+                                    train.current_hyperparams())
+    assert returned == series_path
+    assert list(manifest['provinces'][province]['artifacts']) == ['pth']
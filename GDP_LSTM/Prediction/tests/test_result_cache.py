@@ -0,0 +1,104 @@
+import pytest
+
+import data_setup
+import train
+from conftest import TEST_PROVINCES
+
+PROVINCE = TEST_PROVINCES[0]
+
+
+def fail(*args, **kwargs):
+    raise AssertionError("缓存命中时不应读取文件")
+
+
+def test_hit_does_not_read_files(service, monkeypatch):
+    prediction, etag = service.get_default_prediction(PROVINCE)
+    monkeypatch.setattr(service, 'model_checksum', fail)
+    monkeypatch.setattr(data_setup, 'data_version', fail)
+
+    assert service.get_default_prediction(PROVINCE) == (prediction, etag)
+    assert service._result_stats == {"hits": 1, "misses": 1}
+
+
+def test_stored_key_is_the_lookup_key(service):
+    service.get_default_prediction(PROVINCE)
+    predictor = service.get_predictor_service(PROVINCE)
+    key, _, _ = service._result_cache[PROVINCE]
+    assert key == (predictor.model_checksum, data_setup.data_version(service.DATA_DIR))
+
+
+def test_invalidate_rechecks_data_version(service, monkeypatch):
+    _, etag = service.get_default_prediction(PROVINCE)
+    monkeypatch.setattr(data_setup, 'data_version', lambda data_path: 'new-version')
+    # TTL 内仍使用上次的数据版本
+    assert service.get_default_prediction(PROVINCE)[1] == etag
+
+    service.invalidate_result_versions()
+    _, new_etag = service.get_default_prediction(PROVINCE)
+    assert new_etag != etag
+    assert service._result_cache[PROVINCE][0][1] == 'new-version'
+
+
+def test_expired_ttl_rechecks(service, monkeypatch):
+    monkeypatch.setattr(service, 'RESULT_VERSION_TTL', 0)
+    service.get_default_prediction(PROVINCE)
+    calls = []
+    monkeypatch.setattr(data_setup, 'data_version', lambda data_path: calls.append(data_path) or 'new-version')
+    service.get_default_prediction(PROVINCE)
+    assert calls and service._result_stats["misses"] == 2
+
+
+def test_warm_cache_uses_lookup_keys(service):
+    assert service.warm_prediction_cache(TEST_PROVINCES) == len(TEST_PROVINCES)
+    service.get_default_prediction(TEST_PROVINCES[1])
+    assert service._result_stats == {"hits": 1, "misses": 0}
+
+
+@pytest.mark.parametrize('predict', [
+    lambda service: service.predict_all_provinces(TEST_PROVINCES),
+    lambda service: service.run_scenarios([{'changes': {'population': 0.01}}], TEST_PROVINCES, samples=1),
+    lambda service: service.predict_with_intervals(TEST_PROVINCES, bootstrap=0),
+], ids=['batch', 'scenarios', 'intervals'])
+def test_batch_paths_reload_updated_models(service, predict):
+    """批量接口与单省份查询一样检查模型文件，加载之后被覆盖的模型不再使用"""
+    stale = service.get_predictor_service(PROVINCE)
+    # 模拟模型文件在加载之后被重新训练覆盖
+    stale.model_checksum = 'overwritten'
+    service.invalidate_result_versions()
+
+    result = predict(service)
+    assert result['errors'] == {}
+    assert service.get_predictor_service(PROVINCE) is not stale
+
+
+def test_combined_model_exported_later_is_picked_up(service, model_dir, monkeypatch):
+    """服务启动时没有合并模型，之后 --export-combined 导出的合并模型在刷新后生效；省份重新训练后合并模型过期"""
+    monkeypatch.setattr(service, 'RESULT_VERSION_TTL', 3600)
+    assert service.get_combined_model() is None
+    predictor = service._current_predictor(PROVINCE)
+    assert predictor.combined is None
+
+    monkeypatch.setattr(train, 'MODEL_PATH', str(model_dir))
+    assert train.export_combined(TEST_PROVINCES)
+    # RESULT_VERSION_TTL 内沿用上次的检查结果
+    assert service._current_predictor(PROVINCE) is predictor
+    service.invalidate_result_versions()
+    combined = service.get_combined_model()
+    assert combined is not None
+    assert service._current_predictor(PROVINCE).combined is combined
+    assert service._current_predictor(PROVINCE).predict_gdp() == predictor.predict_gdp()
+
+    # 该省份重新训练 (.pth 改变) 后合并模型过期，回到省份自己的模型
+    with open(model_dir / f"{TEST_PROVINCES[1]}_seq2seq_gdp_model.pth", 'ab') as f:
+        f.write(b'\0')
+    service.invalidate_result_versions()
+    assert service.get_combined_model() is None
+    assert service._current_predictor(PROVINCE).combined is None
+
+
+def test_point_prediction_years_follow_panel(service):
+    """单省份预测的年份与批量预测一样从面板最后一年的下一年开始"""
+    years = [item['year'] for item in service.get_predictor_service(PROVINCE).predict_gdp()['predictions']]
+    start_year = data_setup.load_panel(service.DATA_DIR)['years'][-1] + 1
+    assert years == list(range(start_year, start_year + len(years)))
+    assert years == service.predict_all_provinces([PROVINCE])['years']
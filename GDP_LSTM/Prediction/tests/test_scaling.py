@@ -0,0 +1,43 @@
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler
+
+import data_setup
+from conftest import TEST_PROVINCES
+
+
+def sample_values():
+    values = np.random.default_rng(0).random((20, 4)) * 1000
+    # 常数列: sklearn 不缩放
+    values[:, 3] = 7.0
+    return values
+
+
+def test_fit_minmax_matches_sklearn():
+    values = sample_values()
+    sklearn_scaler = MinMaxScaler().fit(values)
+    scaler = data_setup.fit_minmax(values)
+    np.testing.assert_allclose(scaler['min'], sklearn_scaler.min_)
+    np.testing.assert_allclose(scaler['scale'], sklearn_scaler.scale_)
+    np.testing.assert_allclose(data_setup.scale_transform(values, scaler), sklearn_scaler.transform(values))
+    np.testing.assert_allclose(data_setup.scale_inverse(data_setup.scale_transform(values, scaler), scaler), values)
+
+
+def test_panel_scalers_match_per_province_fit(data_dir):
+    """沿年份轴一次算出的各省份参数与逐省 MinMaxScaler 相同"""
+    panel = data_setup.load_panel(str(data_dir))
+    for province in TEST_PROVINCES:
+        origin_data, data = data_setup.create_dataset(str(data_dir), province)
+        sklearn_scaler = MinMaxScaler().fit(origin_data.values)
+        scaler = data_setup.province_scaler(panel, province)
+        np.testing.assert_allclose(scaler['min'], sklearn_scaler.min_)
+        np.testing.assert_allclose(scaler['scale'], sklearn_scaler.scale_)
+        np.testing.assert_allclose(data, sklearn_scaler.transform(origin_data.values))
+
+
+def test_saved_scaler_round_trip(tmp_path):
+    scaler = data_setup.fit_minmax(sample_values())
+    path = str(tmp_path / f"{TEST_PROVINCES[0]}{data_setup.SCALER_SUFFIX}")
+    data_setup.save_scaler(path, TEST_PROVINCES[0], scaler)
+    loaded = data_setup.load_scaler(path)
+    np.testing.assert_array_equal(loaded['min'], scaler['min'])
+    np.testing.assert_array_equal(loaded['scale'], scaler['scale'])
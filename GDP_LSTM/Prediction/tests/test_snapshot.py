@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+
+import data_setup
+from conftest import touch
+
+
+def snapshot_path(data_dir):
+    return os.path.join(str(data_dir), data_setup.SNAPSHOT_NAME)
+
+
+def test_round_trip(data_dir):
+    path = data_setup.compile_snapshot(str(data_dir))
+    paths = [data_setup.resolve_data_file(str(data_dir), name) for name in data_setup.FEATURE_FILES]
+    expected = data_setup._read_panel(paths)
+
+    header, panel = data_setup.read_snapshot(path)
+    assert header['sources'] == data_setup._source_stamps(paths)
+    assert isinstance(panel['values'], np.memmap) and not panel['values'].flags.writeable
+    np.testing.assert_array_equal(panel['values'], expected['values'])
+    for key in ('years', 'provinces', 'features', 'units'):
+        assert panel[key] == expected[key]
+
+
+def test_load_panel_writes_and_reuses_snapshot(data_dir):
+    panel = data_setup.load_panel(str(data_dir))
+    assert os.path.exists(snapshot_path(data_dir))
+    # 进程内缓存清空后从快照读取，不再解析 CSV
+    data_setup._PANEL_CACHE.clear()
+    mtime = os.stat(snapshot_path(data_dir)).st_mtime_ns
+    reloaded = data_setup.load_panel(str(data_dir))
+    assert isinstance(reloaded['values'], np.memmap)
+    assert os.stat(snapshot_path(data_dir)).st_mtime_ns == mtime
+    np.testing.assert_array_equal(reloaded['values'], panel['values'])
+
+
+def test_stale_snapshot_is_rebuilt(data_dir):
+    data_setup.compile_snapshot(str(data_dir))
+    csv_path = data_setup.resolve_data_file(str(data_dir), 'YearGDP.csv')
+    touch(csv_path)
+
+    data_setup.load_panel(str(data_dir))
+    header, _ = data_setup.read_snapshot(snapshot_path(data_dir))
+    assert header['sources'] == data_setup._source_stamps(
+        [data_setup.resolve_data_file(str(data_dir), name) for name in data_setup.FEATURE_FILES])
+
+
+def test_invalid_snapshot_is_ignored(data_dir):
+    with open(snapshot_path(data_dir), 'wb') as f:
+        f.write(b'not a snapshot')
+    assert data_setup.read_snapshot(snapshot_path(data_dir)) == (None, None)
+    panel = data_setup.load_panel(str(data_dir))
+    assert data_setup.read_snapshot(snapshot_path(data_dir))[0] is not None
+    assert panel['values'].shape[0] == len(panel['years'])
@@ -0,0 +1,92 @@
+import numpy as np
+import torch
+
+import model_builder
+import registry
+import train
+from conftest import TEST_PROVINCES
+
+EPOCHS = 3
+
+
+def structure(hyperparams):
+    return dict(input_size=hyperparams['input_feature_size'], hidden_size=hyperparams['hidden_size'],
+                num_layers=hyperparams['num_layers'], output_size=hyperparams['output_feature_size'],
+                predict_steps=hyperparams['predict_steps'])
+
+
+def test_stacked_forward_matches_seq2seq():
+    hyperparams = train.current_hyperparams()
+    models = []
+    for seed in range(3):
+        torch.manual_seed(seed)
+        models.append(train.build_model(hyperparams).eval())
+    stacked = model_builder.StackedSeq2Seq.from_state_dicts(
+        [model.state_dict() for model in models], **structure(hyperparams)).eval()
+    x = torch.randn(len(models), 5, hyperparams['window_size'], hyperparams['input_feature_size'])
+
+    with torch.no_grad():
+        expected = torch.stack([model(x[i]) for i, model in enumerate(models)])
+        torch.testing.assert_close(stacked(x), expected)
+        # 只取部分模型 (顺序任意)
+        index = torch.tensor([2, 0])
+        torch.testing.assert_close(stacked(x[index], index), expected[index])
+    for i, model in enumerate(models):
+        for name, value in stacked.to_state_dict(i).items():
+            torch.testing.assert_close(value, model.state_dict()[name])
+
+
+def train_outputs(tmp_path, monkeypatch, stacked):
+    """用 EPOCHS 轮训练 TEST_PROVINCES (堆叠或逐省)，返回各省份 .pth 的参数"""
+    model_path = tmp_path / ('stacked' if stacked else 'serial')
+    monkeypatch.setattr(train, 'MODEL_PATH', str(model_path))
+    monkeypatch.setattr(train, 'CHECKPOINT_DIR', str(model_path / 'checkpoints'))
+    train_options = dict(train.default_train_options(), plots='none')
+    hyperparams = train.current_hyperparams(train_options, {'num_epochs': EPOCHS})
+    if stacked:
+        manifest = registry.load_manifest(str(model_path))
+        train.train_stacked(TEST_PROVINCES, manifest, train_options, hyperparams)
+    else:
+        for province in TEST_PROVINCES:
+            train.train_province(province, train_options, hyperparams)
+    return {province: torch.load(model_path / f"{province}_seq2seq_gdp_model.pth") for province in TEST_PROVINCES}
+
+
+def test_stacked_training_matches_serial(tmp_path, monkeypatch):
+    """每个省份的初始参数与逐省训练相同，训练后的参数也一致"""
+    serial = train_outputs(tmp_path, monkeypatch, stacked=False)
+    stacked = train_outputs(tmp_path, monkeypatch, stacked=True)
+    for province in TEST_PROVINCES:
+        for name, value in serial[province].items():
+            np.testing.assert_allclose(stacked[province][name].numpy(), value.numpy(), atol=1e-5)
+
+
+def test_ensemble_uses_promoted_hyperparams(tmp_path, monkeypatch):
+    """晋升过的省份按自己的超参数训练副本，第 0 个副本与用同样超参数训练的主模型一致；网络结构不同的省份不参加集成"""
+    monkeypatch.setattr(train, 'MODEL_PATH', str(tmp_path))
+    monkeypatch.setattr(train, 'CHECKPOINT_DIR', str(tmp_path / 'checkpoints'))
+    train_options = dict(train.default_train_options(), plots='none')
+    overrides = {TEST_PROVINCES[0]: {'num_epochs': EPOCHS},
+                 TEST_PROVINCES[1]: {'num_epochs': EPOCHS, 'learning_rate': 0.01}}
+    manifest = {'provinces': {province: {'overrides': value} for province, value in overrides.items()}}
+
+    hyperparams = train.ensemble_hyperparams(TEST_PROVINCES, manifest, train_options)
+    assert hyperparams[TEST_PROVINCES[1]]['learning_rate'] == 0.01
+    changed = {'provinces': {TEST_PROVINCES[0]: {'overrides': {'hidden_size': train.HIDDEN_SIZE * 2}}}}
+    assert list(train.ensemble_hyperparams(TEST_PROVINCES, changed, train_options)) == [TEST_PROVINCES[1]]
+
+    replicas = 2
+    assert train.ensemble_is_stale(hyperparams, replicas)
+    train.train_ensemble(hyperparams, replicas)
+    assert not train.ensemble_is_stale(hyperparams, replicas)
+    assert train.ensemble_is_stale(train.ensemble_hyperparams(TEST_PROVINCES, {'provinces': {}}, train_options), replicas)
+
+    ensemble = model_builder.StackedSeq2Seq.from_state_dicts(
+        [train.build_model(hyperparams[TEST_PROVINCES[0]]).state_dict()] * (len(TEST_PROVINCES) * replicas),
+        **structure(hyperparams[TEST_PROVINCES[0]]))
+    ensemble.load_state_dict(torch.load(tmp_path / f"{registry.ENSEMBLE_MODEL_NAME}.pth"))
+    for i, province in enumerate(TEST_PROVINCES):
+        train.train_province(province, train_options, hyperparams[province])
+        serial = torch.load(tmp_path / f"{province}_seq2seq_gdp_model.pth")
+        for name, value in ensemble.to_state_dict(i * replicas).items():
+            np.testing.assert_allclose(value.numpy(), serial[name].numpy(), atol=1e-5)
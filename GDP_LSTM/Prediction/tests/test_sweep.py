@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import sweep
+import train
+import utils
+from conftest import TEST_PROVINCES
+
+NUM_YEARS = 20
+
+
+@pytest.mark.parametrize('window_size, predict_steps', [(4, 1), (4, 2), (6, 1), (6, 2)])
+def test_validation_years_are_fixed(window_size, predict_steps):
+    """不论窗口大小和预测步数，验证目标都是最后 VAL_YEARS 年，训练目标都在它们之前"""
+    # 每个特征的值等于年份序号，GDP 列即目标年份
+    data = np.repeat(np.arange(NUM_YEARS, dtype=np.float64)[:, np.newaxis], 4, axis=1)
+    data_x, data_y, _, _ = utils.create_training_sequences(data, window_size, predict_steps, train.GDP_COL_INDEX)
+    train_x, train_y, val_x, val_y = sweep.split_by_years(data_x, data_y, NUM_YEARS, window_size, predict_steps)
+
+    val_years = set(range(NUM_YEARS - sweep.VAL_YEARS, NUM_YEARS))
+    assert set(np.asarray(val_y).ravel()) == val_years
+    assert np.asarray(train_y).max() < min(val_years)
+    assert np.asarray(train_x).max() < min(val_years)
+
+
+def test_predict_steps_longer_than_validation_is_rejected():
+    data = np.zeros((NUM_YEARS, 4))
+    data_x, data_y, _, _ = utils.create_training_sequences(data, 4, 3, train.GDP_COL_INDEX)
+    with pytest.raises(ValueError):
+        sweep.split_by_years(data_x, data_y, NUM_YEARS, 4, 3)
+
+
+def test_best_configs_compares_equal_predict_steps():
+    base = {key: 1 for key in sweep.SEARCHABLE_KEYS}
+    results = pd.DataFrame([
+        {**base, 'trial': 0, 'province': TEST_PROVINCES[0], 'status': 'ok', 'predict_steps': 1,
+         'hidden_size': 16, 'val_gdp_mape': 0.5},
+        {**base, 'trial': 1, 'province': TEST_PROVINCES[0], 'status': 'ok', 'predict_steps': 2,
+         'hidden_size': 8, 'val_gdp_mape': 3.0},
+        {**base, 'trial': 2, 'province': TEST_PROVINCES[0], 'status': 'ok', 'predict_steps': 2,
+         'hidden_size': 32, 'val_gdp_mape': 2.0},
+    ])
+    assert sweep.best_configs(results, predict_steps=2)[TEST_PROVINCES[0]]['hidden_size'] == 32
+    assert sweep.best_configs(results, predict_steps=1)[TEST_PROVINCES[0]]['hidden_size'] == 16
+    # 默认使用 train.py 的预测步数，而不是误差最小的短预测
+    assert sweep.best_configs(results)[TEST_PROVINCES[0]]['predict_steps'] == train.PREDICT_STEPS
+
+
+def test_run_trial_reports_gdp_error(monkeypatch):
+    monkeypatch.setattr(sweep, '_SHARED_DATA', sweep.preprocess(TEST_PROVINCES[:1]))
+    row = sweep.run_trial(0, {'num_epochs': 2, 'predict_steps': 1}, TEST_PROVINCES[0])
+    assert row['status'] == 'ok', row['error']
+    assert row['val_gdp_mape'] > 0 and row['val_gdp_mae'] > 0
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import train
+import utils
+
+GDP = 2
+
+
+def reference_sequences(data, input_window, output_steps, target_index):
+    """逐个窗口拷贝的原始实现"""
+    n = len(data) - input_window - output_steps + 1
+    X = np.array([data[i:i + input_window] for i in range(n)])
+    Y = np.array([data[i + input_window:i + input_window + output_steps, target_index] for i in range(n)])
+    return X, Y[..., np.newaxis], data[n:n + input_window], data[-input_window:]
+
+
+@pytest.mark.parametrize('input_window, output_steps', [(6, 2), (4, 1), (3, 3)])
+def test_matches_reference(input_window, output_steps):
+    data = np.random.default_rng(0).random((20, 4))
+    result = utils.create_training_sequences(data, input_window, output_steps, GDP)
+    for actual, expected in zip(result, reference_sequences(data, input_window, output_steps, GDP)):
+        np.testing.assert_array_equal(actual, expected)
+
+
+def test_returns_read_only_views():
+    data = np.random.default_rng(0).random((20, 4))
+    for array in utils.create_training_sequences(data, 6, 2, GDP):
+        assert np.shares_memory(array, data)
+        assert not array.flags.writeable
+
+
+def test_panel_matches_each_province():
+    panel = np.random.default_rng(1).random((3, 20, 4))
+    X, Y, last_labeled, latest = utils.create_training_sequences(panel, 6, 2, GDP)
+    assert X.shape == (3, 13, 6, 4) and Y.shape == (3, 13, 2, 1)
+    for province, data in enumerate(panel):
+        for actual, expected in zip((X[province], Y[province], last_labeled[province], latest[province]),
+                                    utils.create_training_sequences(data, 6, 2, GDP)):
+            np.testing.assert_array_equal(actual, expected)
+
+
+def test_too_short_data_is_rejected():
+    with pytest.raises(ValueError):
+        utils.create_training_sequences(np.zeros((5, 4)), 6, 2, GDP)
+
+
+@pytest.mark.parametrize('val_size, predict_steps', [(2, 2), (2, 1), (3, 3)])
+def test_early_stopping_split_does_not_share_target_years(val_size, predict_steps):
+    # GDP 列等于年份序号，目标值即目标年份
+    data = np.repeat(np.arange(20, dtype=np.float64)[:, np.newaxis], 4, axis=1)
+    data_x, data_y, _, _ = utils.create_training_sequences(data, 6, predict_steps, GDP)
+    train_x, train_y, val_x, val_y = train.split_validation(data_x, data_y, val_size, predict_steps)
+    assert len(val_x) == val_size
+    assert np.asarray(train_y).max() < np.asarray(val_y).min()
+    assert len(train_x) == len(data_x) - val_size - (predict_steps - 1)
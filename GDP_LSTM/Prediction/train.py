@@ -3,15 +3,20 @@ import os
 import torch
 import model_builder
 import utils
+import registry
+import reporting
 from torch import nn
 import engine
-from sklearn.preprocessing import MinMaxScaler
 import pandas as pd
 import numpy as np
 import onnx
 import json
 import datetime
 import sys
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from timeit import default_timer as timer
 
 # ---超参数定义--- #
 INPUT_FEATURE_SIZE = 4     #输入特征
@@ -20,214 +25,828 @@ HIDDEN_SIZE = INPUT_FEATURE_SIZE * 2       #隐藏层
 NUM_LAYERS = 2 #LSTM堆叠层数
 PREDICT_STEPS = 2 #预测未来一年的GDP数据
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
-BATCH_SIZE = 1
+BATCH_SIZE = 1 # 每个 mini-batch 的样本数
 WINDOW_SIZE = 6 #历史窗口
 GDP_COL_INDEX = 2 #
 NUM_EPOCHS = 100
+LEARNING_RATE = 0.001
+SEED = 42 # 每个省份训练前重置随机种子，保证串行与并行结果一致
+PATIENCE = 0 # 早停耐心轮数，0 表示不启用早停
+VAL_SIZE = 2 # 启用早停时，取最后 VAL_SIZE 个窗口作为验证集
+CHECKPOINT_EVERY = 10 # 每隔多少轮保存一次检查点
+PLOTS = 'deferred' # 绘图方式: none 不绘图 / deferred 训练后统一渲染 / inline 训练中直接绘图 (弹出窗口，会阻塞训练)
 
-PROVINCES = [
-    "北京市",
-    "天津市",
-    "上海市",
-    "重庆市",
-    "内蒙古自治区",
-    "广西壮族自治区",
-    "西藏自治区",
-    "宁夏回族自治区",
-    "新疆维吾尔自治区",
-    "河北省",
-    "山西省",
-    "辽宁省",
-    "吉林省",
-    "黑龙江省",
-    "江苏省",
-    "浙江省",
-    "安徽省",
-    "福建省",
-    "江西省",
-    "山东省",
-    "河南省",
-    "湖北省",
-    "湖南省",
-    "广东省",
-    "海南省",
-    "四川省",
-    "贵州省",
-    "云南省",
-    "陕西省",
-    "甘肃省",
-    "青海省"
-]
+PROVINCES = data_setup.PROVINCES
 # --- END --- #
 
 current_dir = os.getcwd()
 parent_dir = os.path.dirname(current_dir)
 data_dir = os.path.join(parent_dir, "data")
+MODEL_PATH = "models"
+CHECKPOINT_DIR = os.path.join(MODEL_PATH, "checkpoints")
+PLOT_DIR = "parm"
 
-def main():
+def default_train_options():
+    """早停与检查点相关的训练选项，可由命令行覆盖"""
+    return {
+        'patience': PATIENCE,
+        'val_size': VAL_SIZE,
+        'checkpoint_every': CHECKPOINT_EVERY,
+        'resume': False,
+        'plots': PLOTS,
+    }
+
+# 网络结构相关的超参数，这些都相同的模型才能堆叠成一个 StackedSeq2Seq
+STRUCTURE_KEYS = ('input_feature_size', 'output_feature_size', 'hidden_size', 'num_layers',
+                  'predict_steps', 'window_size')
+
+def current_hyperparams(train_options=None, overrides=None):
+    """
+    本次训练使用的全部超参数，写入清单用于判断模型是否过期
+    :param overrides: 覆盖默认值的超参数 (如超参数搜索得到的最优配置)
+    """
+    train_options = train_options or default_train_options()
+    hyperparams = {
+        'input_feature_size': INPUT_FEATURE_SIZE,
+        'output_feature_size': OUTPUT_FEATURE_SIZE,
+        'hidden_size': HIDDEN_SIZE,
+        'num_layers': NUM_LAYERS,
+        'predict_steps': PREDICT_STEPS,
+        'window_size': WINDOW_SIZE,
+        'batch_size': BATCH_SIZE,
+        'num_epochs': NUM_EPOCHS,
+        'learning_rate': LEARNING_RATE,
+        'seed': SEED,
+        'patience': train_options['patience'],
+        'val_size': train_options['val_size'] if train_options['patience'] > 0 else 0,
+    }
+    hyperparams.update(overrides or {})
+    return hyperparams
+
+def province_data_hash(PROVINCE):
+    origin_data, _ = data_setup.create_dataset(data_dir, PROVINCE)
+    return registry.hash_series(origin_data.values)
+
+def province_hyperparams(manifest, PROVINCE, train_options=None):
+    """
+    省份训练使用的超参数：train.py 中的默认值加上清单中记录的覆盖值 (sweep.py 晋升的配置)，
+    晋升过的省份重新训练时仍使用晋升的配置
+    """
+    overrides = manifest['provinces'].get(PROVINCE, {}).get('overrides', {})
+    return current_hyperparams(train_options, overrides)
+
+def find_stale_provinces(provinces, manifest, train_options=None):
+    """对比清单，只返回数据、超参数或产物发生变化的省份；超参数与各省份自己的配置比较"""
+    stale = []
+    for PROVINCE in provinces:
+        try:
+            is_stale, reason = registry.check_stale(
+                manifest, PROVINCE, province_data_hash(PROVINCE),
+                province_hyperparams(manifest, PROVINCE, train_options), MODEL_PATH)
+        except Exception as e:
+            is_stale, reason = True, f"无法计算数据哈希: {e}"
+        if is_stale:
+            print(f"🔄 {PROVINCE} 需要重新训练: {reason}")
+            stale.append(PROVINCE)
+        else:
+            print(f"⏭️ {PROVINCE} 模型已是最新，跳过")
+    return stale
+
+def record_outputs(manifest, PROVINCE, data_hash, artifact_paths, hyperparams, overrides=None):
+    """
+    把训练成功的省份写入清单；产物不完整时不记录，下次仍会重新训练
+    :return: 本次保存的绘图序列路径 (deferred 模式)，没有保存或未写入清单时为 None
+    """
+    # 绘图序列不是模型产物，不写入清单
+    series_path = artifact_paths.get('series')
+    artifact_paths = {kind: path for kind, path in artifact_paths.items() if kind != 'series'}
+    if not all(os.path.exists(path) for path in artifact_paths.values()):
+        print(f"❌ {PROVINCE} 产物不完整，未写入清单")
+        return None
+    registry.record_province(manifest, PROVINCE, data_hash, hyperparams, artifact_paths, overrides)
+    registry.save_manifest(manifest, MODEL_PATH)
+    return series_path
+
+def build_model(hyperparams=None):
+    # 构建模型
+    hyperparams = hyperparams or current_hyperparams()
+    return model_builder.Seq2Seq(
+        input_size=hyperparams['input_feature_size'],
+        hidden_size=hyperparams['hidden_size'],
+        num_layers=hyperparams['num_layers'],
+        output_size=hyperparams['output_feature_size'],
+        predict_steps=hyperparams['predict_steps']
+    ).to(device)
+
+def prepare_province(PROVINCE, hyperparams=None):
+    """读取省份数据并划分训练窗口"""
+    hyperparams = hyperparams or current_hyperparams()
+    # 获取目标路径的数据
+    # origin_data是原始csv文件的数据，data是经过归一化的数据
+    origin_data,data = data_setup.create_dataset(data_dir,PROVINCE)
+    # 归一化参数 (min/scale)，与 create_dataset 使用的相同，随模型一起保存供推理服务直接使用
+    scaler = data_setup.province_scaler(data_setup.load_panel(data_dir), PROVINCE)
+    # data_x代表分化后的训练数据，data_y代表分化后的测试数据
+    data_x,data_y,val_Y2025,val_Y2026 = utils.create_training_sequences(
+        data,
+        hyperparams['window_size'],
+        hyperparams['predict_steps'],
+        GDP_COL_INDEX
+    )
+    return {
+        'data_hash': registry.hash_series(origin_data.values),
+        'origin_data': origin_data,
+        'data': data,
+        'scaler': scaler,
+        'data_x': data_x,
+        'data_y': data_y,
+        'val_Y2025': val_Y2025,
+        'val_Y2026': val_Y2026,
+    }
+
+def save_province_outputs(PROVINCE, model, results, prepared, plots=PLOTS, hyperparams=None):
+    """保存训练指标、预测对比图以及 pth/ONNX 模型"""
+    hyperparams = hyperparams or current_hyperparams()
+    origin_data = prepared['origin_data']
+    scaler = prepared['scaler']
+    data_x = prepared['data_x']
+    data_y = prepared['data_y']
+    val_Y2026 = prepared['val_Y2026']
+
+    # 将训练指标保存为 JSON，按省份命名，便于后台通过 API 读取
+    os.makedirs(MODEL_PATH, exist_ok=True)
+    metrics_path = os.path.join(MODEL_PATH, f"{PROVINCE}_training_metrics.json")
+    metrics_payload = {
+        'province': PROVINCE,
+        'saved_at': datetime.datetime.now().isoformat(),
+        'num_epochs': hyperparams['num_epochs'],
+        # 启用早停时实际训练的轮数可能小于 num_epochs
+        'epochs_run': len(results['train_loss']),
+        'hyperparams': {
+            'input_feature_size': hyperparams['input_feature_size'],
+            'hidden_size': hyperparams['hidden_size'],
+            'num_layers': hyperparams['num_layers'],
+            'predict_steps': hyperparams['predict_steps'],
+            'window_size': hyperparams['window_size'],
+            'batch_size': hyperparams['batch_size']
+        },
+        'metrics': results
+    }
+    try:
+        with open(metrics_path, 'w', encoding='utf-8') as mf:
+            json.dump(metrics_payload, mf, ensure_ascii=False, indent=2)
+        print(f"✅ 训练指标已保存: {metrics_path}")
+    except Exception as e:
+        print(f"❌ 保存训练指标失败: {e}")
+
+    # 将训练指标保存到数据库
+    try:
+        # 导入数据库管理器
+        sys.path.append(os.path.join(current_dir, 'backend_api'))
+        from gdp_db_utils import gdp_db_manager
+
+        # 保存到数据库
+        gdp_db_manager.save_training_metrics(PROVINCE, metrics_payload)
+        print(f"✅ 训练指标已保存到数据库: {PROVINCE}")
+    except Exception as e:
+        print(f"❌ 保存训练指标到数据库失败: {e}")
+
+    # 1. 预测：使用 data_x 预测所有训练样本的输出（返回 scaled 后的结果，形状 (N, 4)）
+    train_predictions_scaled = engine.predict(
+        model,
+        data_x,  # 使用训练数据作为输入
+        device
+    )
+
+    # 2. 反归一化预测值 (形状 (N_sequences, 4))
+    train_predictions_unscaled = data_setup.scale_inverse(train_predictions_scaled, scaler)
+
+    # 3. 反归一化 data_y_true
+    data_y_gdp_only = data_y[:, 0, 0].reshape(-1, 1)
+
+    # 创建一个临时数组，将 GDP 填入正确的位置 (GDP_COL_INDEX=2) 形状: (N_sequences, INPUT_FEATURE_SIZE)
+    temp_y_true_scaled = np.zeros((data_y_gdp_only.shape[0], INPUT_FEATURE_SIZE))
+    temp_y_true_scaled[:, GDP_COL_INDEX] = data_y_gdp_only.flatten()
+
+    # 反归一化真实目标值 (形状 (N_sequences, 4))
+    data_y_true_unscaled = data_setup.scale_inverse(temp_y_true_scaled, scaler)
+
+    # 用最近 WINDOW_SIZE 年的数据预测未来
+    final = engine.predict(model,
+                           val_Y2026,
+                           device)
+    # 把最终的预测数据进行反归一化处理
+    final_data = data_setup.scale_inverse(final, scaler)
+    final_gdp_values = final_data[:, GDP_COL_INDEX]
+
+    # 计算未来预测的年份
+    start_year = origin_data.index[-1] + 1
+    years = range(start_year, start_year + len(final_gdp_values))
+
+    # 4. 绘图：inline 直接绘制，deferred 只保存原始序列，训练结束后再统一渲染
+    if plots != 'none':
+        series = reporting.build_series(
+            province=PROVINCE,
+            origin_data=origin_data,
+            train_pred=train_predictions_unscaled,
+            train_true=data_y_true_unscaled,
+            pred_years=list(years),
+            pred_gdp=final_gdp_values,
+            results=results,
+            window_size=hyperparams['window_size']
+        )
+        plot_dir = os.path.join(PLOT_DIR, PROVINCE)
+        if plots == 'inline':
+            reporting.render_series(series, plot_dir, show=True)
+        else:
+            series_path = reporting.save_series(series, plot_dir)
+
+    output_df = pd.DataFrame(
+        final_gdp_values,
+        index=years,
+        columns=[f'{PROVINCE}GDP 预测值 (亿)']
+    )
+    print(output_df)
+
+    os.makedirs(MODEL_PATH, exist_ok=True)
+
+    # 1. 保存 PyTorch 模型参数 (.pth)
+    model_save_path = os.path.join(MODEL_PATH, f"{PROVINCE}_seq2seq_gdp_model.pth")
+    torch.save(model.state_dict(), model_save_path)
+    print(f"✅ 模型参数已保存至: {model_save_path}")
+
+    # 2. ONNX 导出
+    # 示例输入的批大小至少为 2：为 1 时 torch.onnx 的 dynamo 导出器会把批维度特化为常数 1，
+    # 导出的输出形状固定为 (1, P, 1)，批大小大于 1 的推理会报形状不符
+    dummy_input = torch.randn(max(hyperparams['batch_size'], 2), hyperparams['window_size'],
+                              hyperparams['input_feature_size']).to(device)
+    onnx_model_path = os.path.join(MODEL_PATH, f"{PROVINCE}_seq2seq_gdp_model.onnx")
+
+    try:
+        torch.onnx.export(
+            model,
+            dummy_input,
+            onnx_model_path,
+            export_params=True,
+            opset_version=17,
+            do_constant_folding=True,
+            input_names=['input'],
+            output_names=['output'],
+            dynamic_axes={'input': {0: 'batch_size'},
+                          'output': {0: 'batch_size'}}
+        )
+        onnx_model = onnx.load(onnx_model_path)
+        onnx.checker.check_model(onnx_model)
+        print(f"✅ ONNX 模型导出成功并已验证: {onnx_model_path}")
+    except Exception as e:
+        print(f"❌ ONNX 模型导出或验证失败: {e}")
+
+    # 3. 保存归一化参数，推理服务直接用它做仿射变换和反变换
+    scaler_path = os.path.join(MODEL_PATH, f"{PROVINCE}{data_setup.SCALER_SUFFIX}")
+    data_setup.save_scaler(scaler_path, PROVINCE, scaler)
+    print(f"✅ 归一化参数已保存至: {scaler_path}")
+
+    artifact_paths = {
+        'pth': model_save_path,
+        'onnx': onnx_model_path,
+        'metrics': metrics_path,
+        'scaler': scaler_path,
+    }
+    if plots == 'deferred':
+        # 训练结束后只渲染本次保存的序列 (record_outputs 返回)，不会渲染 parm/ 中以前留下的文件
+        artifact_paths['series'] = series_path
+    return artifact_paths
+
+def seeded_state_dict(hyperparams, seed):
+    """用 seed 重置随机种子后构建的 Seq2Seq 的初始参数 (逐省训练时每个省份的初始化与此相同)"""
+    torch.manual_seed(seed)
+    return {name: value.cpu() for name, value in build_model(hyperparams).state_dict().items()}
+
+def split_validation(data_x, data_y, val_size, predict_steps):
+    """
+    按时间顺序取最后 val_size 个窗口作为验证集。相邻窗口的预测目标重叠 predict_steps - 1 年，
+    训练集与验证集之间去掉这些窗口，使验证目标年份不出现在训练目标中 (与 sweep.split_by_years 相同)
+    :return: train_x, train_y, val_x, val_y
+    """
+    num_train = len(data_x) - val_size - (predict_steps - 1)
+    if num_train < 1:
+        raise ValueError(f"只有 {len(data_x)} 个窗口，留出 {val_size} 个验证窗口后没有训练窗口")
+    return data_x[:num_train], data_y[:num_train], data_x[-val_size:], data_y[-val_size:]
+
+def train_province(PROVINCE, train_options=None, hyperparams=None):
+    """逐省训练：单独训练一个省份的模型并保存全部产物"""
+    train_options = train_options or default_train_options()
+    hyperparams = hyperparams or current_hyperparams(train_options)
+    prepared = prepare_province(PROVINCE, hyperparams)
+
+    # 构建模型 (按省份重置种子，初始化不依赖于之前训练过哪些省份)
+    torch.manual_seed(hyperparams['seed'])
+    model = build_model(hyperparams)
+    # 定义损失函数和优化器
+    loss_fn = nn.MSELoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=hyperparams['learning_rate'])
+
+    # 启用早停时，按时间顺序取最后 val_size 个窗口作为验证集
+    data_x, data_y = prepared['data_x'], prepared['data_y']
+    val_x = val_y = None
+    if train_options['patience'] > 0:
+        data_x, data_y, val_x, val_y = split_validation(
+            data_x, data_y, train_options['val_size'], hyperparams['predict_steps'])
+
+    checkpoint_path = os.path.join(CHECKPOINT_DIR, f"{PROVINCE}_checkpoint.pt")
+
+    # 训练并获取每轮的指标结果
+    results = engine.train(
+        model,
+        data_x,
+        data_y,
+        loss_fn,
+        optimizer,
+        hyperparams['num_epochs'],
+        device,
+        batch_size=hyperparams['batch_size'],
+        val_x=val_x,
+        val_y=val_y,
+        patience=train_options['patience'],
+        checkpoint_path=checkpoint_path,
+        checkpoint_every=train_options['checkpoint_every'],
+        resume=train_options['resume'],
+        # 超参数 (含学习率、早停设置) 或数据变化后，旧的检查点不再适用
+        checkpoint_meta={
+            'hyperparams': hyperparams,
+            'train_options': {key: train_options[key] for key in ('patience', 'val_size')},
+            'data_hash': prepared['data_hash'],
+        })
 
-    for PROVINCE in PROVINCES:
-        # 获取目标路径的数据
-        scaler = MinMaxScaler()
-        # origin_data是原始csv文件的数据，data是经过归一化的数据
-        origin_data,data = data_setup.create_dataset(data_dir,PROVINCE)
-        # 这个数据只是启动scaler
-        data_scaled = scaler.fit_transform(origin_data.values)
-        # data_x代表分化后的训练数据，data_y代表分化后的测试数据
-        data_x,data_y,val_Y2025,val_Y2026 = utils.create_training_sequences(
-            data,
-            WINDOW_SIZE,
-            PREDICT_STEPS,
+    artifact_paths = save_province_outputs(PROVINCE, model, results, prepared, train_options['plots'], hyperparams)
+    # 该省份已完整训练并保存，删除检查点，下次训练从头开始
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return results, prepared['data_hash'], artifact_paths
+
+def train_stacked(provinces, manifest, train_options=None, hyperparams=None):
+    """
+    堆叠训练：所有省份各自保留独立参数，但在同一次前向/反向传播中一起更新 (超参数必须相同)
+    :return: 本次保存的绘图序列路径列表 (deferred 模式)
+    """
+    train_options = train_options or default_train_options()
+    hyperparams = hyperparams or current_hyperparams(train_options)
+    prepared_list = [prepare_province(PROVINCE, hyperparams) for PROVINCE in provinces]
+
+    # 各省年份数相同，堆叠成 (省份, 年份, 特征) 面板后一次划分全部省份的窗口
+    # data_x 形状 (省份, 样本, 窗口, 特征)，data_y 形状 (省份, 样本, 预测步数, 1)
+    panel = np.stack([prepared['data'] for prepared in prepared_list])
+    data_x, data_y, _, _ = utils.create_training_sequences(
+        panel,
+        hyperparams['window_size'],
+        hyperparams['predict_steps'],
+        GDP_COL_INDEX
+    )
+
+    # 逐省训练在每个省份之前都用同一个种子重置，各省份的初始参数相同；
+    # 这里同样每组参数都取重置种子后的初始化，而不是从一个随机数流中依次生成
+    initial = seeded_state_dict(hyperparams, hyperparams['seed'])
+    stacked_model = model_builder.StackedSeq2Seq.from_state_dicts(
+        [initial] * len(provinces),
+        input_size=hyperparams['input_feature_size'],
+        hidden_size=hyperparams['hidden_size'],
+        num_layers=hyperparams['num_layers'],
+        output_size=hyperparams['output_feature_size'],
+        predict_steps=hyperparams['predict_steps']
+    ).to(device)
+    # reduction='none' 让每个省份单独计算损失
+    loss_fn = nn.MSELoss(reduction='none')
+    # Adam 按元素更新，堆叠后每个省份的参数更新与单独训练一致
+    optimizer = torch.optim.Adam(stacked_model.parameters(), lr=hyperparams['learning_rate'])
+
+    results_list = engine.train_stacked(
+        stacked_model,
+        data_x,
+        data_y,
+        loss_fn,
+        optimizer,
+        hyperparams['num_epochs'],
+        device,
+        batch_size=hyperparams['batch_size'])
+
+    # 拆回单个 Seq2Seq，产物与逐省训练完全相同
+    series_paths = []
+    for index, (PROVINCE, prepared) in enumerate(zip(provinces, prepared_list)):
+        model = build_model(hyperparams)
+        model.load_state_dict(stacked_model.to_state_dict(index))
+        artifact_paths = save_province_outputs(PROVINCE, model, results_list[index], prepared,
+                                               train_options['plots'], hyperparams)
+        series_path = record_outputs(manifest, PROVINCE, prepared['data_hash'], artifact_paths, hyperparams)
+        if series_path:
+            series_paths.append(series_path)
+    return series_paths
+
+def export_stacked_onnx(model, structure, onnx_model_path):
+    """
+    导出 StackedSeq2Seq：输入 input (K, B, W, F) 与 province_index (K,)，输出 (K, B, P, 1)，
+    第 k 组输入使用第 province_index[k] 组参数
+    """
+    # 示例输入的省份数和批次都取 2，避免导出时把长度为 1 的维度固定下来
+    dummy_input = torch.randn(2, 2, structure['window_size'], structure['input_feature_size'])
+    dummy_index = torch.arange(2, dtype=torch.int64)
+    torch.onnx.export(
+        model,
+        (dummy_input, dummy_index),
+        onnx_model_path,
+        export_params=True,
+        opset_version=17,
+        do_constant_folding=True,
+        input_names=['input', 'province_index'],
+        output_names=['output'],
+        dynamic_axes={'input': {0: 'provinces', 1: 'batch_size'},
+                      'province_index': {0: 'provinces'},
+                      'output': {0: 'provinces', 1: 'batch_size'}}
+    )
+    onnx.checker.check_model(onnx.load(onnx_model_path))
+
+def ensemble_hyperparams(provinces, manifest, train_options=None):
+    """
+    参加种子集成的省份及其超参数，与主模型一样使用 province_hyperparams (晋升的配置)。
+    全部副本导出为一个 ONNX 模型，网络结构与默认配置不同的省份不参加集成，推理时只用主模型
+    :return: {省份: 超参数}
+    """
+    defaults = current_hyperparams(train_options)
+    selected = {}
+    for PROVINCE in provinces:
+        hyperparams = province_hyperparams(manifest, PROVINCE, train_options)
+        if any(hyperparams[key] != defaults[key] for key in STRUCTURE_KEYS):
+            print(f"⏭️ {PROVINCE} 的网络结构与默认配置不同，不参加种子集成")
+            continue
+        selected[PROVINCE] = hyperparams
+    return selected
+
+def ensemble_is_stale(hyperparams, replicas):
+    """
+    集成模型不存在，或省份、副本数、各省份的超参数、输入数据与本次不同时需要重新训练
+    :param hyperparams: {省份: 超参数}，即 ensemble_hyperparams 的结果
+    """
+    meta_path = os.path.join(MODEL_PATH, f"{registry.ENSEMBLE_MODEL_NAME}.json")
+    if not os.path.exists(meta_path):
+        return True
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if (meta.get('provinces') != list(hyperparams) or meta.get('replicas') != replicas
+            or meta.get('hyperparams_hash') != registry.hash_hyperparams(hyperparams)):
+        return True
+    return any(meta['data_hashes'].get(PROVINCE) != province_data_hash(PROVINCE) for PROVINCE in hyperparams)
+
+def train_ensemble(hyperparams, replicas):
+    """
+    种子集成：每个省份训练 replicas 个副本，第 k 个副本与用种子 seed + k 单独训练的模型初始化相同
+    (第 0 个与主模型相同)。超参数相同的省份 × 副本堆叠成一个 StackedSeq2Seq 一起训练，耗时与一次堆叠训练相当；
+    晋升过的省份按自己的超参数单独成组。
+    全部参数保存为一个 .pth 并导出 ONNX，推理服务一次 session.run 算出全部副本，用于给出预测区间。
+    :param hyperparams: {省份: 超参数}，即 ensemble_hyperparams 的结果，网络结构必须相同
+    """
+    provinces = list(hyperparams)
+    if not provinces:
+        print("❌ 没有可以参加种子集成的省份")
+        return None
+
+    # 超参数相同的省份一起训练 (与 --stacked 相同)
+    groups = {}
+    for PROVINCE in provinces:
+        groups.setdefault(registry.hash_hyperparams(hyperparams[PROVINCE]), []).append(PROVINCE)
+
+    print(f"🔄 训练种子集成: {len(provinces)} 个省份 × {replicas} 个副本")
+    state_dicts, seeds, final_loss, data_hashes = {}, {}, {}, {}
+    for members in groups.values():
+        group_hyperparams = hyperparams[members[0]]
+        prepared_list = [prepare_province(PROVINCE, group_hyperparams) for PROVINCE in members]
+        panel = np.stack([prepared['data'] for prepared in prepared_list])
+        data_x, data_y, _, _ = utils.create_training_sequences(
+            panel,
+            group_hyperparams['window_size'],
+            group_hyperparams['predict_steps'],
             GDP_COL_INDEX
         )
+        # (省份, 样本, ...) -> (省份 × 副本, 样本, ...)，同一省份的副本相邻: 第 i 组参数为省份 i // replicas 的副本 i % replicas
+        data_x = np.repeat(data_x, replicas, axis=0)
+        data_y = np.repeat(data_y, replicas, axis=0)
 
-        plot = utils.create_plot_sequences(origin_data, PROVINCE)
-        # 构建模型
-        model = model_builder.Seq2Seq(
-            input_size=INPUT_FEATURE_SIZE,
-            hidden_size=HIDDEN_SIZE,
-            num_layers=NUM_LAYERS,
-            output_size=OUTPUT_FEATURE_SIZE,
-            predict_steps=PREDICT_STEPS
+        group_seeds = [group_hyperparams['seed'] + k for k in range(replicas)]
+        initial = [seeded_state_dict(group_hyperparams, seed) for seed in group_seeds]
+        stacked_model = model_builder.StackedSeq2Seq.from_state_dicts(
+            [initial[k] for _ in members for k in range(replicas)],
+            input_size=group_hyperparams['input_feature_size'],
+            hidden_size=group_hyperparams['hidden_size'],
+            num_layers=group_hyperparams['num_layers'],
+            output_size=group_hyperparams['output_feature_size'],
+            predict_steps=group_hyperparams['predict_steps']
         ).to(device)
-        # 定义损失函数和优化器
-        loss_fn = nn.MSELoss()
-        optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
+        loss_fn = nn.MSELoss(reduction='none')
+        optimizer = torch.optim.Adam(stacked_model.parameters(), lr=group_hyperparams['learning_rate'])
 
-        # 训练并获取每轮的指标结果
-        results = engine.train(
-            model,
+        results_list = engine.train_stacked(
+            stacked_model,
             data_x,
             data_y,
             loss_fn,
             optimizer,
-            NUM_EPOCHS,
-            device)
-
-        # 将训练指标保存为 JSON，按省份命名，便于后台通过 API 读取
-        MODEL_PATH = "models"
-        os.makedirs(MODEL_PATH, exist_ok=True)
-        metrics_path = os.path.join(MODEL_PATH, f"{PROVINCE}_training_metrics.json")
-        metrics_payload = {
+            group_hyperparams['num_epochs'],
+            device,
+            batch_size=group_hyperparams['batch_size'])
+
+        stacked_model = stacked_model.cpu()
+        for i, (PROVINCE, prepared) in enumerate(zip(members, prepared_list)):
+            state_dicts[PROVINCE] = [stacked_model.to_state_dict(i * replicas + k) for k in range(replicas)]
+            seeds[PROVINCE] = group_seeds
+            # 各副本最后一轮的训练损失
+            final_loss[PROVINCE] = [results_list[i * replicas + k]['train_loss'][-1] for k in range(replicas)]
+            data_hashes[PROVINCE] = prepared['data_hash']
+
+    # 各组的参数按省份顺序合并成一个模型，推理时第 i 组参数为省份 i // replicas 的副本 i % replicas
+    structure = {key: hyperparams[provinces[0]][key] for key in STRUCTURE_KEYS}
+    stacked_model = model_builder.StackedSeq2Seq.from_state_dicts(
+        [state_dict for PROVINCE in provinces for state_dict in state_dicts[PROVINCE]],
+        input_size=structure['input_feature_size'],
+        hidden_size=structure['hidden_size'],
+        num_layers=structure['num_layers'],
+        output_size=structure['output_feature_size'],
+        predict_steps=structure['predict_steps']
+    ).eval()
+
+    os.makedirs(MODEL_PATH, exist_ok=True)
+    base_path = os.path.join(MODEL_PATH, registry.ENSEMBLE_MODEL_NAME)
+    torch.save(stacked_model.state_dict(), f"{base_path}.pth")
+    try:
+        export_stacked_onnx(stacked_model, structure, f"{base_path}.onnx")
+    except Exception as e:
+        print(f"❌ 集成 ONNX 模型导出或验证失败: {e}")
+        return None
+
+    meta = {
+        'saved_at': datetime.datetime.now().isoformat(),
+        'provinces': provinces,
+        'replicas': replicas,
+        'seeds': seeds,
+        'hyperparams': structure,
+        'hyperparams_hash': registry.hash_hyperparams(hyperparams),
+        'data_hashes': data_hashes,
+        'final_train_loss': final_loss,
+    }
+    with open(f"{base_path}.json", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    print(f"✅ 集成 ONNX 模型导出成功并已验证: {base_path}.onnx ({len(provinces)} 个省份 × {replicas} 个副本)")
+    return f"{base_path}.onnx"
+
+def export_combined(provinces):
+    """
+    把各省份的 .pth 合并成一个 ONNX 模型，推理服务只需加载一个 session
+    输入 input (K, B, W, F) 与 province_index (K,)，输出 (K, B, P, 1)，第 k 组输入使用 province_index[k] 省份的参数
+    说明文件记录省份顺序、超参数以及每个 .pth 的校验值，推理服务据此判断合并模型是否过期
+    """
+    available = [PROVINCE for PROVINCE in provinces
+                 if os.path.exists(os.path.join(MODEL_PATH, f"{PROVINCE}_seq2seq_gdp_model.pth"))]
+    missing = sorted(set(provinces) - set(available))
+    if missing:
+        print(f"❌ 以下省份没有 .pth，不包含在合并模型中: {missing}")
+    if not available:
+        return None
+
+    # 网络结构必须一致才能堆叠
+    hyperparams_list = [registry.get_hyperparams(MODEL_PATH, PROVINCE) for PROVINCE in available]
+    structure = {key: hyperparams_list[0].get(key, current_hyperparams()[key]) for key in STRUCTURE_KEYS}
+    for PROVINCE, hyperparams in zip(available, hyperparams_list):
+        if any(hyperparams.get(key, current_hyperparams()[key]) != structure[key] for key in STRUCTURE_KEYS):
+            print(f"❌ {PROVINCE} 的网络结构与 {available[0]} 不同，无法导出合并模型")
+            return None
+
+    pth_paths = [os.path.join(MODEL_PATH, f"{PROVINCE}_seq2seq_gdp_model.pth") for PROVINCE in available]
+    model = model_builder.StackedSeq2Seq.from_state_dicts(
+        [torch.load(path, map_location='cpu') for path in pth_paths],
+        input_size=structure['input_feature_size'],
+        hidden_size=structure['hidden_size'],
+        num_layers=structure['num_layers'],
+        output_size=structure['output_feature_size'],
+        predict_steps=structure['predict_steps']
+    ).eval()
+
+    onnx_model_path = os.path.join(MODEL_PATH, f"{registry.COMBINED_MODEL_NAME}.onnx")
+    try:
+        export_stacked_onnx(model, structure, onnx_model_path)
+    except Exception as e:
+        print(f"❌ 合并 ONNX 模型导出或验证失败: {e}")
+        return None
+
+    meta_path = os.path.join(MODEL_PATH, f"{registry.COMBINED_MODEL_NAME}.json")
+    meta = {
+        'saved_at': datetime.datetime.now().isoformat(),
+        'provinces': available,
+        'hyperparams': structure,
+        'sources': {PROVINCE: registry.file_checksum(path) for PROVINCE, path in zip(available, pth_paths)},
+    }
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    print(f"✅ 合并 ONNX 模型导出成功并已验证: {onnx_model_path} ({len(available)} 个省份)")
+    return onnx_model_path
+
+def _init_worker(num_threads):
+    # 固定每个子进程的 torch 线程数，避免多个进程同时抢占全部 CPU 核心
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    # 子进程中不能弹出绘图窗口，使用无界面的后端
+    import matplotlib
+    matplotlib.use('Agg')
+
+def run_province(PROVINCE, train_options=None, hyperparams=None):
+    """训练单个省份并返回摘要，异常不向外抛出，保证一个省份失败不影响其他省份"""
+    start = timer()
+    hyperparams = hyperparams or current_hyperparams(train_options)
+    try:
+        results, data_hash, artifact_paths = train_province(PROVINCE, train_options, hyperparams)
+        return {
             'province': PROVINCE,
-            'saved_at': datetime.datetime.now().isoformat(),
-            'num_epochs': NUM_EPOCHS,
-            'hyperparams': {
-                'input_feature_size': INPUT_FEATURE_SIZE,
-                'hidden_size': HIDDEN_SIZE,
-                'num_layers': NUM_LAYERS,
-                'predict_steps': PREDICT_STEPS,
-                'window_size': WINDOW_SIZE,
-                'batch_size': BATCH_SIZE
-            },
-            'metrics': results
+            'status': 'ok',
+            'final_train_loss': results['train_loss'][-1],
+            'final_test_loss': results['test_loss'][-1],
+            'seconds': timer() - start,
+            'error': '',
+            'data_hash': data_hash,
+            'artifacts': artifact_paths,
+            'hyperparams': hyperparams,
+        }
+    except Exception as e:
+        traceback.print_exc()
+        return {
+            'province': PROVINCE,
+            'status': 'error',
+            'final_train_loss': None,
+            'final_test_loss': None,
+            'seconds': timer() - start,
+            'error': f"{type(e).__name__}: {e}",
         }
-        try:
-            with open(metrics_path, 'w', encoding='utf-8') as mf:
-                json.dump(metrics_payload, mf, ensure_ascii=False, indent=2)
-            print(f"✅ 训练指标已保存: {metrics_path}")
-        except Exception as e:
-            print(f"❌ 保存训练指标失败: {e}")
 
-        # 将训练指标保存到数据库
-        try:
-            # 导入数据库管理器
-            sys.path.append(os.path.join(current_dir, 'backend_api'))
-            from gdp_db_utils import gdp_db_manager
-            
-            # 保存到数据库
-            gdp_db_manager.save_training_metrics(PROVINCE, metrics_payload)
-            print(f"✅ 训练指标已保存到数据库: {PROVINCE}")
-        except Exception as e:
-            print(f"❌ 保存训练指标到数据库失败: {e}")
+def train_parallel(provinces, workers, on_result=None, train_options=None, hyperparams=None):
+    """
+    用进程池并行训练多个省份，在父进程中汇总每个省份的结果和错误
+    :param hyperparams: {省份: 超参数}，没有的省份使用默认值
+    """
+    hyperparams = hyperparams or {}
+    threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    summaries = {}
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(threads_per_worker,)) as executor:
+        futures = {executor.submit(run_province, PROVINCE, train_options, hyperparams.get(PROVINCE)): PROVINCE
+                   for PROVINCE in provinces}
+        for future in as_completed(futures):
+            PROVINCE = futures[future]
+            try:
+                summaries[PROVINCE] = future.result()
+            except Exception as e:
+                # 子进程异常退出等情况
+                summaries[PROVINCE] = {
+                    'province': PROVINCE,
+                    'status': 'error',
+                    'final_train_loss': None,
+                    'final_test_loss': None,
+                    'seconds': None,
+                    'error': f"{type(e).__name__}: {e}",
+                }
+            print(f"{'✅' if summaries[PROVINCE]['status'] == 'ok' else '❌'} {PROVINCE} 训练结束")
+            # 清单只在父进程中写入，避免多个子进程同时写文件
+            if on_result is not None:
+                on_result(summaries[PROVINCE])
+    # 按输入顺序输出，与串行模式一致
+    return [summaries[PROVINCE] for PROVINCE in provinces]
 
-        # 1. 预测：使用 data_x 预测所有训练样本的输出（返回 scaled 后的结果，形状 (N, 4)）
-        train_predictions_scaled = engine.predict(
-            model,
-            data_x,  # 使用训练数据作为输入
-            device
-        )
+def print_summary(summaries):
+    columns = ['province', 'status', 'final_train_loss', 'final_test_loss', 'seconds', 'error']
+    summary_df = pd.DataFrame(summaries, columns=columns).set_index('province')
+    print("\n===== 训练汇总 =====")
+    print(summary_df.to_string())
+    failed = summary_df[summary_df['status'] != 'ok']
+    print(f"成功 {len(summary_df) - len(failed)} 个，失败 {len(failed)} 个")
 
-        # 2. 反归一化预测值 (形状 (N_sequences, 4))
-        train_predictions_unscaled = scaler.inverse_transform(train_predictions_scaled)
+def main():
+    parser = argparse.ArgumentParser(description="训练各省份 GDP Seq2Seq 模型")
+    parser.add_argument('--stacked', action='store_true',
+                        help="把所有省份堆叠成一个模型，一次前向传播同时训练")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="并行训练的进程数，默认 1 表示串行")
+    parser.add_argument('--force', action='store_true',
+                        help="忽略清单，重新训练全部省份")
+    parser.add_argument('--patience', type=int, default=PATIENCE,
+                        help="验证损失连续多少轮未改善时提前停止，0 表示不启用")
+    parser.add_argument('--val-size', type=int, default=VAL_SIZE,
+                        help="启用早停时用作验证集的窗口数 (取时间上最后的窗口)")
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY,
+                        help="每隔多少轮保存一次检查点")
+    parser.add_argument('--resume', action='store_true',
+                        help="从 models/checkpoints 中的检查点继续训练被中断的省份")
+    parser.add_argument('--plots', choices=['none', 'deferred', 'inline'], default=PLOTS,
+                        help="none: 不绘图; deferred: 训练中只保存序列, 训练后用进程池渲染; inline: 训练中直接绘图")
+    parser.add_argument('--plot-workers', type=int, default=data_setup.NUM_WORKERS,
+                        help="deferred 模式下渲染图表的进程数")
+    parser.add_argument('--combined-report', action='store_true',
+                        help="deferred 模式下额外生成汇总本次训练的省份图表的 parm/report.html")
+    parser.add_argument('--backtest', action='store_true',
+                        help="训练结束后对本次训练的省份做滚动回测，结果写入训练指标 JSON 的 backtest 字段")
+    parser.add_argument('--quantize', action='store_true',
+                        help="训练结束后为本次训练的省份生成 int8/fp16 模型变体并写入 models/quantization_report.json")
+    parser.add_argument('--export-combined', action='store_true',
+                        help="训练结束后把全部省份的模型合并导出为 models/all_provinces_seq2seq_gdp_model.onnx")
+    parser.add_argument('--ensemble', type=int, default=0, metavar='K',
+                        help="训练结束后为每个省份堆叠训练 K 个种子副本 (models/all_provinces_ensemble_gdp_model.*)，"
+                             "推理服务用于给出预测区间；0 表示不训练")
+    args = parser.parse_args()
 
-        # 3. 反归一化 data_y_true
-        data_y_gdp_only = data_y[:, 0, 0].reshape(-1, 1)
+    if args.stacked and args.workers > 1:
+        parser.error("--stacked 与 --workers 不能同时使用")
+    if args.stacked and (args.patience > 0 or args.resume):
+        parser.error("--stacked 模式暂不支持早停和断点续训")
+    if args.patience > 0 and args.val_size < 1:
+        parser.error("启用早停时 --val-size 至少为 1")
+    if args.ensemble == 1 or args.ensemble < 0:
+        parser.error("--ensemble 至少为 2 个副本")
+    if args.ensemble and args.patience > 0:
+        parser.error("--ensemble 暂不支持早停")
 
-        # 创建一个临时数组，将 GDP 填入正确的位置 (GDP_COL_INDEX=2) 形状: (N_sequences, INPUT_FEATURE_SIZE)
-        temp_y_true_scaled = np.zeros((data_y_gdp_only.shape[0], INPUT_FEATURE_SIZE))
-        temp_y_true_scaled[:, GDP_COL_INDEX] = data_y_gdp_only.flatten()
+    train_options = {
+        'patience': args.patience,
+        'val_size': args.val_size,
+        'checkpoint_every': args.checkpoint_every,
+        'resume': args.resume,
+        'plots': args.plots,
+    }
 
-        # 反归一化真实目标值 (形状 (N_sequences, 4))
-        data_y_true_unscaled = scaler.inverse_transform(temp_y_true_scaled)
+    manifest = registry.load_manifest(MODEL_PATH)
+    if args.force:
+        provinces = PROVINCES
+    else:
+        provinces = find_stale_provinces(PROVINCES, manifest, train_options)
+    # 每个省份使用自己的超参数 (晋升过的省份保留晋升的配置)
+    hyperparams = {PROVINCE: province_hyperparams(manifest, PROVINCE, train_options) for PROVINCE in provinces}
+    def run_ensemble():
+        if not args.ensemble:
+            return
+        # 与主模型一样使用各省份晋升的超参数
+        ensemble_params = ensemble_hyperparams(PROVINCES, manifest, train_options)
+        if args.force or ensemble_is_stale(ensemble_params, args.ensemble):
+            train_ensemble(ensemble_params, args.ensemble)
+        else:
+            print("⏭️ 种子集成模型已是最新，跳过")
 
-        # 4. 调用绘图函数进行训练序列对比
-        utils.plot_training_comparison(
-            origin_data=origin_data,
-            data_x=data_x,
-            data_y_pred=train_predictions_unscaled,  
-            data_y_true=data_y_true_unscaled, 
-            province=PROVINCE,
-            window_size=WINDOW_SIZE,
-            gdp_col_name='GDP'
-        )
+    if not provinces:
+        print("✅ 所有省份的模型都是最新的，无需重新训练")
+        run_ensemble()
+        if args.export_combined:
+            export_combined(PROVINCES)
+        return
 
-        final = engine.predict(model,
-                               val_Y2025,
-                               device)
-        # 把最终的预测数据进行反归一化处理
-        final_data = scaler.inverse_transform(final)
-        final_gdp_values = final_data[:, GDP_COL_INDEX]
+    # deferred 模式下本次训练保存的绘图序列，训练结束后只渲染这些
+    series_paths = []
+    def on_result(summary):
+        if summary['status'] == 'ok':
+            series_path = record_outputs(manifest, summary['province'], summary['data_hash'], summary['artifacts'],
+                                         summary['hyperparams'])
+            if series_path:
+                series_paths.append(series_path)
 
-        # 计算未来预测的年份
-        start_year = origin_data.index[-1] + 1
-        years = range(start_year, start_year + len(final_gdp_values))
+    if args.stacked:
+        # 超参数相同的省份才能堆叠，按超参数分组，每组堆叠训练一次
+        groups = {}
+        for PROVINCE in provinces:
+            groups.setdefault(registry.hash_hyperparams(hyperparams[PROVINCE]), []).append(PROVINCE)
+        for members in groups.values():
+            series_paths += train_stacked(members, manifest, train_options, hyperparams[members[0]])
+        trained = provinces
+    else:
+        if args.workers > 1:
+            summaries = train_parallel(provinces, args.workers, on_result, train_options, hyperparams)
+        else:
+            summaries = []
+            for PROVINCE in provinces:
+                summaries.append(run_province(PROVINCE, train_options, hyperparams[PROVINCE]))
+                on_result(summaries[-1])
+        print_summary(summaries)
+        trained = [summary['province'] for summary in summaries if summary['status'] == 'ok']
 
-        # 将原始数据和预测数据传递给未来预测绘图函数
-        utils.plot_gdp_comparison(
-            origin_data=origin_data,
-            province=PROVINCE,
-            pred_years=list(years),
-            pred_gdp_values=final_gdp_values,
-            gdp_col_name='GDP'  
-        )
+    if args.backtest and trained:
+        # backtest 依赖 train 模块，在这里导入避免循环导入
+        import backtest
+        backtest.backtest_provinces(trained, manifest)
 
-        output_df = pd.DataFrame(
-            final_gdp_values,
-            index=years,
-            columns=[f'{PROVINCE}GDP 预测值 (亿)']
-        )
-        print(output_df)
+    if args.quantize and trained:
+        import quantize
+        quantize.quantize_provinces(trained)
 
-        MODEL_PATH = "models"
-        os.makedirs(MODEL_PATH, exist_ok=True)
+    run_ensemble()
 
-        # 1. 保存 PyTorch 模型参数 (.pth)
-        model_save_path = os.path.join(MODEL_PATH, f"{PROVINCE}_seq2seq_gdp_model.pth")
-        torch.save(model.state_dict(), model_save_path)
-        print(f"✅ 模型参数已保存至: {model_save_path}")
+    if args.export_combined:
+        export_combined(PROVINCES)
 
-        # 2. ONNX 导出
-        dummy_input = torch.randn(BATCH_SIZE, WINDOW_SIZE, INPUT_FEATURE_SIZE).to(device)
-        onnx_model_path = os.path.join(MODEL_PATH, f"{PROVINCE}_seq2seq_gdp_model.onnx")
+    if args.plots == 'deferred' and series_paths:
+        reporting.render_deferred(PLOT_DIR, series_paths, workers=args.plot_workers, combined=args.combined_report)
 
-        try:
-            torch.onnx.export(
-                model,
-                dummy_input,
-                onnx_model_path,
-                export_params=True,
-                opset_version=17,
-                do_constant_folding=True,
-                input_names=['input'],
-                output_names=['output'],
-                dynamic_axes={'input': {0: 'batch_size'},
-                              'output': {0: 'batch_size'}}
-            )
-            onnx_model = onnx.load(onnx_model_path)
-            onnx.checker.check_model(onnx_model)
-            print(f"✅ ONNX 模型导出成功并已验证: {onnx_model_path}")
-        except Exception as e:
-            print(f"❌ ONNX 模型导出或验证失败: {e}")
 if __name__ == "__main__":
     main()
\ No newline at end of file
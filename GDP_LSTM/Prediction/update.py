@@ -0,0 +1,285 @@
+import os
+import sys
+import csv
+import json
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+import torch
+from torch import nn
+
+import data_setup
+import engine
+import ingest
+import model_builder
+import registry
+import train
+import utils
+
+# 增量更新时从已有 .pth 继续训练的轮数
+FINETUNE_EPOCHS = 20
+
+
+def read_year_values(path: str) -> dict:
+    """
+    读取新一年的数据，每行一个省份: 地区,polulation,consumption,GDP,financial
+    :return: {省份: 各特征的单元格文本}
+    """
+    name = os.path.basename(path)
+    values = {}
+    with ingest.open_text(path) as f:
+        reader = csv.reader(f)
+        header = [cell.strip() for cell in next(reader, [])]
+        expected = [ingest.REGION_HEADER] + data_setup.FEATURE_COLUMNS
+        if header != expected:
+            raise ingest.IngestError(f"{name}: 表头应为 {','.join(expected)}")
+        for line_no, row in enumerate(reader, start=2):
+            row = [cell.strip() for cell in row]
+            if not any(row) or row[0] in ingest.IGNORED_REGIONS:
+                continue
+            region = row[0]
+            if region not in train.PROVINCES:
+                raise ingest.IngestError(f"{name}:{line_no}: 未知地区 '{region}'")
+            if region in values:
+                raise ingest.IngestError(f"{name}:{line_no}: 地区 '{region}' 重复出现")
+            if len(row) != len(expected):
+                raise ingest.IngestError(f"{name}:{line_no}: {region} 有 {len(row) - 1} 个数值，应为 {len(expected) - 1} 个")
+            for feature, cell in zip(data_setup.FEATURE_COLUMNS, row[1:]):
+                if not ingest.NUMBER_PATTERN.match(cell):
+                    raise ingest.IngestError(f"{name}:{line_no}: {region} {feature} 缺失或不是数值: '{cell}'")
+            values[region] = row[1:]
+    missing = [province for province in train.PROVINCES if province not in values]
+    if missing:
+        raise ingest.IngestError(f"{name}: 缺少省份 {missing}")
+    return values
+
+
+def append_year(values: dict, year: int, data_path: str) -> list:
+    """
+    把一年的数据写入四个 Year*.csv：新的年份插到第一行，已有的年份则覆盖 (统计局修订)
+    :return: 写入后的年份列表
+    """
+    outputs = []
+    for feature_index, file_name in enumerate(data_setup.FEATURE_FILES):
+        path = data_setup.resolve_data_file(data_path, file_name)
+        provinces, table = ingest.read_year_file(path)
+        if not data_setup.FIRST_YEAR <= year <= max(table) + 1:
+            raise ingest.IngestError(f"{os.path.basename(path)} 的数据为 {data_setup.FIRST_YEAR}-{max(table)} 年，"
+                                     f"只能修订已有年份或追加 {max(table) + 1} 年，不能写入 {year} 年")
+        table[year] = {province: values[province][feature_index] for province in provinces}
+        outputs.append((path, provinces, sorted(table), table))
+
+    # 四个文件都校验通过后才写出
+    for path, provinces, years, table in outputs:
+        ingest.write_year_file(path, provinces, years, table)
+    return outputs[0][2]
+
+
+def _scaled_windows(values, scaler, hyperparams):
+    X, Y, _, _ = utils.create_training_sequences(
+        data_setup.scale_transform(values, scaler),
+        hyperparams['window_size'],
+        hyperparams['predict_steps'],
+        train.GDP_COL_INDEX
+    )
+    return X, Y
+
+
+def detect_changes(old_values, old_scalers, panel, manifest, provinces):
+    """
+    对比更新前后的面板，找出需要更新的省份
+    :param old_values: 更新前的 (年份, 省份, 特征) 数据
+    :param old_scalers: 更新前各省份的归一化参数
+    :return: {省份: {'data_hash', 'hyperparams', 'scaler_changed', 'changed_windows', 'total_windows'}}，
+             数据和产物都未变化的省份不在结果中
+    """
+    changes = {}
+    for PROVINCE in provinces:
+        index = panel['provinces'].index(PROVINCE)
+        hyperparams = registry.recorded_hyperparams(manifest, PROVINCE, train.current_hyperparams())
+        new_series = panel['values'][:, index]
+        data_hash = registry.hash_series(new_series)
+        is_stale, reason = registry.check_stale(manifest, PROVINCE, data_hash, hyperparams, train.MODEL_PATH)
+        if not is_stale:
+            print(f"⏭️ {PROVINCE} 数据未变化，跳过")
+            continue
+
+        old_scaler = {key: old_scalers[key][index] for key in ('min', 'scale')}
+        new_scaler = data_setup.province_scaler(panel, PROVINCE)
+        # 新值超出历史最小/最大值时归一化参数改变，所有历史窗口的归一化结果都随之改变
+        scaler_changed = not all(np.array_equal(old_scaler[key], new_scaler[key]) for key in ('min', 'scale'))
+
+        old_x, old_y = _scaled_windows(old_values[:, index], old_scaler, hyperparams)
+        new_x, new_y = _scaled_windows(new_series, new_scaler, hyperparams)
+        common = min(len(old_x), len(new_x))
+        changed = (np.any(new_x[:common] != old_x[:common], axis=(1, 2))
+                   | np.any(new_y[:common] != old_y[:common], axis=(1, 2)))
+        changes[PROVINCE] = {
+            'data_hash': data_hash,
+            'hyperparams': hyperparams,
+            'reason': reason,
+            'scaler_changed': scaler_changed,
+            'changed_windows': int(changed.sum()) + len(new_x) - common,
+            'total_windows': len(new_x),
+        }
+        print(f"🔄 {PROVINCE}: {reason}，归一化参数{'已' if scaler_changed else '未'}变化，"
+              f"{changes[PROVINCE]['changed_windows']}/{len(new_x)} 个训练窗口变化")
+    return changes
+
+
+def finetune_provinces(provinces, changes, manifest, year, epochs=FINETUNE_EPOCHS):
+    """从已有 .pth 继续训练一组超参数相同的省份 (堆叠成一个模型同时训练)，并重新导出全部产物"""
+    hyperparams = changes[provinces[0]]['hyperparams']
+    prepared_list = [train.prepare_province(PROVINCE, hyperparams) for PROVINCE in provinces]
+    data_x, data_y, _, _ = utils.create_training_sequences(
+        np.stack([prepared['data'] for prepared in prepared_list]),
+        hyperparams['window_size'],
+        hyperparams['predict_steps'],
+        train.GDP_COL_INDEX
+    )
+
+    state_dicts = [
+        torch.load(os.path.join(train.MODEL_PATH, f"{PROVINCE}_seq2seq_gdp_model.pth"), map_location='cpu')
+        for PROVINCE in provinces
+    ]
+    torch.manual_seed(hyperparams['seed'])
+    stacked_model = model_builder.StackedSeq2Seq.from_state_dicts(
+        state_dicts,
+        input_size=hyperparams['input_feature_size'],
+        hidden_size=hyperparams['hidden_size'],
+        num_layers=hyperparams['num_layers'],
+        output_size=hyperparams['output_feature_size'],
+        predict_steps=hyperparams['predict_steps']
+    ).to(train.device)
+    optimizer = torch.optim.Adam(stacked_model.parameters(), lr=hyperparams['learning_rate'])
+    results_list = engine.train_stacked(
+        stacked_model,
+        data_x,
+        data_y,
+        nn.MSELoss(reduction='none'),
+        optimizer,
+        epochs,
+        train.device,
+        batch_size=hyperparams['batch_size'],
+        verbose=False)
+
+    for index, (PROVINCE, prepared) in enumerate(zip(provinces, prepared_list)):
+        model = train.build_model(hyperparams)
+        model.load_state_dict(stacked_model.to_state_dict(index))
+        artifact_paths = train.save_province_outputs(PROVINCE, model, results_list[index], prepared,
+                                                     'none', hyperparams)
+        # 在训练指标中记录这次增量更新，写入清单前完成，校验值与最终文件一致
+        with open(artifact_paths['metrics'], 'r', encoding='utf-8') as f:
+            metrics_payload = json.load(f)
+        metrics_payload['update'] = {
+            'year': year,
+            'finetune_epochs': epochs,
+            'scaler_changed': changes[PROVINCE]['scaler_changed'],
+            'changed_windows': changes[PROVINCE]['changed_windows'],
+            'total_windows': changes[PROVINCE]['total_windows'],
+        }
+        with open(artifact_paths['metrics'], 'w', encoding='utf-8') as f:
+            json.dump(metrics_payload, f, ensure_ascii=False, indent=2)
+        train.record_outputs(manifest, PROVINCE, prepared['data_hash'], artifact_paths, hyperparams)
+
+
+def update_models(changes, manifest, year, epochs=FINETUNE_EPOCHS):
+    """有 .pth 的省份按超参数分组微调，清单中没有记录或缺少 .pth 的省份从头训练"""
+    groups, retrain = {}, []
+    for PROVINCE, change in changes.items():
+        pth_path = os.path.join(train.MODEL_PATH, f"{PROVINCE}_seq2seq_gdp_model.pth")
+        if PROVINCE not in manifest['provinces'] or not os.path.exists(pth_path):
+            retrain.append(PROVINCE)
+            continue
+        key = registry.hash_hyperparams(change['hyperparams'])
+        groups.setdefault(key, []).append(PROVINCE)
+
+    for members in groups.values():
+        start = timer()
+        finetune_provinces(members, changes, manifest, year, epochs)
+        print(f"✅ {len(members)} 个省份微调完成，耗时 {timer() - start:.1f} 秒")
+
+    train_options = train.default_train_options()
+    train_options['plots'] = 'none'
+    for PROVINCE in retrain:
+        print(f"🔄 {PROVINCE} 没有可用的已有模型，从头训练")
+        summary = train.run_province(PROVINCE, train_options, changes[PROVINCE]['hyperparams'])
+        if summary['status'] == 'ok':
+            train.record_outputs(manifest, PROVINCE, summary['data_hash'], summary['artifacts'],
+                                 summary['hyperparams'])
+
+
+def refresh_analysis(panel, year):
+    """只重新计算该年份的空间分析和耦合协调度结果，其他年份的结果保持不变"""
+    year_index = panel['years'].index(year)
+    column = f"{year}年"
+    gdp_df = pd.DataFrame({
+        '地区': panel['provinces'],
+        column: panel['values'][year_index, :, train.GDP_COL_INDEX],
+    })
+    population_df = pd.DataFrame({
+        '地区': panel['provinces'],
+        column: panel['values'][year_index, :, data_setup.FEATURE_COLUMNS.index('polulation')],
+    })
+
+    backend_dir = os.path.join(train.current_dir, 'backend_api')
+    if backend_dir not in sys.path:
+        sys.path.append(backend_dir)
+    # config.py 中的输出目录和矢量文件都是相对于 backend_api 的路径
+    cwd = os.getcwd()
+    os.chdir(backend_dir)
+    try:
+        import spatial_analysis
+        from coupling_analysis import analyzer
+        if spatial_analysis.perform_real_spatial_analysis(years=[column], df_db=gdp_df):
+            print(f"✅ {column} 空间分析结果已更新")
+        else:
+            print(f"❌ {column} 空间分析失败")
+        if analyzer.refresh_trend_years([str(year)], population_df, gdp_df):
+            print(f"✅ {column} 耦合协调度结果已更新")
+        else:
+            print(f"❌ {column} 耦合协调度计算失败")
+    except Exception as e:
+        print(f"❌ 刷新空间分析和耦合协调度失败: {e}")
+    finally:
+        os.chdir(cwd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量更新：写入新一年的数据，只更新受影响的模型和分析结果")
+    parser.add_argument('values', help="新一年的数据 CSV，表头为 地区," + ','.join(data_setup.FEATURE_COLUMNS))
+    parser.add_argument('--year', type=int, default=None, help="数据所属年份，默认为已有数据的下一年")
+    parser.add_argument('--epochs', type=int, default=FINETUNE_EPOCHS, help="从已有模型继续训练的轮数")
+    parser.add_argument('--skip-analysis', action='store_true', help="不刷新空间分析和耦合协调度结果")
+    args = parser.parse_args()
+
+    old_panel = data_setup.load_panel(train.data_dir)
+    # 写入后快照会被替换，先把更新前的数据复制到内存中
+    old_values = np.array(old_panel['values'])
+    old_scalers = {key: value.copy() for key, value in old_panel['scalers'].items()}
+    year = args.year or old_panel['years'][-1] + 1
+
+    try:
+        values = read_year_values(args.values)
+        years = append_year(values, year, train.data_dir)
+    except ingest.IngestError as e:
+        print(f"❌ 更新失败: {e}")
+        raise SystemExit(1)
+    panel = data_setup.load_panel(train.data_dir)
+    print(f"✅ 已写入 {year} 年数据，当前数据为 {years[0]}-{years[-1]} 年")
+
+    manifest = registry.load_manifest(train.MODEL_PATH)
+    changes = detect_changes(old_values, old_scalers, panel, manifest, train.PROVINCES)
+    if changes:
+        update_models(changes, manifest, year, args.epochs)
+    else:
+        print("✅ 所有省份的模型都是最新的，无需更新")
+
+    if not args.skip_analysis:
+        refresh_analysis(panel, year)
+
+
+if __name__ == "__main__":
+    main()
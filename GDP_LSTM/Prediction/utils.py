@@ -1,40 +1,50 @@
 import numpy as np
 from matplotlib import pyplot as plt
 import pandas as pd
+import os
 
 # 划分训练集的窗口
 def create_training_sequences(data, input_window, output_steps, target_index):
-    X, Y = [], []
-    N_total = len(data)
-    
+    """
+    用滑动窗口视图划分训练样本，不拷贝数据
+    :param data: (年份, 特征) 的单省数据，或 (省份, 年份, 特征) 的面板数据
+    :return: X_train (..., N, input_window, 特征), Y_train (..., N, output_steps, 1),
+             X_val_Y2025 (..., input_window, 特征), X_val_Y2026 (..., input_window, 特征)
+             返回值都是 data 的只读视图，需要修改时先 .copy()
+    """
+    data = np.asarray(data)
+    N_total = data.shape[-2]
+
     N_sequences = N_total - input_window - output_steps + 1
+    if N_sequences < 0:
+        raise ValueError(f"数据只有 {N_total} 年，不足以构建窗口 {input_window} + 预测 {output_steps} 年的样本")
 
-    for i in range(N_sequences):
+    # windows[..., i, :, :] == data[..., i : i + input_window, :]，共 N_total - input_window + 1 个窗口
+    windows = np.lib.stride_tricks.sliding_window_view(data, input_window, axis=-2).swapaxes(-1, -2)
+    # targets[..., j, :] == data[..., j : j + output_steps, target_index]
+    targets = np.lib.stride_tricks.sliding_window_view(data[..., target_index], output_steps, axis=-1)
 
-        x_sequence = data[i : i + input_window, :]
-        X.append(x_sequence)
+    X_train_np = windows[..., :N_sequences, :, :]
+    # 确保 Y 数组形状为 (N, P, 1)
+    Y_train_np = targets[..., input_window:input_window + N_sequences, :, np.newaxis]
 
-        y_sequence = data[i + input_window : i + input_window + output_steps, target_index]
-        Y.append(y_sequence)
+    # 验证集，第一个没有完整标签的窗口 (18到23，预测24和25年)
+    X_val_Y2025 = windows[..., N_sequences, :, :]
+    # 最后一个窗口，即最近 input_window 年 (19到24，预测25和26年)，用于预测未来
+    X_val_Y2026 = windows[..., -1, :, :]
 
-    X_train_np = np.array(X)
-    Y_train_np = np.array(Y)
+    return X_train_np, Y_train_np, X_val_Y2025, X_val_Y2026
 
-    # 验证集，18到23，预测24和25年
-    val_index_Y2025 = N_sequences
-    # 验证集，19到24，预测25和26年
-    val_index_Y2026 = N_sequences + 1
-    X_val_Y2025 = data[val_index_Y2025: val_index_Y2025 + input_window, :]
-    X_val_Y2025 = data[val_index_Y2026: val_index_Y2026 + input_window, :]
-    # 确保 Y 数组形状为 (N, P, 1)
-    if Y_train_np.size > 0:
-        Y_train_np = Y_train_np.reshape(-1, output_steps, 1)
-    else:
-        Y_train_np = Y_train_np.reshape(0, output_steps, 1)
-
-    return X_train_np, Y_train_np, X_val_Y2025, X_val_Y2025
+def _finish_figure(fig, save_path=None, show=True):
+    # 保存到文件和/或弹出窗口，最后关闭图像释放内存
+    plt.tight_layout()
+    if save_path:
+        fig.savefig(save_path)
+    if show:
+        plt.show()
+    plt.close(fig)
 
-def create_plot_sequences(data,province:str):
+def create_plot_sequences(data,province:str, save_path=None, show=True):
     plt.rcParams['font.sans-serif'] = ['SimHei']  # 指定默认字体（以 SimHei 黑体为例）
     plt.rcParams['axes.unicode_minus'] = False
     N = len(data)
@@ -72,12 +82,11 @@ def create_plot_sequences(data,province:str):
 
     ax.grid(True, linestyle='--', alpha=0.7)
 
-    plt.tight_layout()
-    plt.show()
+    _finish_figure(fig, save_path, show)
 
 
 def plot_training_comparison(origin_data: pd.DataFrame, data_x, data_y_pred: np.ndarray, data_y_true: np.ndarray,
-                             province: str, window_size: int, gdp_col_name: str):
+                             province: str, window_size: int, gdp_col_name: str, save_path=None, show=True):
     plt.rcParams['font.sans-serif'] = ['SimHei']
     plt.rcParams['axes.unicode_minus'] = False
 
@@ -122,11 +131,11 @@ def plot_training_comparison(origin_data: pd.DataFrame, data_x, data_y_pred: np.
     ax.legend(loc='upper left')
     ax.grid(True, linestyle='--', alpha=0.6)
 
-    plt.tight_layout()
-    plt.show()
+    _finish_figure(fig, save_path, show)
 
 # 新增：用于绘制未来年份预测结果的函数
-def plot_gdp_comparison(origin_data: pd.DataFrame, province: str, pred_years: list[int], pred_gdp_values: np.ndarray, gdp_col_name: str):
+def plot_gdp_comparison(origin_data: pd.DataFrame, province: str, pred_years: list[int], pred_gdp_values: np.ndarray, gdp_col_name: str,
+                        save_path=None, show=True):
     plt.rcParams['font.sans-serif'] = ['SimHei']
     plt.rcParams['axes.unicode_minus'] = False
 
@@ -171,7 +180,28 @@ def plot_gdp_comparison(origin_data: pd.DataFrame, province: str, pred_years: li
     ax.legend(loc='upper left')
     ax.grid(True, linestyle='--', alpha=0.6)
 
-    plt.tight_layout()
-    plt.show()
-
-
+    _finish_figure(fig, save_path, show)
+
+# 绘制训练过程中 MAE/MSE/MAPE 的变化趋势，每个指标保存为一张图
+def plot_training_metrics(results: dict, out_dir: str, show=False):
+    epochs = range(1, len(results['train_loss']) + 1)
+    charts = [
+        ('mae', 'MAE Trend', 'MAE'),
+        ('mse', 'MSE Trend', 'MSE'),
+        ('mape', 'MAPE Trend (%)', 'MAPE (%)'),
+    ]
+    paths = []
+    for key, title, ylabel in charts:
+        fig, ax = plt.subplots(figsize=(10, 6))
+        ax.plot(epochs, results[f'train_{key}'], 'b-', label=f'Training {key.upper()}')
+        ax.plot(epochs, results[f'test_{key}'], 'r-', label=f'Testing {key.upper()}')
+        if f'val_{key}' in results:
+            ax.plot(epochs, results[f'val_{key}'], 'g-', label=f'Validation {key.upper()}')
+        ax.set_title(title)
+        ax.set_xlabel('Epochs')
+        ax.set_ylabel(ylabel)
+        ax.legend()
+        path = os.path.join(out_dir, f'{key}_plot.png')
+        _finish_figure(fig, path, show)
+        paths.append(path)
+    return paths
@@ -51,6 +51,21 @@ export const getGDPPrediction = (province) => {
   return request.get(`/gdp/predict/${encodeURIComponent(province)}`)
 }
 
+// 一次获取全部省份的预测结果 (全国预测地图)
+export const getGDPPredictionAll = () => {
+  return request.get('/gdp/predict_all')
+}
+
+// 情景分析: scenarios 为 [{name, changes: {population|consumption|financial: 相对变化或[下限, 上限]}}]
+export const getGDPScenarios = (payload) => {
+  return request.post('/gdp/scenarios', payload)
+}
+
+// 预测均值与预测区间, params: { provinces, level, bootstrap, seed }
+export const getGDPPredictionInterval = (params) => {
+  return request.get('/gdp/predict_interval', { params })
+}
+
 export const getGDPMetrics = (province) => {
   return request.get(`/gdp/metrics/${encodeURIComponent(province)}`)
 }
@@ -58,4 +73,9 @@ export const getGDPMetrics = (province) => {
 // GDP 自定义数据预测API (通过 POST 请求发送 FormData 文件数据)
 export const getGDPPredictionCustom = (formData) => {
   return request.post('/gdp/predict_custom', formData) 
+}
+
+// 用同一组上传文件一次预测其中的全部省份
+export const getGDPPredictionCustomAll = (formData) => {
+  return request.post('/gdp/predict_custom_all', formData)
 }
\ No newline at end of file